@@ -2,19 +2,18 @@ from selcom_apigw_client import apigwClient
 import json
 import frappe
 from frappe import _
+from csf_tz.utils.integration_log import log_integration_request
 
 
 def create_order_log(method, status, request_json, response, reference):
-    doc = frappe.new_doc("Selcom Order Log")
-    doc.date = frappe.utils.today()
-    doc.time = frappe.utils.nowtime()
-    doc.method = method
-    doc.status = status
-    doc.reference = reference
-    doc.request_data = json.dumps(request_json, indent=4)
-    doc.response_data = json.dumps(response, indent=4)
-    doc.insert(ignore_permissions=True)
-    frappe.db.commit()
+    log_integration_request(
+        "Selcom",
+        method,
+        request_data=json.dumps(request_json, indent=4),
+        response_data=json.dumps(response, indent=4),
+        reference=reference,
+        success=status == "Success",
+    )
 
 
 @frappe.whitelist()
@@ -0,0 +1,339 @@
+from bisect import bisect_left
+
+import frappe
+from frappe.utils import cint
+
+INDEX_CACHE_KEY = "tz_location_index"
+VERSION_CACHE_KEY = "tz_location_index_version"
+LOCATION_DOCTYPES = ("TZ Region", "TZ District", "TZ Ward", "TZ Village")
+LEVELS = {"TZ Village": 0, "TZ Ward": 1, "TZ District": 2, "TZ Region": 3}
+MAX_LIMIT = 50
+LABEL_FIELDS = {
+    "TZ Region": "region",
+    "TZ District": "district",
+    "TZ Ward": "ward",
+    "TZ Village": "village",
+}
+# parent location columns of the index that link filters can use
+PARENT_FIELDS = ("region", "district", "ward")
+
+# index held by this worker per site: {site: (version, index)}
+_worker_index = {}
+
+
+@frappe.whitelist()
+def search_location(txt, doctype=None, limit=20):
+    """
+    Search TZ locations by village, ward, district, region or postcode prefix
+
+    Only locations of the doctypes the user can select are returned.
+
+    Args:
+        txt (str): Text typed by the user
+        doctype (str): Only return matches of this location doctype
+        limit (int): Maximum number of matches
+
+    Returns:
+        list: Matches with the full Region -> Village path
+    """
+    if doctype and doctype not in LOCATION_DOCTYPES:
+        frappe.throw(frappe._("Invalid location type {0}").format(doctype))
+
+    levels = {
+        LEVELS[location_doctype]
+        for location_doctype in ([doctype] if doctype else LOCATION_DOCTYPES)
+        if frappe.has_permission(location_doctype, "select")
+    }
+    if not levels:
+        frappe.throw(frappe._("Not permitted"), frappe.PermissionError)
+    if not normalize(txt):
+        return []
+
+    index = get_location_index()
+    limit = min(cint(limit) or 20, MAX_LIMIT)
+    return [
+        dict(zip(index["columns"], index["entries"][entry]))
+        for entry in find_entries(index, txt, levels, limit)
+    ]
+
+
+@frappe.whitelist()
+@frappe.validate_and_sanitize_search_inputs
+def location_link_query(doctype, txt, searchfield, start, page_len, filters):
+    """
+    Link field query for the TZ location doctypes, served from the location index
+
+    Filters on the parent location (e.g. Wards of a District) are applied to the
+    index, other filters are answered from the table.
+    """
+    if doctype not in LOCATION_DOCTYPES:
+        frappe.throw(frappe._("Invalid location type {0}").format(doctype))
+    frappe.has_permission(doctype, "select", throw=True)
+
+    parents = get_parent_filters(filters)
+    if parents is None:
+        return get_filtered_locations(
+            doctype, txt, cint(start), cint(page_len), filters
+        )
+
+    index = get_location_index()
+    entries = find_entries(
+        index, txt, {LEVELS[doctype]}, cint(start) + cint(page_len), parents
+    )
+    results = []
+    for entry in entries[cint(start) :]:
+        row = dict(zip(index["columns"], index["entries"][entry]))
+        results.append((row["name"], row["label"], row["path"]))
+    return results
+
+
+def get_parent_filters(filters):
+    """
+    {column: value} of `filters` when they are all equality filters on the parent
+    locations held by the index, None when they are not
+    """
+    if isinstance(filters, str):
+        filters = frappe.parse_json(filters)
+    if not filters:
+        return {}
+
+    if isinstance(filters, dict):
+        conditions = [
+            [field, *value] if isinstance(value, (list, tuple)) else [field, "=", value]
+            for field, value in filters.items()
+        ]
+    else:
+        conditions = [condition[-3:] for condition in filters]
+
+    parents = {}
+    for condition in conditions:
+        if len(condition) != 3:
+            return None
+        field, operator, value = condition
+        if field not in PARENT_FIELDS or operator != "=":
+            return None
+        parents[field] = value
+    return parents
+
+
+def get_filtered_locations(doctype, txt, start, page_len, filters):
+    """Locations of `doctype` matching `filters` whose name or label contains `txt`, by label"""
+    label_field = LABEL_FIELDS[doctype]
+    or_filters = None
+    if normalize(txt):
+        or_filters = {
+            field: ["like", f"%{txt.strip()}%"] for field in ("name", label_field)
+        }
+    return frappe.get_list(
+        doctype,
+        filters=filters or None,
+        or_filters=or_filters,
+        fields=["name", label_field],
+        order_by=label_field,
+        limit_start=start,
+        limit_page_length=page_len,
+        as_list=True,
+    )
+
+
+def find_entries(index, txt, levels=None, limit=20, parents=None):
+    """
+    Return entry ids whose name, words or postcode start with `txt`, best first
+
+    Without `txt` all entries are returned by label. `levels` limits the entries to
+    those location levels, `parents` to those with the given {column: value}.
+    """
+    txt = normalize(txt)
+    entries = index["entries"]
+    parent_columns = [
+        (index["columns"].index(column), value)
+        for column, value in (parents or {}).items()
+    ]
+
+    def is_included(entry):
+        values = entries[entry]
+        return (levels is None or values[0] in levels) and all(
+            values[column] == value for column, value in parent_columns
+        )
+
+    if not txt:
+        return sorted(
+            (entry for entry in range(len(entries)) if is_included(entry)),
+            key=lambda entry: entries[entry][3] or "",
+        )[:limit]
+
+    keys = index["keys"]
+    matches = {}
+    position = bisect_left(keys, (txt,))
+    while position < len(keys) and keys[position][0].startswith(txt):
+        key, entry, rank = keys[position]
+        position += 1
+        if not is_included(entry):
+            continue
+        if key == txt:
+            rank = 0
+        if rank < matches.get(entry, 99):
+            matches[entry] = rank
+
+    # exact matches first, then whole name prefixes, then word or postcode prefixes;
+    # villages before wards, districts and regions; shorter names first
+    return sorted(
+        matches,
+        key=lambda entry: (matches[entry], entries[entry][0], len(entries[entry][3])),
+    )[:limit]
+
+
+def normalize(text):
+    return " ".join((text or "").lower().split())
+
+
+def get_location_index():
+    """Return the location index, built once per worker and shared through Redis"""
+    cache = frappe.cache()
+    version = cache.get_value(VERSION_CACHE_KEY)
+    site = frappe.local.site
+    if version and _worker_index.get(site, (None,))[0] == version:
+        return _worker_index[site][1]
+
+    index = cache.get_value(INDEX_CACHE_KEY) if version else None
+    if not index or index["version"] != version:
+        index = build_location_index()
+        version = index["version"]
+        cache.set_value(INDEX_CACHE_KEY, index)
+        cache.set_value(VERSION_CACHE_KEY, version)
+
+    _worker_index[site] = (version, index)
+    return index
+
+
+def build_location_index():
+    """
+    Build the prefix index from the gazetteer tables.
+
+    Entries are tuples in the order of `columns`. Keys are sorted (text, entry id,
+    rank) tuples for every name, word and postcode, so that a prefix lookup is one
+    bisect followed by a short scan.
+    """
+    district = frappe.qb.DocType("TZ District")
+    ward = frappe.qb.DocType("TZ Ward")
+    village = frappe.qb.DocType("TZ Village")
+
+    regions = frappe.get_all("TZ Region", pluck="name")
+    districts = frappe.get_all("TZ District", fields=["name", "district", "region"])
+    wards = (
+        frappe.qb.from_(ward)
+        .left_join(district)
+        .on(district.name == ward.district)
+        .select(
+            ward.name,
+            ward.ward,
+            ward.district,
+            district.district.as_("district_name"),
+            district.region,
+        )
+    ).run(as_dict=True)
+    villages = (
+        frappe.qb.from_(village)
+        .left_join(ward)
+        .on(ward.name == village.ward)
+        .left_join(district)
+        .on(district.name == ward.district)
+        .select(
+            village.name,
+            village.village,
+            village.postcode,
+            village.ward,
+            ward.ward.as_("ward_name"),
+            ward.district,
+            district.district.as_("district_name"),
+            district.region,
+        )
+    ).run(as_dict=True)
+
+    columns = (
+        "level",
+        "doctype",
+        "name",
+        "label",
+        "path",
+        "postcode",
+        "region",
+        "district",
+        "district_name",
+        "ward",
+        "ward_name",
+        "village",
+    )
+    entries = []
+    keys = []
+
+    def add_entry(doctype, name, label, path, postcode=None, **values):
+        values.update(
+            level=LEVELS[doctype],
+            doctype=doctype,
+            name=name,
+            label=label,
+            path=" / ".join(part for part in path if part),
+            postcode=postcode,
+        )
+        entry = len(entries)
+        entries.append(tuple(values.get(column) for column in columns))
+
+        label = normalize(label)
+        keys.append((label, entry, 1))
+        for word in set(label.split()[1:]):
+            keys.append((word, entry, 2))
+        if postcode:
+            keys.append((normalize(postcode), entry, 2))
+
+    for name in regions:
+        add_entry("TZ Region", name, name, [name], region=name)
+    for row in districts:
+        add_entry(
+            "TZ District",
+            row.name,
+            row.district,
+            [row.region, row.district],
+            region=row.region,
+            district=row.name,
+            district_name=row.district,
+        )
+    for row in wards:
+        add_entry(
+            "TZ Ward",
+            row.name,
+            row.ward,
+            [row.region, row.district_name, row.ward],
+            region=row.region,
+            district=row.district,
+            district_name=row.district_name,
+            ward=row.name,
+            ward_name=row.ward,
+        )
+    for row in villages:
+        add_entry(
+            "TZ Village",
+            row.name,
+            row.village,
+            [row.region, row.district_name, row.ward_name, row.village],
+            postcode=row.postcode,
+            region=row.region,
+            district=row.district,
+            district_name=row.district_name,
+            ward=row.ward,
+            ward_name=row.ward_name,
+            village=row.name,
+        )
+
+    keys.sort()
+    return {
+        "version": frappe.generate_hash(length=10),
+        "columns": columns,
+        "entries": entries,
+        "keys": keys,
+    }
+
+
+def clear_location_index(doc=None, method=None):
+    """Drop the cached index, workers rebuild it on the next search"""
+    frappe.cache().delete_value([INDEX_CACHE_KEY, VERSION_CACHE_KEY])
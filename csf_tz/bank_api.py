@@ -7,7 +7,7 @@ import frappe
 from frappe import _
 import json
 import requests
-from frappe.utils import get_host_name, flt
+from frappe.utils import get_host_name, flt, create_batch
 from time import sleep
 import binascii
 import os
@@ -43,7 +43,19 @@ def set_callback_token(doc, method):
         frappe.db.commit()
 
 
-def get_nmb_token(company):
+NMB_TOKEN_TTL = 20 * 60
+NMB_RECONCILIATION_BATCH_SIZE = 50
+
+
+def get_nmb_token(company, force_refresh=False):
+    """Return the NMB auth token for the company, reusing the cached one
+    until it expires."""
+    cache_key = "nmb_token:{0}".format(company)
+    if not force_refresh:
+        token = frappe.cache().get_value(cache_key)
+        if token:
+            return token
+
     url = frappe.get_value("Company", company, "nmb_url")
     if not url:
         frappe.throw(_("Please set NMB URL in Company {0}".format(company)))
@@ -63,25 +75,38 @@ def get_nmb_token(company):
             r = requests.post(url, data=json.dumps(data), timeout=5)
             r.raise_for_status()
             frappe.logger().debug({"get_nmb_token webhook_success": r.text})
-            if json.loads(r.text):
+            response = json.loads(r.text)
+            if response:
                 add_log(
                     request_type="NMB token",
                     request_url=url,
                     request_header="no header",
                     request_body=json.dumps(data),
-                    response_data=json.loads(r.text),
+                    response_data=response,
                 )
-            if json.loads(r.text)["status"] == 1:
-                return json.loads(r.text)["token"]
+            if response["status"] == 1:
+                frappe.cache().set_value(
+                    cache_key, response["token"], expires_in_sec=NMB_TOKEN_TTL
+                )
+                return response["token"]
             else:
-                frappe.throw(json.loads(r.text))
+                frappe.throw(response)
         except Exception as e:
             frappe.logger().debug({"get_nmb_token webhook_error": e, "try": i + 1})
-            sleep(3 * i + 1)
-            if i != 2:
-                continue
-            else:
+            if i == 2:
                 raise e
+            sleep(2**i)
+
+
+def clear_nmb_token(company):
+    frappe.cache().delete_value("nmb_token:{0}".format(company))
+
+
+def is_nmb_auth_error(error):
+    response = getattr(error, "response", None)
+    return isinstance(error, requests.HTTPError) and getattr(
+        response, "status_code", None
+    ) in (401, 403)
 
 
 def send_nmb(method, data, company):
@@ -95,35 +120,38 @@ def send_nmb(method, data, company):
             r = requests.post(url, data=json.dumps(data), timeout=5)
             r.raise_for_status()
             frappe.logger().debug({"send_nmb webhook_success": r.text})
-            if json.loads(r.text):
+            response = json.loads(r.text)
+            if response:
                 add_log(
                     request_type="NMB " + method,
                     request_url=url,
                     request_header="no header",
                     request_body=json.dumps(data),
-                    response_data=json.loads(r.text),
+                    response_data=response,
                 )
-            if json.loads(r.text)["status"] == 1:
+            if response["status"] == 1:
                 frappe.msgprint(
-                    "Response from bank:<br><hr>" + json.loads(r.text)["description"]
+                    "Response from bank:<br><hr>" + response["description"]
                 )
-                return json.loads(r.text)
+                return response
             else:
-                print(json.loads(r.text)["description"])
-                if json.loads(r.text)["description"] == "Duplicate Invoice Number":
-                    return json.loads(r.text)
+                print(response["description"])
+                if response["description"] == "Duplicate Invoice Number":
+                    return response
                 frappe.msgprint(
-                    "Error detected at bank:<br><hr>"
-                    + json.loads(r.text)["description"]
+                    "Error detected at bank:<br><hr>" + response["description"]
                 )
-                frappe.throw(json.loads(r.text))
+                frappe.throw(response)
         except Exception as e:
             frappe.logger().debug({"send_nmb webhook_error": e, "try": i + 1})
-            sleep(3 * i + 1)
-            if i != 2:
-                continue
-            else:
+            if is_nmb_auth_error(e):
+                # the bank rejected the token, do not serve it from the cache again
+                clear_nmb_token(company)
+            if i == 2:
                 raise e
+            # the cached token may have expired on the bank side
+            data["token"] = get_nmb_token(company, force_refresh=True)
+            sleep(2**i)
 
 
 @frappe.whitelist()
@@ -210,10 +238,10 @@ def receive_callback(*args, **kwargs):
     )
 
 
-def make_payment_entry(method="callback", **kwargs):
+def make_payment_entry(method="callback", doc_info=None, **kwargs):
     for key, value in kwargs.items():
         nmb_doc = value
-        doc_info = get_fee_info(nmb_doc.reference)
+        doc_info = doc_info or get_fee_info(nmb_doc.reference)
         accounts = get_fees_default_accounts(doc_info["company"])
 
         nmb_amount = flt(nmb_doc.amount)
@@ -363,42 +391,129 @@ def cancel_invoice(doc, method):
 
 
 def reconciliation(doc=None, method=None):
-    companys = frappe.get_all("Company")
+    companys = frappe.get_all(
+        "Company", filters={"nmb_username": ["is", "set"]}, pluck="name"
+    )
+    reconcile_date = datetime.today()
     for company in companys:
-        if not frappe.get_value("Company", company["name"], "nmb_username"):
+        try:
+            reconcile_company(company, reconcile_date)
+        except Exception:
+            frappe.log_error(
+                frappe.get_traceback(),
+                _("NMB Reconciliation failed for Company {0}").format(company),
+            )
+
+
+def reconcile_company(company, reconcile_date):
+    """Create the NMB Callbacks the bank reports for the day that were never
+    received, and enqueue their payment entries in batches."""
+    data = {"reconcile_date": reconcile_date.strftime("%d-%m-%Y")}
+    message = send_nmb("reconcilliation", data, company)
+    if message.get("status") != 1 or not message.get("transactions"):
+        return []
+
+    transactions = {}
+    for transaction in message["transactions"]:
+        key = (transaction.get("reference"), transaction.get("receipt"))
+        if key[0] and key[1]:
+            transactions.setdefault(key, transaction)
+    if not transactions:
+        return []
+
+    references = list({reference for reference, receipt in transactions})
+    received = {
+        (row.reference, row.receipt)
+        for row in frappe.get_all(
+            "NMB Callback",
+            filters={"reference": ["in", references]},
+            fields=["reference", "receipt"],
+        )
+    }
+    missing = [key for key in transactions if key not in received]
+    if not missing:
+        return []
+
+    fee_info_map = get_fee_info_map({reference for reference, receipt in missing})
+    callback_fields = set(frappe.get_meta("NMB Callback").get_valid_columns())
+
+    callbacks = []
+    for key in missing:
+        doc_info = fee_info_map.get(key[0])
+        if not doc_info:
+            continue
+        callback = {
+            fieldname: value
+            for fieldname, value in transactions[key].items()
+            if fieldname in callback_fields
+        }
+        callback.update(
+            {
+                "doctype": "NMB Callback",
+                "fees_token": doc_info["callback_token"],
+                "channel": callback.get("channel") or "Reconciliation",
+            }
+        )
+        callbacks.append(frappe.get_doc(callback).insert(ignore_permissions=True).name)
+    frappe.db.commit()
+
+    for batch in create_batch(callbacks, NMB_RECONCILIATION_BATCH_SIZE):
+        enqueue(
+            method=make_payment_entries,
+            queue="short",
+            timeout=10000,
+            is_async=True,
+            job_name="nmb_reconciliation_{0}_{1}".format(company, batch[0]),
+            callbacks=list(batch),
+        )
+    return callbacks
+
+
+def make_payment_entries(callbacks):
+    callback_docs = [frappe.get_doc("NMB Callback", name) for name in callbacks]
+    fee_info_map = get_fee_info_map({doc.reference for doc in callback_docs})
+    for nmb_doc in callback_docs:
+        doc_info = fee_info_map.get(nmb_doc.reference)
+        if not doc_info:
             continue
-        data = {"reconcile_date": datetime.today().strftime("%d-%m-%Y")}
-        frappe.msgprint(str(data))
-        message = send_nmb("reconcilliation", data, company["name"])
-        if message["status"] == 1 and len(message["transactions"]) > 0:
-            for i in message["transactions"]:
-                if (
-                    len(
-                        frappe.get_all(
-                            "NMB Callback",
-                            filters=[
-                                ["NMB Callback", "reference", "=", i.reference],
-                                ["NMB Callback", "receipt", "=", i.receipt],
-                            ],
-                            fields=["name"],
-                        )
-                    )
-                    == 1
-                ):
-                    doc_info = get_fee_info(message["reference"])
-                    if doc_info["name"]:
-                        message["fees_token"] = frappe.get_value(
-                            doc_info["doctype"], doc_info["name"], "callback_token"
-                        )
-                        message["doctype"] = "NMB Callback"
-                        nmb_doc = frappe.get_doc(message)
-                        enqueue(
-                            method=make_payment_entry,
-                            queue="short",
-                            timeout=10000,
-                            is_async=True,
-                            kwargs=nmb_doc,
-                        )
+        try:
+            make_payment_entry(
+                method="reconciliation", doc_info=doc_info, kwargs=nmb_doc
+            )
+            frappe.db.commit()
+        except Exception:
+            frappe.db.rollback()
+            frappe.log_error(
+                frappe.get_traceback(),
+                _("NMB Reconciliation Payment Entry failed for {0}").format(
+                    nmb_doc.name
+                ),
+            )
+
+
+def get_fee_info_map(bank_references):
+    """Resolve bank references to their Fees or Student Applicant Fees in one
+    query per doctype. Fees take precedence as in `get_fee_info`."""
+    data = {}
+    pending = set(bank_references)
+    for doctype in ("Fees", "Student Applicant Fees"):
+        if not pending:
+            break
+        for row in frappe.get_all(
+            doctype,
+            filters={"bank_reference": ["in", list(pending)], "docstatus": 1},
+            fields=["name", "company", "bank_reference", "callback_token"],
+        ):
+            if row.bank_reference in data:
+                continue
+            data[row.bank_reference] = {
+                "name": row.name,
+                "doctype": doctype,
+                "company": row.company,
+                "callback_token": row.callback_token,
+            }
+        pending -= set(data)
+    return data
 
 
 def get_fee_info(bank_reference):
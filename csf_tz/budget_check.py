@@ -17,6 +17,7 @@ import frappe
 from frappe import _
 from frappe.utils import flt
 from erpnext.accounts.doctype.budget.budget import validate_expense_against_budget
+from csf_tz.utils.settings import get_csf_tz_setting
 
 
 def validate_budget_on_draft(doc, method=None):
@@ -80,7 +81,7 @@ def is_budget_check_enabled(doctype):
 		return False
 
 	try:
-		return frappe.db.get_single_value("CSF TZ Settings", setting_field) or False
+		return get_csf_tz_setting(setting_field) or False
 	except Exception:
 		return False
 
@@ -128,7 +129,7 @@ def check_budget_before_submit(doctype, docname, setting_field=None):
 	# Check if budget check feature is enabled for this doctype
 	if field_to_check:
 		try:
-			is_enabled = frappe.db.get_single_value('CSF TZ Settings', field_to_check)
+			is_enabled = get_csf_tz_setting(field_to_check)
 			if not is_enabled:
 				return
 		except Exception:
@@ -237,4 +238,4 @@ def check_budget_for_buying_document(doc):
 
 		# Let ERPNext's validation raise exceptions naturally
 		# Pass expense_amount so it includes the current draft document's amount
-		validate_expense_against_budget(args, expense_amount=item_amount)
\ No newline at end of file
+		validate_expense_against_budget(args, expense_amount=item_amount)
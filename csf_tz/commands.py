@@ -0,0 +1,47 @@
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("load-tz-gazetteer")
+@click.option(
+    "--force", is_flag=True, default=False, help="Reload files that have not changed"
+)
+@pass_context
+def load_tz_gazetteer(context, force=False):
+    """Load TZ Regions, Districts, Wards and Villages from the bundled JSON files"""
+    import frappe
+
+    from csf_tz.patches.tz_post_code.create_tz_post_code import execute
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        execute(force=force)
+    finally:
+        frappe.destroy()
+
+
+@click.command("sync-csf-tz-fixtures")
+@click.option(
+    "--force", is_flag=True, default=False, help="Apply files that have not changed"
+)
+@pass_context
+def sync_csf_tz_fixtures(context, force=False):
+    """Apply the CSF TZ custom field and property setter JSON files"""
+    import frappe
+
+    from csf_tz.utils import create_custom_fields, create_property_setter
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        create_custom_fields.execute(force=force)
+        create_property_setter.execute(force=force)
+        frappe.db.commit()
+    finally:
+        frappe.destroy()
+
+
+commands = [load_tz_gazetteer, sync_csf_tz_fixtures]
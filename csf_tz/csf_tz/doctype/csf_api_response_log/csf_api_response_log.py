@@ -5,6 +5,7 @@
 from __future__ import unicode_literals
 import frappe
 from frappe.model.document import Document
+from csf_tz.utils.integration_log import buffer_log
 
 
 class CSFAPIResponseLog(Document):
@@ -19,14 +20,16 @@ def add_log(
     response_data=None,
     status_code=None,
 ):
-    doc = frappe.new_doc("CSF API Response Log")
-    doc.request_type = str(request_type)
-    doc.request_url = str(request_url)
-    doc.request_header = str(request_header) or ""
-    doc.request_body = str(request_body) or ""
-    doc.response_data = str(response_data) or ""
-    doc.user_id = frappe.session.user
-    doc.status_code = status_code or ""
-    doc.save(ignore_permissions=True)
-    frappe.db.commit()
-    return doc.name
+    buffer_log(
+        "CSF API Response Log",
+        {
+            "naming_series": "CSFAPI-RES-.YY.-.########",
+            "request_type": str(request_type),
+            "request_url": str(request_url),
+            "request_header": str(request_header) or "",
+            "request_body": str(request_body) or "",
+            "response_data": str(response_data) or "",
+            "user_id": frappe.session.user,
+            "status_code": status_code or "",
+        },
+    )
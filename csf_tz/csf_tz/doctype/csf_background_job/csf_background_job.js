@@ -0,0 +1,12 @@
+// Copyright (c) 2026, Aakvatech and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on('CSF Background Job', {
+	refresh: function(frm) {
+		if (frm.doc.status == "Failed" || (frm.doc.status == "Queued" && frm.doc.attempts)) {
+			frm.add_custom_button(__("Resume"), function() {
+				frm.call("resume").then(() => frm.reload_doc());
+			});
+		}
+	}
+});
@@ -0,0 +1,37 @@
+# Copyright (c) 2026, Aakvatech and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import add_days, now_datetime
+
+PURGE_CHUNK_SIZE = 10000
+
+
+class CSFBackgroundJob(Document):
+    @frappe.whitelist()
+    def resume(self):
+        """Queue the job again from its cursor, retrying the failed chunk right away"""
+        from csf_tz.utils.background_job import resume_chunked_job
+
+        resume_chunked_job(self.name)
+
+    @staticmethod
+    def clear_old_logs(days=30):
+        """Called by Log Settings, deletes finished jobs older than `days` in chunks"""
+        table = frappe.qb.DocType("CSF Background Job")
+        cutoff = add_days(now_datetime(), -days)
+        while True:
+            names = (
+                frappe.qb.from_(table)
+                .select(table.name)
+                .where(table.modified < cutoff)
+                .where(
+                    table.status.isin(["Completed", "Completed with Errors", "Failed"])
+                )
+                .limit(PURGE_CHUNK_SIZE)
+            ).run(pluck=True)
+            if not names:
+                break
+            frappe.qb.from_(table).delete().where(table.name.isin(names)).run()
+            frappe.db.commit()
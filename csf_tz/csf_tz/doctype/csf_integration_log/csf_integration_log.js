@@ -0,0 +1,8 @@
+// Copyright (c) 2026, Aakvatech and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on('CSF Integration Log', {
+	// refresh: function(frm) {
+
+	// }
+});
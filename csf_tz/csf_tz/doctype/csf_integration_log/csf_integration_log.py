@@ -0,0 +1,28 @@
+# Copyright (c) 2026, Aakvatech and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import add_days, now_datetime
+
+PURGE_CHUNK_SIZE = 10000
+
+
+class CSFIntegrationLog(Document):
+    @staticmethod
+    def clear_old_logs(days=30):
+        """Called by Log Settings, deletes logs older than `days` in chunks on the timestamp index"""
+        table = frappe.qb.DocType("CSF Integration Log")
+        cutoff = add_days(now_datetime(), -days)
+        while True:
+            names = (
+                frappe.qb.from_(table)
+                .select(table.name)
+                .where(table.timestamp < cutoff)
+                .orderby(table.timestamp)
+                .limit(PURGE_CHUNK_SIZE)
+            ).run(pluck=True)
+            if not names:
+                break
+            frappe.qb.from_(table).delete().where(table.name.isin(names)).run()
+            frappe.db.commit()
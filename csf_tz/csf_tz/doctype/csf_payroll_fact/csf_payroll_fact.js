@@ -0,0 +1,8 @@
+// Copyright (c) 2026, Aakvatech and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on('CSF Payroll Fact', {
+	// refresh: function(frm) {
+
+	// }
+});
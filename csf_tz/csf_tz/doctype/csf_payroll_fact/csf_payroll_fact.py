@@ -0,0 +1,253 @@
+# Copyright (c) 2026, Aakvatech and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.query_builder import Case, DocType
+from frappe.query_builder.functions import IfNull, Sum
+from frappe.utils import flt, now_datetime
+
+SLIP_FIELDS = (
+    "employee",
+    "company",
+    "start_date",
+    "end_date",
+    "department",
+    "payroll_cost_center",
+    "currency",
+    "exchange_rate",
+)
+COMPONENT_TYPES = {"earnings": "Earning", "deductions": "Deduction"}
+
+
+class CSFPayrollFact(Document):
+    pass
+
+
+def make_payroll_facts(salary_slip):
+    """
+    Write one fact per earning and deduction row of a submitted Salary Slip
+
+    Facts are named after their Salary Detail row, so writing them again for the
+    same slip replaces the previous ones.
+    """
+    delete_payroll_facts(salary_slip.name)
+
+    timestamp = now_datetime()
+    slip_values = [salary_slip.get(field) for field in SLIP_FIELDS]
+    exchange_rate = flt(salary_slip.exchange_rate) or 1
+    values = []
+    for parentfield, component_type in COMPONENT_TYPES.items():
+        for row in salary_slip.get(parentfield) or []:
+            values.append(
+                [row.name, salary_slip.name]
+                + slip_values
+                + [
+                    row.salary_component,
+                    component_type,
+                    row.do_not_include_in_total,
+                    flt(row.amount),
+                    flt(row.amount) * exchange_rate,
+                    timestamp,
+                    timestamp,
+                    frappe.session.user,
+                    frappe.session.user,
+                ]
+            )
+
+    if values:
+        frappe.db.bulk_insert(
+            "CSF Payroll Fact",
+            ["name", "salary_slip"]
+            + list(SLIP_FIELDS)
+            + [
+                "salary_component",
+                "component_type",
+                "do_not_include_in_total",
+                "amount",
+                "base_amount",
+                "creation",
+                "modified",
+                "owner",
+                "modified_by",
+            ],
+            values,
+        )
+
+
+def delete_payroll_facts(salary_slip):
+    fact = DocType("CSF Payroll Fact")
+    frappe.qb.from_(fact).delete().where(fact.salary_slip == salary_slip).run()
+
+
+def rebuild_payroll_facts():
+    """Rebuild the facts of all submitted Salary Slips with one INSERT ... SELECT"""
+    frappe.db.delete("CSF Payroll Fact")
+    frappe.db.sql(
+        """
+        INSERT INTO `tabCSF Payroll Fact` (
+            name, salary_slip, {slip_fields}, salary_component, component_type,
+            do_not_include_in_total, amount, base_amount,
+            creation, modified, owner, modified_by, docstatus
+        )
+        SELECT
+            sd.name, ss.name, {slip_columns}, sd.salary_component,
+            IF(sd.parentfield = 'earnings', 'Earning', 'Deduction'),
+            sd.do_not_include_in_total, sd.amount,
+            sd.amount * IF(IFNULL(ss.exchange_rate, 0) = 0, 1, ss.exchange_rate),
+            NOW(), NOW(), 'Administrator', 'Administrator', 0
+        FROM `tabSalary Detail` sd
+        INNER JOIN `tabSalary Slip` ss ON ss.name = sd.parent
+        WHERE sd.parenttype = 'Salary Slip'
+            AND sd.parentfield IN ('earnings', 'deductions')
+            AND ss.docstatus = 1
+        """.format(
+            slip_fields=", ".join(SLIP_FIELDS),
+            slip_columns=", ".join(f"ss.{field}" for field in SLIP_FIELDS),
+        )
+    )
+
+
+def get_fact_source(submitted=True):
+    """
+    Query and columns to read salary slip components from
+
+    Submitted slips are read from the facts. Draft and cancelled slips have no
+    facts, their components are read from Salary Detail with the same columns.
+    """
+    if submitted:
+        fact = DocType("CSF Payroll Fact")
+        columns = {
+            field: fact[field]
+            for field in ("salary_slip",)
+            + SLIP_FIELDS
+            + (
+                "salary_component",
+                "component_type",
+                "do_not_include_in_total",
+                "amount",
+                "base_amount",
+            )
+        }
+        return frappe.qb.from_(fact), columns
+
+    salary_slip = DocType("Salary Slip")
+    salary_detail = DocType("Salary Detail")
+    columns = {field: salary_slip[field] for field in SLIP_FIELDS}
+    columns.update(
+        salary_slip=salary_detail.parent,
+        salary_component=salary_detail.salary_component,
+        component_type=Case()
+        .when(salary_detail.parentfield == "earnings", "Earning")
+        .else_("Deduction"),
+        do_not_include_in_total=salary_detail.do_not_include_in_total,
+        amount=salary_detail.amount,
+        base_amount=salary_detail.amount
+        * Case()
+        .when(IfNull(salary_slip.exchange_rate, 0) == 0, 1)
+        .else_(salary_slip.exchange_rate),
+    )
+    query = (
+        frappe.qb.from_(salary_detail)
+        .inner_join(salary_slip)
+        .on(salary_slip.name == salary_detail.parent)
+        .where(salary_detail.parenttype == "Salary Slip")
+        .where(salary_detail.parentfield.isin(list(COMPONENT_TYPES)))
+    )
+    return query, columns
+
+
+def filter_facts(
+    query,
+    columns,
+    salary_slips,
+    component_type=None,
+    include_in_total_only=False,
+    salary_component=None,
+    exclude_salary_component=None,
+    non_zero=False,
+):
+    query = query.where(columns["salary_slip"].isin(salary_slips))
+    if component_type:
+        query = query.where(columns["component_type"] == component_type)
+    if include_in_total_only:
+        query = query.where(columns["do_not_include_in_total"] == 0)
+    if salary_component:
+        query = query.where(columns["salary_component"] == salary_component)
+    if exclude_salary_component:
+        query = query.where(columns["salary_component"] != exclude_salary_component)
+    if non_zero:
+        query = query.where(columns["amount"] != 0)
+    return query
+
+
+def get_payroll_facts(salary_slips, fields=None, submitted=True, **filters):
+    """
+    Component rows of the given salary slips
+
+    Args:
+        salary_slips (list): Salary Slip names
+        fields (list): Columns to return, all columns if None
+        submitted (bool): The slips are submitted and have facts
+        filters: component_type, include_in_total_only, salary_component,
+            exclude_salary_component, non_zero
+
+    Returns:
+        list: One dict per earning or deduction row
+    """
+    if not salary_slips:
+        return []
+
+    query, columns = get_fact_source(submitted)
+    query = filter_facts(query, columns, list(salary_slips), **filters)
+    for field in fields or columns:
+        query = query.select(columns[field].as_(field))
+    return query.run(as_dict=True)
+
+
+def get_component_totals(
+    salary_slips, group_by=("salary_component",), submitted=True, **filters
+):
+    """
+    Sums of `amount` and `base_amount` of the given salary slips, grouped by `group_by`
+
+    Rows are ordered by the grouping columns. Takes the same filters as
+    `get_payroll_facts`.
+    """
+    if not salary_slips:
+        return []
+
+    query, columns = get_fact_source(submitted)
+    query = filter_facts(query, columns, list(salary_slips), **filters)
+    for field in group_by:
+        query = query.select(columns[field].as_(field)).groupby(columns[field])
+        query = query.orderby(columns[field])
+    query = query.select(
+        Sum(columns["amount"]).as_("amount"),
+        Sum(columns["base_amount"]).as_("base_amount"),
+    )
+    return query.run(as_dict=True)
+
+
+def get_slip_component_map(
+    salary_slips, submitted=True, base_currency=False, **filters
+):
+    """
+    {salary_slip: {salary_component: amount}} of the given salary slips
+
+    `base_currency` returns the amounts in company currency. Takes the same filters
+    as `get_payroll_facts`.
+    """
+    amount_field = "base_amount" if base_currency else "amount"
+    slip_component_map = {}
+    for row in get_payroll_facts(
+        salary_slips,
+        fields=["salary_slip", "salary_component", amount_field],
+        submitted=submitted,
+        **filters,
+    ):
+        components = slip_component_map.setdefault(row.salary_slip, frappe._dict())
+        components[row.salary_component] = flt(
+            components.get(row.salary_component)
+        ) + flt(row[amount_field])
+    return slip_component_map
@@ -0,0 +1,9 @@
+# Copyright (c) 2026, Aakvatech and Contributors
+# See license.txt
+
+# import frappe
+import unittest
+
+
+class TestCSFPayrollFact(unittest.TestCase):
+    pass
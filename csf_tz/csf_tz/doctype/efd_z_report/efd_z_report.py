@@ -7,7 +7,7 @@ import frappe
 from frappe import _
 from frappe.model.document import Document
 from datetime import datetime
-from frappe.utils import flt
+from frappe.utils import flt, now
 
 
 class EFDZReport(Document):
@@ -25,39 +25,41 @@ class EFDZReport(Document):
     @frappe.whitelist()
     def get_sales_invoice(self):
 
-        date = datetime.strptime(
+        z_report_date_time = datetime.strptime(
             str(self.z_report_date_time), "%Y-%m-%d %H:%M:%S"
-        ).date()
-        time = datetime.strptime(
-            str(self.z_report_date_time), "%Y-%m-%d %H:%M:%S"
-        ).time()
-
-        condition = (
-            "docstatus = 1  and (efd_z_report = '' OR efd_z_report is null) and status !='Return' and posting_date <= '"
-            + str(date)
-            + "' and IF(IF(posting_date = '"
-            + str(date)
-            + "', IF(posting_time < '"
-            + str(time)
-            + "',1,'PostingTime'),'PostingDate') = 1 or IF(posting_date = '"
-            + str(date)
-            + "',IF(posting_time < '"
-            + str(time)
-            + "',1,'PostingTime'),'PostingDate') = 'PostingDate',1,0)"
-        )
-
-        condition += (
-            " and ( electronic_fiscal_device = '" + self.electronic_fiscal_device + "'"
-            "or electronic_fiscal_device is null or electronic_fiscal_device = '')"
-        )
-
-        query = """ select *
-                        from `tabSales Invoice`
-                        where {0}""".format(
-            condition
         )
+        date = z_report_date_time.date()
+        time = z_report_date_time.time()
 
-        sales_invoices = frappe.db.sql(query, as_dict=True)
+        si = frappe.qb.DocType("Sales Invoice")
+        sales_invoices = (
+            frappe.qb.from_(si)
+            .select(
+                si.name,
+                si.posting_date,
+                si.currency,
+                si.base_total,
+                si.base_net_total,
+                si.base_grand_total,
+                si.base_rounded_total,
+                si.base_total_taxes_and_charges,
+            )
+            .where(
+                (si.docstatus == 1)
+                & ((si.efd_z_report == "") | si.efd_z_report.isnull())
+                & (si.status != "Return")
+                # invoices posted before the Z report date time
+                & (si.posting_date <= date)
+                & ((si.posting_date < date) | (si.posting_time < time))
+                & (
+                    (si.electronic_fiscal_device == self.electronic_fiscal_device)
+                    | (si.electronic_fiscal_device == "")
+                    | si.electronic_fiscal_device.isnull()
+                )
+            )
+            .orderby(si.posting_date)
+            .orderby(si.posting_time)
+        ).run(as_dict=True)
 
         if not sales_invoices:
             frappe.throw("No Sales Invoice Fetch")
@@ -114,31 +116,57 @@ class EFDZReport(Document):
                     "The Number of Sales Invoice (Include is checked) in the table is not equal to Receipts Issued"
                 )
             )
-        to_remove = []
-        for invoice in self.efd_z_report_invoices:
-            if not invoice.include:
-                to_remove.append(invoice)
-            else:
-                invoice_doc = frappe.get_doc("Sales Invoice", invoice.invoice_number)
-                if invoice_doc.efd_z_report:
-                    frappe.throw(
-                        _(
-                            "The Sales Invoice {0} is linked to EFD Z Report {1}".format(
-                                invoice.invoice_number, invoice_doc.efd_z_report
-                            )
-                        )
+        to_remove = [
+            invoice for invoice in self.efd_z_report_invoices if not invoice.include
+        ]
+        invoices = [
+            invoice.invoice_number
+            for invoice in self.efd_z_report_invoices
+            if invoice.include
+        ]
+        linked = (
+            frappe.get_all(
+                "Sales Invoice",
+                filters={"name": ["in", invoices], "efd_z_report": ["is", "set"]},
+                fields=["name", "efd_z_report"],
+                limit=1,
+            )
+            if invoices
+            else []
+        )
+        if linked:
+            frappe.throw(
+                _(
+                    "The Sales Invoice {0} is linked to EFD Z Report {1}".format(
+                        linked[0].name, linked[0].efd_z_report
                     )
-                else:
-                    invoice_doc.efd_z_report = self.name
-                    invoice_doc.flags.ignore_permissions = True
-                    invoice_doc.save()
+                )
+            )
+        set_efd_z_report(invoices, self.name)
         [self.remove(invoice) for invoice in to_remove]
 
     def on_cancel(self):
-        for invoice in self.efd_z_report_invoices:
-            if invoice.include:
-                invoice_doc = frappe.get_doc("Sales Invoice", invoice.invoice_number)
-                if invoice_doc.efd_z_report:
-                    invoice_doc.efd_z_report = ""
-                    invoice_doc.flags.ignore_permissions = True
-                    invoice_doc.save()
+        invoices = [
+            invoice.invoice_number
+            for invoice in self.efd_z_report_invoices
+            if invoice.include
+        ]
+        set_efd_z_report(invoices, "", current_value=self.name)
+
+
+def set_efd_z_report(invoices, efd_z_report, current_value=None):
+    """Stamp or clear the EFD Z Report on Sales Invoices with one UPDATE"""
+    if not invoices:
+        return
+
+    si = frappe.qb.DocType("Sales Invoice")
+    query = (
+        frappe.qb.update(si)
+        .set(si.efd_z_report, efd_z_report)
+        .set(si.modified, now())
+        .set(si.modified_by, frappe.session.user)
+        .where(si.name.isin(invoices))
+    )
+    if current_value:
+        query = query.where(si.efd_z_report == current_value)
+    query.run()
@@ -4,9 +4,40 @@
 import frappe
 from frappe.model.document import Document
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+try:
+    import lxml  # noqa: F401
+
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+TRA_VERIFY_URL = "https://verify.tra.go.tz/Home/Index"
+TRA_MAX_CONCURRENCY = 8
+TRA_DEFAULT_CONCURRENCY = 4
+# A verified receipt never changes, the expiry only bounds the cache size
+TRA_VERIFICATION_CACHE_TTL = 30 * 24 * 60 * 60
+
+# Headers to mimic a real browser request
+TRA_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
+    "Upgrade-Insecure-Requests": "1",
+}
+
+# Connection pool shared by all verifications in this worker. Each verification
+# still gets its own Session so that the form cookies and token do not leak
+# between concurrent verifications.
+TRA_HTTP_ADAPTER = requests.adapters.HTTPAdapter(
+    pool_connections=1, pool_maxsize=TRA_MAX_CONCURRENCY
+)
+
 
 class TRATAXInv(Document):
     def validate(self):
@@ -60,12 +91,7 @@ def verify_tra_receipt(verification_code=None, qr_code_data=None):
         verification_success = False
 
         try:
-            verification_result = fetch_tra_verification(verification_code)
-            if "error" not in verification_result:
-                receipt_data = extract_receipt_data(
-                    verification_result["verification_data"]
-                )
-                verification_success = True
+            receipt_data, verification_success = get_tra_receipt_data(verification_code)
 
         except Exception as e:
             frappe.logger().error(f"TRA verification failed: {str(e)}")
@@ -102,51 +128,86 @@ def verify_tra_receipt(verification_code=None, qr_code_data=None):
         }
 
 
-def fetch_tra_verification(verification_code):
+def get_tra_receipt_data(verification_code, html_result=None):
     """
-    Fetch HTML content from TRA verification by submitting the form and handling time selection
+    Get the receipt data for a verification code, using the cached result of an
+    earlier successful verification when there is one
 
     Args:
-        verification_code (str): The receipt verification code (e.g., "3D89A530626_094801")
+        verification_code (str): The receipt verification code
+        html_result (dict): Already fetched result of `fetch_tra_verification_html`
 
     Returns:
-        dict: Contains HTML content, parsed data, and response info
+        tuple: (receipt_data, verification_success)
     """
+    cache_key = f"tra_receipt_verification:{verification_code}"
+    cached = frappe.cache().get_value(cache_key)
+    if cached:
+        return cached, True
+
+    verification_result = fetch_tra_verification(verification_code, html_result)
+    if "error" in verification_result:
+        return {}, False
+
+    receipt_data = verification_result["receipt_data"]
+    if receipt_data.get("receipt_info") and not receipt_data.get("parsing_error"):
+        frappe.cache().set_value(
+            cache_key, receipt_data, expires_in_sec=TRA_VERIFICATION_CACHE_TTL
+        )
+    return receipt_data, True
 
-    # Extract time from verification code (format: XXXXXXX_HHMMSS)
-    if "_" in verification_code:
-        time_part = verification_code.split("_")[1]
-        if len(time_part) == 6:
-            hour = time_part[:2]
-            minute = time_part[2:4]
-            second = time_part[4:6]
-            receipt_time = f"{hour}:{minute}:{second}"
-        else:
-            return {"error": "Invalid time format in verification code"}
-    else:
-        return {"error": "Verification code does not contain time information"}
 
-    # Set up the session with proper headers
+def get_tra_session():
+    """Return a new session on the shared TRA connection pool.
+
+    The session must not be closed, closing it would close the shared pool.
+    """
     session = requests.Session()
+    session.mount("https://", TRA_HTTP_ADAPTER)
+    session.headers.update(TRA_HEADERS)
+    return session
 
-    # Headers to mimic a real browser request
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.5",
-        "Accept-Encoding": "gzip, deflate",
-        "Connection": "keep-alive",
-        "Upgrade-Insecure-Requests": "1",
-    }
 
-    session.headers.update(headers)
+def get_receipt_time(verification_code):
+    """Extract time from verification code (format: XXXXXXX_HHMMSS)"""
+    if "_" not in verification_code:
+        return None, "Verification code does not contain time information"
+
+    time_part = verification_code.split("_")[1]
+    if len(time_part) != 6:
+        return None, "Invalid time format in verification code"
+
+    hour = time_part[:2]
+    minute = time_part[2:4]
+    second = time_part[4:6]
+    return f"{hour}:{minute}:{second}", None
+
+
+def fetch_tra_verification_html(verification_code):
+    """
+    Fetch the verified receipt page from TRA by submitting the form and handling time selection.
+
+    Only does HTTP work so that it can run in worker threads.
+
+    Args:
+        verification_code (str): The receipt verification code (e.g., "3D89A530626_094801")
+
+    Returns:
+        dict: Contains the final response and the form values used
+    """
+    receipt_time, error = get_receipt_time(verification_code)
+    if error:
+        return {"error": error}
+
+    session = get_tra_session()
 
     try:
-        form_url = "https://verify.tra.go.tz/Home/Index"
-        form_response = session.get(form_url, timeout=30)
+        form_response = session.get(TRA_VERIFY_URL, timeout=30)
         form_response.raise_for_status()
 
-        form_soup = BeautifulSoup(form_response.text, "html.parser")
+        form_soup = BeautifulSoup(
+            form_response.text, HTML_PARSER, parse_only=SoupStrainer("input")
+        )
         token_input = form_soup.find("input", {"name": "__RequestVerificationToken"})
 
         if not token_input:
@@ -159,16 +220,16 @@ def fetch_tra_verification(verification_code):
             "RctVcode": verification_code,
         }
 
-        session.headers.update(
-            {
+        response = session.post(
+            TRA_VERIFY_URL,
+            data=form_data,
+            headers={
                 "Content-Type": "application/x-www-form-urlencoded",
-                "Referer": form_url,
+                "Referer": TRA_VERIFY_URL,
                 "Origin": "https://verify.tra.go.tz",
-            }
-        )
-
-        response = session.post(
-            form_url, data=form_data, timeout=30, allow_redirects=True
+            },
+            timeout=30,
+            allow_redirects=True,
         )
         response.raise_for_status()
 
@@ -178,40 +239,61 @@ def fetch_tra_verification(verification_code):
                 f"https://verify.tra.go.tz/Verify/Verified?Secret={receipt_time}"
             )
 
-            session.headers.update({"Referer": response.url})
-
-            final_response = session.get(verification_url, timeout=30)
+            final_response = session.get(
+                verification_url,
+                headers={
+                    "Referer": response.url,
+                    "Origin": "https://verify.tra.go.tz",
+                },
+                timeout=30,
+            )
             final_response.raise_for_status()
 
             response = final_response
 
-        # Parse the HTML content
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        # Extract useful information
-        result = {
-            "status_code": response.status_code,
-            "url": response.url,
-            "html_content": response.text,
-            "title": soup.title.string if soup.title else None,
-            "headers": dict(response.headers),
-            "cookies": dict(response.cookies),
-            "verification_code_used": verification_code,
+        return {
+            "response": response,
             "receipt_time_used": receipt_time,
             "form_token_used": verification_token,
         }
 
-        # Try to extract specific verification data
-        verification_data = extract_verification_data(soup)
-        result["verification_data"] = verification_data
+    except requests.exceptions.RequestException as e:
+        return {"error": f"Request failed: {str(e)}", "status_code": None}
 
-        # Also store the HTML content for direct parsing
-        result["verification_data"]["html_content"] = response.text
 
-        return result
+def fetch_tra_verification(verification_code, html_result=None):
+    """
+    Fetch HTML content from TRA verification and parse it
 
-    except requests.exceptions.RequestException as e:
-        return {"error": f"Request failed: {str(e)}", "status_code": None}
+    Args:
+        verification_code (str): The receipt verification code (e.g., "3D89A530626_094801")
+        html_result (dict): Already fetched result of `fetch_tra_verification_html`
+
+    Returns:
+        dict: Contains HTML content, parsed data, and response info
+    """
+    html_result = html_result or fetch_tra_verification_html(verification_code)
+    if "error" in html_result:
+        return html_result
+
+    response = html_result["response"]
+
+    # Parse the HTML content once for all extractors
+    soup = BeautifulSoup(response.text, HTML_PARSER)
+
+    return {
+        "status_code": response.status_code,
+        "url": response.url,
+        "html_content": response.text,
+        "title": soup.title.string if soup.title else None,
+        "headers": dict(response.headers),
+        "cookies": dict(response.cookies),
+        "verification_code_used": verification_code,
+        "receipt_time_used": html_result["receipt_time_used"],
+        "form_token_used": html_result["form_token_used"],
+        "verification_data": {"html_content": response.text},
+        "receipt_data": extract_receipt_from_soup(soup),
+    }
 
 
 def extract_verification_data(soup):
@@ -359,6 +441,24 @@ def extract_receipt_from_html(html_content):
     Args:
         html_content (str): Raw HTML content from TRA verification
 
+    Returns:
+        dict: Structured receipt data
+    """
+    try:
+        soup = BeautifulSoup(html_content, HTML_PARSER)
+    except Exception as e:
+        return {"parsing_error": str(e)}
+
+    return extract_receipt_from_soup(soup)
+
+
+def extract_receipt_from_soup(soup):
+    """
+    Extract receipt data from an already parsed receipt
+
+    Args:
+        soup: BeautifulSoup object of the HTML
+
     Returns:
         dict: Structured receipt data
     """
@@ -373,14 +473,14 @@ def extract_receipt_from_html(html_content):
     }
 
     try:
-        soup = BeautifulSoup(html_content, "html.parser")
+        sections = collect_receipt_sections(soup)
 
-        extract_company_info(soup, receipt_data)
-        extract_customer_info(soup, receipt_data)
-        extract_receipt_info(soup, receipt_data)
-        extract_items(soup, receipt_data)
-        extract_totals_and_taxes(soup, receipt_data)
-        extract_verification_info(soup, receipt_data)
+        extract_company_info(sections, receipt_data)
+        extract_customer_info(sections, receipt_data)
+        extract_receipt_info(sections, receipt_data)
+        extract_items(sections, receipt_data)
+        extract_totals_and_taxes(sections, receipt_data)
+        extract_verification_info(sections, receipt_data)
 
     except Exception as e:
         receipt_data["parsing_error"] = str(e)
@@ -388,18 +488,50 @@ def extract_receipt_from_html(html_content):
     return receipt_data
 
 
-def extract_company_info(soup, receipt_data):
+def collect_receipt_sections(soup):
+    """Walk the receipt once and collect the elements the extract_* helpers read"""
+    sections = frappe._dict(
+        invoice_info=None,
+        invoice_headers=[],
+        h4=[],
+        items_table=None,
+        totals_tables=[],
+        barcode=None,
+    )
+
+    for element in soup.find_all(["div", "h4", "table", "img"]):
+        classes = element.get("class") or []
+        if element.name == "div":
+            if "invoice-info" in classes and sections.invoice_info is None:
+                sections.invoice_info = element
+            if "invoice-header" in classes:
+                sections.invoice_headers.append(element)
+        elif element.name == "h4":
+            sections.h4.append(element)
+        elif element.name == "table":
+            if "table-striped" in classes:
+                if sections.items_table is None:
+                    sections.items_table = element
+            elif "table" in classes:
+                sections.totals_tables.append(element)
+        elif element.get("id") == "barcode" and sections.barcode is None:
+            sections.barcode = element
+
+    return sections
+
+
+def extract_company_info(sections, receipt_data):
     """Extract company information from the receipt HTML"""
     try:
         # Look for company name in the header
-        company_header = soup.find("h4")
+        company_header = sections.h4[0] if sections.h4 else None
         if company_header and company_header.find("b"):
             receipt_data["company_info"]["name"] = company_header.find("b").get_text(
                 strip=True
             )
 
         # Extract company details from the invoice-info section
-        invoice_info = soup.find("div", class_="invoice-info")
+        invoice_info = sections.invoice_info
         if invoice_info:
             text_content = invoice_info.get_text()
 
@@ -446,13 +578,11 @@ def extract_company_info(soup, receipt_data):
         frappe.logger().error(f"Error extracting company info: {str(e)}")
 
 
-def extract_customer_info(soup, receipt_data):
+def extract_customer_info(sections, receipt_data):
     """Extract customer information from the receipt HTML"""
     try:
-        # Find all invoice-header divs and look for customer information
-        invoice_headers = soup.find_all("div", class_="invoice-header")
-
-        for header in invoice_headers:
+        # Look for customer information in the invoice-header divs
+        for header in sections.invoice_headers:
             text_content = header.get_text()
 
             # Extract Customer Name
@@ -487,13 +617,11 @@ def extract_customer_info(soup, receipt_data):
         frappe.logger().error(f"Error extracting customer info: {str(e)}")
 
 
-def extract_receipt_info(soup, receipt_data):
+def extract_receipt_info(sections, receipt_data):
     """Extract receipt information from the receipt HTML"""
     try:
-        # Find all invoice-header divs and look for receipt information
-        invoice_headers = soup.find_all("div", class_="invoice-header")
-
-        for header in invoice_headers:
+        # Look for receipt information in the invoice-header divs
+        for header in sections.invoice_headers:
             text_content = header.get_text()
 
             # Extract Receipt Number
@@ -524,11 +652,10 @@ def extract_receipt_info(soup, receipt_data):
         frappe.logger().error(f"Error extracting receipt info: {str(e)}")
 
 
-def extract_items(soup, receipt_data):
+def extract_items(sections, receipt_data):
     """Extract purchased items from the receipt HTML"""
     try:
-        # Find the items table
-        items_table = soup.find("table", class_="table-striped")
+        items_table = sections.items_table
         if items_table:
             tbody = items_table.find("tbody")
             if tbody:
@@ -548,62 +675,58 @@ def extract_items(soup, receipt_data):
         frappe.logger().error(f"Error extracting items: {str(e)}")
 
 
-def extract_totals_and_taxes(soup, receipt_data):
+def extract_totals_and_taxes(sections, receipt_data):
     """Extract totals and tax information from the receipt HTML"""
     try:
-        # Find the totals table (the one without table-striped class)
-        tables = soup.find_all("table", class_="table")
-
-        for table in tables:
-            if "table-striped" not in table.get("class", []):
-                tbody = table.find("tbody")
-                if tbody:
-                    rows = tbody.find_all("tr")
-                    for row in rows:
-                        cells = row.find_all(["th", "td"])
-                        if len(cells) >= 2:
-                            label = cells[0].get_text(strip=True).upper()
-                            value = cells[1].get_text(strip=True)
-
-                            # Map the totals
-                            if "TOTAL EXCL OF TAX" in label:
-                                receipt_data["totals"]["subtotal"] = value
-                            elif "TOTAL INCL OF TAX" in label:
-                                receipt_data["totals"]["grand_total"] = value
-                            elif "TOTAL TAX" in label:
-                                receipt_data["totals"]["total_tax"] = value
-                            elif "TAX RATE" in label:
-                                # Extract tax rate and amount
-                                tax_info = {
-                                    "label": label,
-                                    "amount": value,
-                                }
-                                # Extract rate percentage if available
-                                if "(" in label and "%" in label:
-                                    rate_part = label.split("(")[1].split(")")[0]
-                                    tax_info["rate"] = rate_part
-                                receipt_data["taxes"].append(tax_info)
+        # The totals tables are the ones without table-striped class
+        for table in sections.totals_tables:
+            tbody = table.find("tbody")
+            if tbody:
+                rows = tbody.find_all("tr")
+                for row in rows:
+                    cells = row.find_all(["th", "td"])
+                    if len(cells) >= 2:
+                        label = cells[0].get_text(strip=True).upper()
+                        value = cells[1].get_text(strip=True)
+
+                        # Map the totals
+                        if "TOTAL EXCL OF TAX" in label:
+                            receipt_data["totals"]["subtotal"] = value
+                        elif "TOTAL INCL OF TAX" in label:
+                            receipt_data["totals"]["grand_total"] = value
+                        elif "TOTAL TAX" in label:
+                            receipt_data["totals"]["total_tax"] = value
+                        elif "TAX RATE" in label:
+                            # Extract tax rate and amount
+                            tax_info = {
+                                "label": label,
+                                "amount": value,
+                            }
+                            # Extract rate percentage if available
+                            if "(" in label and "%" in label:
+                                rate_part = label.split("(")[1].split(")")[0]
+                                tax_info["rate"] = rate_part
+                            receipt_data["taxes"].append(tax_info)
 
     except Exception as e:
         frappe.logger().error(f"Error extracting totals and taxes: {str(e)}")
 
 
-def extract_verification_info(soup, receipt_data):
+def extract_verification_info(sections, receipt_data):
     """Extract verification information from the receipt HTML"""
     try:
         # Look for verification code
-        verification_headers = soup.find_all("h4")
-        for header in verification_headers:
+        for idx, header in enumerate(sections.h4):
             text = header.get_text(strip=True)
             if "RECEIPT VERIFICATION CODE" in text:
                 # The next h4 should contain the actual code
-                next_h4 = header.find_next("h4")
+                next_h4 = sections.h4[idx + 1] if idx + 1 < len(sections.h4) else None
                 if next_h4:
                     verification_code = next_h4.get_text(strip=True)
                     receipt_data["verification_info"]["code"] = verification_code
 
         # Look for QR code image
-        qr_img = soup.find("img", {"id": "barcode"})
+        qr_img = sections.barcode
         if qr_img:
             qr_src = qr_img.get("src", "")
             qr_title = qr_img.get("title", "")
@@ -748,91 +871,13 @@ def create_tra_tax_inv_document_safe(
             }
 
         # Create new TRA TAX Inv document
+        values, items = get_tra_tax_inv_values(
+            verification_code, receipt_data, verification_result.get("success")
+        )
         doc = frappe.new_doc("TRA TAX Inv")
-        doc.verification_code = verification_code
-        doc.type = "Sales"  # Default to Sales
-
-        # Set verification status based on verification success
-        if verification_result.get("success"):
-            doc.verification_status = "Verified"
-        else:
-            doc.verification_status = "Failed"
-
-        # Populate basic information if available
-        try:
-            company_info = receipt_data.get("company_info", {})
-            if company_info.get("name"):
-                doc.company_name = company_info.get("name", "")
-        except:
-            pass
-
-        try:
-            receipt_info = receipt_data.get("receipt_info", {})
-            if receipt_info.get("receipt_number"):
-                doc.receipt_number = receipt_info.get("receipt_number", "")
-        except:
-            pass
-
-        # Populate customer information if available
-        try:
-            customer_info = receipt_data.get("customer_info", {})
-            if customer_info.get("name"):
-                doc.customer_name = customer_info.get("name", "")
-            if customer_info.get("id_type"):
-                doc.customer_id_type = customer_info.get("id_type", "")
-            if customer_info.get("id"):
-                doc.customer_id = customer_info.get("id", "")
-            if customer_info.get("mobile"):
-                doc.customer_mobile = customer_info.get("mobile", "")
-        except:
-            pass
-
-        # Populate totals if available
-        try:
-            totals = receipt_data.get("totals", {})
-            if totals.get("subtotal"):
-                try:
-                    subtotal_str = str(totals.get("subtotal", "0")).replace(",", "")
-                    doc.subtotal = float(subtotal_str)
-                except:
-                    pass
-
-            if totals.get("total_tax"):
-                try:
-                    total_tax_str = str(totals.get("total_tax", "0")).replace(",", "")
-                    doc.total_tax = float(total_tax_str)
-                except:
-                    pass
-
-            if totals.get("grand_total"):
-                try:
-                    grand_total_str = str(totals.get("grand_total", "0")).replace(
-                        ",", ""
-                    )
-                    doc.grand_total = float(grand_total_str)
-                except:
-                    pass
-        except:
-            pass
-
-        # Populate items if available
-        try:
-            items = receipt_data.get("items", [])
-            for item in items:
-                try:
-                    item_row = doc.append("items", {})
-                    item_row.description = item.get("description", "")
-                    item_row.quantity = item.get("quantity", "")
-                    if item.get("amount"):
-                        try:
-                            amount_str = str(item.get("amount", "0")).replace(",", "")
-                            item_row.amount = float(amount_str)
-                        except:
-                            item_row.amount = 0
-                except:
-                    continue
-        except:
-            pass
+        doc.update(values)
+        for item in items:
+            doc.append("items", item)
 
         # Save the document
         doc.insert()
@@ -866,6 +911,249 @@ def create_tra_tax_inv_document_safe(
         }
 
 
+def parse_tra_amount(value):
+    """Convert a TRA formatted amount (e.g. "1,180.00") to float, None if invalid"""
+    try:
+        return float(str(value or "0").replace(",", ""))
+    except (TypeError, ValueError):
+        return None
+
+
+def get_tra_tax_inv_values(verification_code, receipt_data, verification_success):
+    """
+    Map extracted receipt data to TRA TAX Inv field values
+
+    Args:
+        verification_code (str): The verification code used
+        receipt_data (dict): Extracted receipt data (may be empty)
+        verification_success (bool): Whether TRA verification succeeded
+
+    Returns:
+        tuple: (parent field values, list of item row values)
+    """
+    receipt_data = receipt_data or {}
+    company_info = receipt_data.get("company_info") or {}
+    receipt_info = receipt_data.get("receipt_info") or {}
+    customer_info = receipt_data.get("customer_info") or {}
+    totals = receipt_data.get("totals") or {}
+
+    values = {
+        "verification_code": verification_code,
+        "type": "Sales",  # Default to Sales
+        "verification_status": "Verified" if verification_success else "Failed",
+    }
+
+    # Populate basic and customer information if available
+    for fieldname, value in (
+        ("company_name", company_info.get("name")),
+        ("receipt_number", receipt_info.get("receipt_number")),
+        ("customer_name", customer_info.get("name")),
+        ("customer_id_type", customer_info.get("id_type")),
+        ("customer_id", customer_info.get("id")),
+        ("customer_mobile", customer_info.get("mobile")),
+    ):
+        if value:
+            values[fieldname] = value
+
+    # Populate totals if available
+    for fieldname in ("subtotal", "total_tax", "grand_total"):
+        if totals.get(fieldname):
+            amount = parse_tra_amount(totals.get(fieldname))
+            if amount is not None:
+                values[fieldname] = amount
+
+    items = []
+    for item in receipt_data.get("items") or []:
+        item_row = {
+            "description": item.get("description", ""),
+            "quantity": item.get("quantity", ""),
+        }
+        if item.get("amount"):
+            item_row["amount"] = parse_tra_amount(item.get("amount")) or 0
+        items.append(item_row)
+
+    return values, items
+
+
+@frappe.whitelist()
+def verify_tra_receipts(verification_codes, max_concurrency=None):
+    """
+    Verify a list of TRA receipts concurrently and create their TRA TAX Inv documents in bulk
+
+    Args:
+        verification_codes (list): Verification codes or QR code URLs (JSON encoded over HTTP)
+        max_concurrency (int): Number of receipts verified at the same time
+
+    Returns:
+        dict: Result per verification code and counts
+    """
+    # documents are bulk inserted below, without the permission check of doc.insert()
+    frappe.has_permission("TRA TAX Inv", "create", throw=True)
+
+    if isinstance(verification_codes, str):
+        verification_codes = frappe.parse_json(verification_codes)
+
+    codes = []
+    for code in verification_codes or []:
+        code = frappe.utils.cstr(code).strip()
+        if "verify.tra.go.tz/" in code:
+            code = code.split("verify.tra.go.tz/")[-1]
+        if code and code not in codes:
+            codes.append(code)
+
+    if not codes:
+        return {"success": False, "message": "No verification code provided"}
+
+    max_concurrency = min(
+        max(frappe.utils.cint(max_concurrency) or TRA_DEFAULT_CONCURRENCY, 1),
+        TRA_MAX_CONCURRENCY,
+    )
+
+    existing = dict(
+        frappe.get_all(
+            "TRA TAX Inv",
+            filters={"verification_code": ["in", codes]},
+            fields=["verification_code", "name"],
+            as_list=True,
+        )
+    )
+    pending = [code for code in codes if code not in existing]
+
+    # Only receipts that were never verified before go to TRA
+    cached = {}
+    for code in pending:
+        receipt_data = frappe.cache().get_value(f"tra_receipt_verification:{code}")
+        if receipt_data:
+            cached[code] = receipt_data
+    to_fetch = [code for code in pending if code not in cached]
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        html_results = dict(
+            zip(to_fetch, executor.map(fetch_tra_verification_html, to_fetch))
+        )
+
+    # Parsing and document creation run in this thread
+    new_docs = []
+    for code in pending:
+        if code in cached:
+            receipt_data, verification_success = cached[code], True
+        else:
+            try:
+                receipt_data, verification_success = get_tra_receipt_data(
+                    code, html_results[code]
+                )
+            except Exception as e:
+                frappe.logger().error(f"TRA verification failed: {str(e)}")
+                receipt_data, verification_success = {}, False
+        new_docs.append(
+            get_tra_tax_inv_values(code, receipt_data, verification_success)
+        )
+
+    created = insert_tra_tax_inv_documents(new_docs)
+    frappe.db.commit()
+
+    results = [
+        {
+            "verification_code": code,
+            "doc_name": existing.get(code) or created[code]["name"],
+            "created": code not in existing,
+            "verification_status": created[code]["verification_status"]
+            if code in created
+            else None,
+        }
+        for code in codes
+    ]
+    return {
+        "success": True,
+        "created": len(created),
+        "existing": len(existing),
+        "failed": len(
+            [row for row in created.values() if row["verification_status"] == "Failed"]
+        ),
+        "results": results,
+    }
+
+
+def insert_tra_tax_inv_documents(docs):
+    """
+    Insert TRA TAX Inv documents and their items with one bulk insert per table
+
+    The bulk insert skips document validation, item rows missing a mandatory value
+    (e.g. a receipt line without description) are left out.
+
+    Args:
+        docs (list): (parent values, item rows) tuples from `get_tra_tax_inv_values`
+
+    Returns:
+        dict: Inserted parent values by verification code
+    """
+    from frappe.model.naming import make_autoname
+
+    if not docs:
+        return {}
+
+    naming_series = frappe.get_meta("TRA TAX Inv").get_field("naming_series")
+    series = (naming_series.options or "").split("\n")[0] or "TRA-TAX-INV-.YYYY.-"
+    timestamp = frappe.utils.now_datetime()
+    user = frappe.session.user
+    item_reqd_fields = [
+        df.fieldname for df in frappe.get_meta("TRA TAX Inv Item").fields if df.reqd
+    ]
+
+    parents = {}
+    item_rows = []
+    for values, items in docs:
+        name = make_autoname(series + ".#####", "TRA TAX Inv")
+        values.update(
+            {
+                "name": name,
+                "naming_series": series,
+                "creation": timestamp,
+                "modified": timestamp,
+                "owner": user,
+                "modified_by": user,
+                "docstatus": 0,
+            }
+        )
+        parents[values["verification_code"]] = values
+        items = [
+            item
+            for item in items
+            if all(
+                frappe.utils.cstr(item.get(field)).strip() for field in item_reqd_fields
+            )
+        ]
+        for idx, item in enumerate(items, 1):
+            item.update(
+                {
+                    "name": frappe.generate_hash(length=10),
+                    "parent": name,
+                    "parenttype": "TRA TAX Inv",
+                    "parentfield": "items",
+                    "idx": idx,
+                    "creation": timestamp,
+                    "modified": timestamp,
+                    "owner": user,
+                    "modified_by": user,
+                    "docstatus": 0,
+                }
+            )
+            item_rows.append(item)
+
+    for doctype, rows in (
+        ("TRA TAX Inv", list(parents.values())),
+        ("TRA TAX Inv Item", item_rows),
+    ):
+        if not rows:
+            continue
+        fields = sorted({key for row in rows for key in row})
+        frappe.db.bulk_insert(
+            doctype, fields, [[row.get(field) for field in fields] for row in rows]
+        )
+
+    return parents
+
+
 @frappe.whitelist()
 def create_invoice_from_tra_tax_inv(tra_tax_inv_name, invoice_type):
     """
@@ -922,6 +1210,39 @@ def create_invoice_from_tra_tax_inv(tra_tax_inv_name, invoice_type):
         return {"success": False, "message": f"Error creating invoice: {str(e)}"}
 
 
+@frappe.whitelist()
+def create_invoices_from_tra_tax_invs(tra_tax_inv_names, invoice_type):
+    """
+    Create Purchase Invoices or Sales Invoices from several TRA Tax Invs
+
+    Items and parties of all receipts are resolved up front with a few batched
+    queries, then each receipt is converted as in `create_invoice_from_tra_tax_inv`.
+
+    Args:
+        tra_tax_inv_names (list): Names of the TRA Tax Inv documents (JSON encoded over HTTP)
+        invoice_type (str): Either "Purchase Invoice" or "Sales Invoice"
+
+    Returns:
+        dict: Result per TRA Tax Inv
+    """
+    if isinstance(tra_tax_inv_names, str):
+        tra_tax_inv_names = frappe.parse_json(tra_tax_inv_names)
+
+    tra_docs = [frappe.get_doc("TRA TAX Inv", name) for name in tra_tax_inv_names]
+    get_master_data_resolver().preload(tra_docs)
+
+    results = {}
+    for tra_doc in tra_docs:
+        results[tra_doc.name] = create_invoice_from_tra_tax_inv(
+            tra_doc.name, invoice_type
+        )
+
+    return {
+        "success": all(result.get("success") for result in results.values()),
+        "results": results,
+    }
+
+
 def validate_tra_tax_inv_for_invoice(tra_doc, invoice_type):
     """
     Validate TRA Tax Inv data before creating invoice
@@ -945,25 +1266,22 @@ def validate_tra_tax_inv_for_invoice(tra_doc, invoice_type):
             }
 
         # Validate items exist in Item master
+        resolver = get_master_data_resolver()
+        resolver.preload([tra_doc])
         for item in tra_doc.items:
             if not item.description:
                 continue
 
             # Check if mapped_item_code is provided and valid
             if hasattr(item, "mapped_item_code") and item.mapped_item_code:
-                if not frappe.db.exists("Item", item.mapped_item_code):
+                if not resolver.exists("Item", item.mapped_item_code):
                     missing_items.append(
                         f"{item.description} (mapped to: {item.mapped_item_code})"
                     )
                 continue
 
-            # Fallback: Try to find item by description
-            item_exists = frappe.db.exists("Item", {"item_name": item.description})
-            if not item_exists:
-                # Also try exact match on item_code
-                item_exists = frappe.db.exists("Item", item.description)
-
-            if not item_exists:
+            # Fallback: Try to find item by description, then exact match on item_code
+            if not resolver.find("Item", item.description):
                 missing_items.append(item.description)
 
         # Validate party (Customer/Supplier) exists
@@ -1110,6 +1428,102 @@ def create_sales_invoice_from_tra(tra_doc):
     return si_doc
 
 
+class TRAMasterDataResolver:
+    """
+    Resolves TRA item descriptions and party names to Item, Supplier and Customer
+    codes. Lookups are loaded in batches with IN queries and kept for the rest of
+    the request or job.
+    """
+
+    party_name_fields = {"Supplier": "supplier_name", "Customer": "customer_name"}
+
+    def __init__(self):
+        # keyed by `get_key`, so lookups ignore case and trailing spaces like the
+        # database collation; `existing` maps to the code as stored
+        self.existing = {"Item": {}, "Supplier": {}, "Customer": {}}
+        self.checked = {"Item": set(), "Supplier": set(), "Customer": set()}
+        self.by_name = {"Item": {}, "Supplier": {}, "Customer": {}}
+
+    @staticmethod
+    def get_key(value):
+        return value.rstrip().casefold()
+
+    def preload(self, tra_docs):
+        """Load everything needed to convert the given TRA TAX Inv documents"""
+        codes, descriptions, suppliers, customers = set(), set(), set(), set()
+        for tra_doc in tra_docs:
+            for tra_item in tra_doc.items:
+                if getattr(tra_item, "mapped_item_code", None):
+                    codes.add(tra_item.mapped_item_code)
+                if tra_item.description:
+                    descriptions.add(tra_item.description)
+            if tra_doc.customer_name:
+                suppliers.add(tra_doc.customer_name)
+            if tra_doc.company_name:
+                customers.add(tra_doc.company_name)
+
+        self.load("Item", codes | descriptions, descriptions)
+        self.load("Supplier", suppliers, suppliers)
+        self.load("Customer", customers, customers)
+
+    def load(self, doctype, codes, names=None):
+        """Load which codes exist and which records carry the given names"""
+        name_field = self.party_name_fields.get(doctype, "item_name")
+
+        codes = {
+            code
+            for code in codes
+            if code and self.get_key(code) not in self.checked[doctype]
+        }
+        if codes:
+            for code in frappe.get_all(
+                doctype, filters={"name": ["in", list(codes)]}, pluck="name"
+            ):
+                self.existing[doctype][self.get_key(code)] = code
+            self.checked[doctype].update(self.get_key(code) for code in codes)
+
+        names = {
+            name
+            for name in names or []
+            if name and self.get_key(name) not in self.by_name[doctype]
+        }
+        if names:
+            for row in frappe.get_all(
+                doctype,
+                filters={name_field: ["in", list(names)]},
+                fields=["name", name_field],
+                order_by="creation asc",
+            ):
+                self.by_name[doctype].setdefault(
+                    self.get_key(row[name_field]), row.name
+                )
+            for name in names:
+                self.by_name[doctype].setdefault(self.get_key(name), None)
+
+    def exists(self, doctype, code):
+        self.load(doctype, [code])
+        return self.get_key(code) in self.existing[doctype]
+
+    def find(self, doctype, name):
+        """Return the code of the record carrying `name` as item/party name, else
+        the code matching `name` if it exists, else None"""
+        self.load(doctype, [name], [name])
+        key = self.get_key(name)
+        return self.by_name[doctype].get(key) or self.existing[doctype].get(key)
+
+    def add(self, doctype, name, code):
+        self.existing[doctype][self.get_key(code)] = code
+        self.checked[doctype].add(self.get_key(code))
+        self.by_name[doctype][self.get_key(name)] = code
+
+
+def get_master_data_resolver():
+    """Return the master data resolver of the current request or job"""
+    if not getattr(frappe.local, "tra_master_data_resolver", None):
+        frappe.local.tra_master_data_resolver = TRAMasterDataResolver()
+    return frappe.local.tra_master_data_resolver
+
+
 def get_or_suggest_item(tra_item):
     """
     Get existing item code based on mapped_item_code or description
@@ -1120,9 +1534,11 @@ def get_or_suggest_item(tra_item):
     Returns:
         str: Item code if found, otherwise the description itself
     """
+    resolver = get_master_data_resolver()
+
     # First priority: Use mapped_item_code if provided
     if hasattr(tra_item, "mapped_item_code") and tra_item.mapped_item_code:
-        if frappe.db.exists("Item", tra_item.mapped_item_code):
+        if resolver.exists("Item", tra_item.mapped_item_code):
             return tra_item.mapped_item_code
         else:
             # Log warning if mapped item doesn't exist
@@ -1134,15 +1550,11 @@ def get_or_suggest_item(tra_item):
     if not tra_item.description:
         return None
 
-    # Try to find existing item by name
-    item_code = frappe.db.get_value("Item", {"item_name": tra_item.description}, "name")
+    # Try to find existing item by name, then exact match on item code
+    item_code = resolver.find("Item", tra_item.description)
     if item_code:
         return item_code
 
-    # Try exact match on item code
-    if frappe.db.exists("Item", tra_item.description):
-        return tra_item.description
-
     # If not found, return the description as item code (validation will catch this)
     return tra_item.description
 
@@ -1160,17 +1572,11 @@ def get_or_create_supplier(supplier_name):
     if not supplier_name:
         return None
 
-    # Try to find existing supplier by name
-    supplier_code = frappe.db.get_value(
-        "Supplier", {"supplier_name": supplier_name}, "name"
-    )
+    # Try to find existing supplier by name, then exact match on supplier code
+    supplier_code = get_master_data_resolver().find("Supplier", supplier_name)
     if supplier_code:
         return supplier_code
 
-    # Try exact match on supplier code
-    if frappe.db.exists("Supplier", supplier_name):
-        return supplier_name
-
     # If not found, create new supplier
     try:
         supplier_doc = frappe.new_doc("Supplier")
@@ -1181,6 +1587,7 @@ def get_or_create_supplier(supplier_name):
         )
         supplier_doc.supplier_type = "Company"
         supplier_doc.insert()
+        get_master_data_resolver().add("Supplier", supplier_name, supplier_doc.name)
 
         frappe.logger().info(f"Auto-created supplier: {supplier_name}")
         return supplier_doc.name
@@ -1204,17 +1611,11 @@ def get_or_suggest_supplier(supplier_name):
     if not supplier_name:
         return None
 
-    # Try to find existing supplier by name
-    supplier_code = frappe.db.get_value(
-        "Supplier", {"supplier_name": supplier_name}, "name"
-    )
+    # Try to find existing supplier by name, then exact match on supplier code
+    supplier_code = get_master_data_resolver().find("Supplier", supplier_name)
     if supplier_code:
         return supplier_code
 
-    # Try exact match on supplier code
-    if frappe.db.exists("Supplier", supplier_name):
-        return supplier_name
-
     # If not found, return the name as supplier code (validation will catch this)
     return supplier_name
 
@@ -1232,17 +1633,11 @@ def get_or_create_customer(customer_name):
     if not customer_name:
         return None
 
-    # Try to find existing customer by name
-    customer_code = frappe.db.get_value(
-        "Customer", {"customer_name": customer_name}, "name"
-    )
+    # Try to find existing customer by name, then exact match on customer code
+    customer_code = get_master_data_resolver().find("Customer", customer_name)
     if customer_code:
         return customer_code
 
-    # Try exact match on customer code
-    if frappe.db.exists("Customer", customer_name):
-        return customer_name
-
     # If not found, create new customer
     try:
         customer_doc = frappe.new_doc("Customer")
@@ -1253,6 +1648,7 @@ def get_or_create_customer(customer_name):
         )
         customer_doc.customer_type = "Company"
         customer_doc.insert()
+        get_master_data_resolver().add("Customer", customer_name, customer_doc.name)
 
         frappe.logger().info(f"Auto-created customer: {customer_name}")
         return customer_doc.name
@@ -1276,16 +1672,10 @@ def get_or_suggest_customer(customer_name):
     if not customer_name:
         return None
 
-    # Try to find existing customer by name
-    customer_code = frappe.db.get_value(
-        "Customer", {"customer_name": customer_name}, "name"
-    )
+    # Try to find existing customer by name, then exact match on customer code
+    customer_code = get_master_data_resolver().find("Customer", customer_name)
     if customer_code:
         return customer_code
 
-    # Try exact match on customer code
-    if frappe.db.exists("Customer", customer_name):
-        return customer_name
-
     # If not found, return the name as customer code (validation will catch this)
     return customer_name
@@ -4,10 +4,32 @@
 import frappe
 import requests
 import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from frappe.utils import cint
+from frappe.utils import cint, create_batch, now_datetime
 from frappe.model.document import Document
 
+TIRA_VERIFY_URL = "https://tiramis.tira.go.tz/covernote/api/public/portal/verify"
+TIRA_HEADERS = {
+	'Accept': 'application/json',
+	'Content-Type': 'application/json'
+}
+TIRA_WORKERS = 8
+TIRA_WRITE_BATCH_SIZE = 200
+
+CHILD_TABLES = {
+	'motor': ('insurance_motors', 'TZ Insurance Vehicle Detail'),
+	'company': ('insurance_provider', 'TZ Insurance Company Detail'),
+	'policyholders': ('policy_holders', 'TZ Insurance Policy Holder Detail'),
+}
+DATE_KEYS = {
+	'motor': ['createddate', 'updateddate'],
+	'company': ['createddate', 'updateddate', 'incorporationdate', 'initialregistrationdate', 'businesscommencementdate'],
+	'policyholders': ['createddate', 'updateddate', 'policyholderbirthdate'],
+	None: ['covernotestartdate', 'covernoteenddate'],
+}
+
 class TZInsuranceCoverNote(Document):
 	pass
 
@@ -18,113 +40,162 @@ def update_covernote_docs():
 	The routine to create or update covernote document runs on 00:00 am, 1st date of every month
 	Forexample:
 		for June: a routine will run on 00:00 am, June 1, 2022
+
+	Vehicles are looked up on a bounded worker pool sharing one session; cover notes
+	whose payload hash has not changed since the last refresh are skipped.
 	"""
 
-	motor_vehicles = frappe.get_all('Vehicle', 'name')
-	
-	for vehicle in motor_vehicles:
-		req = get_covernote_details(vehicle.name)
-		try:
-			for record in req.get('data'):
-				if not frappe.db.exists('TZ Insurance Cover Note', record['coverNoteNumber']):
-					doc = frappe.new_doc('TZ Insurance Cover Note')
-				else:
-					doc = frappe.get_doc('TZ Insurance Cover Note', record['coverNoteNumber'])
-				
-				for key, value in record.items():
-					
-					if key.lower() == 'motor':
-						row = {}
-						doc.insurance_motors = []
-						for motor_child_key, motor_child_value in value.items():
-							motor_new_value = None
-							if motor_child_value and motor_child_key.lower() in ['createddate', 'updateddate']:
-								unix_timestamp_int = cint(motor_child_value)
-								motor_new_value = datetime.utcfromtimestamp((unix_timestamp_int/1000)).strftime('%Y-%m-%d %H:%M:%S')
-							else:
-								motor_new_value = motor_child_value
-							
-							row[motor_child_key.lower()] = motor_new_value
-						
-						doc.append('insurance_motors', row)
-					
-					if key.lower() == 'company':
-						row = {}
-						doc.insurance_provider = []
-						for company_child_key, company_child_value in value.items():
-							company_new_value = None
-							if company_child_value and company_child_key.lower() in ['createddate', 'updateddate', 'incorporationdate', 'initialregistrationdate', 'businesscommencementdate']:
-								unix_timestamp_int = cint(company_child_value)
-								company_new_value = datetime.utcfromtimestamp((unix_timestamp_int/1000)).strftime('%Y-%m-%d %H:%M:%S')
-							
-							elif company_child_key.lower() == 'shareholders':
-								company_new_value = json.dumps(company_child_value)
-							
-							else:
-								company_new_value = company_child_value
-							
-							row[company_child_key.lower()] = company_new_value
-							
-						doc.append('insurance_provider', row)
-					
-					if key.lower() == 'policyholders':
-						doc.policy_holders = []
-						for i, row in enumerate(value):
-							new_row = {}
-							for policy_child_key, policy_child_value in row.items():
-								policy_new_value = None
-								if policy_child_value and policy_child_key.lower() in ['createddate', 'updateddate', 'policyholderbirthdate']:
-									unix_timestamp_int = cint(policy_child_value)
-									policy_new_value = datetime.utcfromtimestamp((unix_timestamp_int/1000)).strftime('%Y-%m-%d %H:%M:%S')
-								
-								else:
-									policy_new_value = policy_child_value
-							
-								new_row[policy_child_key.lower()] = policy_new_value
-							
-							doc.append('policy_holders', new_row)
-					
-					if key.lower() not in ['covernotestartdate', 'covernoteenddate', 'company', 'motor', 'policyholders']:
-						doc.update({key.lower(): value})
-					
-					if key.lower() in ['covernotestartdate', 'covernoteenddate']:
-						unix_timestamp_int = cint(value)
-						date_value = datetime.utcfromtimestamp((unix_timestamp_int/1000.0)).strftime('%Y-%m-%d %H:%M:%S')
-						doc.update({key.lower(): date_value})
-					
-				doc.vehicle = vehicle.name
-				doc.save(ignore_permissions=True)
-		
-		except Exception as e:
-			frappe.log_error(frappe.get_traceback(), str(e))
-	
-	frappe.db.commit()
+	motor_vehicles = frappe.get_all('Vehicle', pluck='name')
+	stored_hashes = dict(frappe.get_all(
+		'TZ Insurance Cover Note', fields=['name', 'payload_hash'], as_list=True
+	))
+
+	with make_tira_session() as session, ThreadPoolExecutor(max_workers=TIRA_WORKERS) as executor:
+		for vehicles in create_batch(motor_vehicles, TIRA_WRITE_BATCH_SIZE):
+			responses = executor.map(lambda vehicle: get_covernote_details(vehicle, session, log_errors=False), vehicles)
+			changed = []
+			for vehicle, (req, error) in zip(vehicles, responses):
+				if error:
+					frappe.log_error(error, 'TIRA cover note lookup failed for {0}'.format(vehicle))
+					continue
+				for record in (req or {}).get('data') or []:
+					try:
+						covernote_number = record['coverNoteNumber']
+						payload_hash = get_payload_hash(record)
+					except Exception:
+						frappe.log_error(frappe.get_traceback(), 'Invalid TIRA cover note for {0}'.format(vehicle))
+						continue
+					if stored_hashes.get(covernote_number) == payload_hash:
+						continue
+					stored_hashes[covernote_number] = payload_hash
+					changed.append((vehicle, record, payload_hash))
+
+			try:
+				write_covernotes(changed)
+				frappe.db.commit()
+			except Exception as e:
+				frappe.db.rollback()
+				frappe.log_error(frappe.get_traceback(), str(e))
+
 	return True
 
-def get_covernote_details(regnumber):
+def make_tira_session():
+	session = requests.Session()
+	session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=TIRA_WORKERS))
+	session.headers.update(TIRA_HEADERS)
+	# TIRA's public portal certificate chain does not validate
+	session.verify = False
+	return session
+
+def get_payload_hash(record):
+	return hashlib.sha256(json.dumps(record, sort_keys=True, default=str).encode()).hexdigest()
+
+def to_datetime_string(value):
+	unix_timestamp_int = cint(value)
+	return datetime.utcfromtimestamp((unix_timestamp_int/1000.0)).strftime('%Y-%m-%d %H:%M:%S')
+
+def parse_child_row(section, row):
+	new_row = {}
+	for key, value in row.items():
+		key = key.lower()
+		if value and key in DATE_KEYS[section]:
+			value = to_datetime_string(value)
+		elif section == 'company' and key == 'shareholders':
+			value = json.dumps(value)
+		new_row[key] = value
+	return new_row
+
+def parse_covernote(record):
+	"""Split a TIRA cover note into parent values and child rows per table field"""
+	values = {}
+	children = {table_field: [] for table_field, child_doctype in CHILD_TABLES.values()}
+	for key, value in record.items():
+		key = key.lower()
+		if key in CHILD_TABLES:
+			rows = value if isinstance(value, list) else [value]
+			children[CHILD_TABLES[key][0]] = [parse_child_row(key, row) for row in rows if row]
+		elif key in DATE_KEYS[None]:
+			values[key] = to_datetime_string(value)
+		else:
+			values[key] = value
+	return values, children
+
+def write_covernotes(changed):
+	"""Write changed cover notes, replacing their child rows with one delete and
+	one bulk insert per child doctype"""
+	if not changed:
+		return
+
+	doctype = 'TZ Insurance Cover Note'
+	parent_columns = set(frappe.get_meta(doctype).get_valid_columns())
+	child_columns = {
+		table_field: set(frappe.get_meta(child_doctype).get_valid_columns())
+		for table_field, child_doctype in CHILD_TABLES.values()
+	}
+	names = [record['coverNoteNumber'] for vehicle, record, payload_hash in changed]
+	existing = set(frappe.get_all(doctype, filters={'name': ['in', names]}, pluck='name'))
+	timestamp = now_datetime()
+	user = frappe.session.user
+
+	new_parents = []
+	child_rows = {table_field: [] for table_field in child_columns}
+	for vehicle, record, payload_hash in changed:
+		values, children = parse_covernote(record)
+		values = {key: value for key, value in values.items() if key in parent_columns}
+		values.update({'vehicle': vehicle, 'payload_hash': payload_hash})
+		name = record['coverNoteNumber']
+		if name in existing:
+			frappe.db.set_value(doctype, name, values)
+		else:
+			existing.add(name)
+			values.update({'name': name, 'creation': timestamp, 'modified': timestamp, 'owner': user, 'modified_by': user})
+			new_parents.append(values)
+
+		for table_field, rows in children.items():
+			for idx, row in enumerate(rows, 1):
+				row = {key: value for key, value in row.items() if key in child_columns[table_field]}
+				row.update({
+					'name': frappe.generate_hash(length=10), 'parent': name, 'parenttype': doctype,
+					'parentfield': table_field, 'idx': idx, 'creation': timestamp, 'modified': timestamp,
+					'owner': user, 'modified_by': user,
+				})
+				child_rows[table_field].append(row)
+
+	bulk_insert_rows(doctype, new_parents)
+	for table_field, child_doctype in CHILD_TABLES.values():
+		frappe.db.delete(child_doctype, {'parent': ['in', names], 'parenttype': doctype})
+		bulk_insert_rows(child_doctype, child_rows[table_field])
+
+def bulk_insert_rows(doctype, rows):
+	if not rows:
+		return
+	fields = sorted({key for row in rows for key in row})
+	frappe.db.bulk_insert(doctype, fields, [[row.get(field) for field in fields] for row in rows])
+
+def get_covernote_details(regnumber, session=None, log_errors=True):
 	"""Fetch motor insurance details from tira
 
 	:param regnumber: car registration number
+	:param session: shared `requests.Session`, a one-off session is used if not given
+	:param log_errors: log failures to Error Log instead of returning them, must be
+		False when called from worker threads
 	"""
-	url = "https://tiramis.tira.go.tz/covernote/api/public/portal/verify"
-
 	payload = json.dumps({
-        "paramType": 2,
-        "searchParam": regnumber
-    })
-	headers = {
-        'Accept': 'application/json',
-        'Content-Type': 'application/json'
-    }
+		"paramType": 2,
+		"searchParam": regnumber
+	})
 
 	try:
-		response = requests.post(url, headers=headers, data=payload, timeout=3000, verify=False)
+		response = (session or make_tira_session()).post(TIRA_VERIFY_URL, data=payload, timeout=(10, 60))
 		if response.status_code == 200:
-			return json.loads(response.text)
+			result = json.loads(response.text), None
 		else:
-			frappe.log_error(response.text, str(response.status_code))
-
+			result = None, '{0}: {1}'.format(response.status_code, response.text)
 	except Exception as e:
-		frappe.log_error(frappe.get_traceback(), str(e))
-
+		result = None, str(e)
 
+	if not log_errors:
+		return result
+	if result[1]:
+		frappe.log_error(result[1], 'TIRA cover note lookup failed for {0}'.format(regnumber))
+	return result[0]
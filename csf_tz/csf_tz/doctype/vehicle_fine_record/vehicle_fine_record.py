@@ -12,7 +12,12 @@ from bs4 import BeautifulSoup
 from csf_tz.custom_api import print_out
 import re
 import json
-from time import sleep
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep, monotonic
+from frappe.utils import now_datetime, get_datetime, add_to_date
+from csf_tz.utils.background_job import start_chunked_job
+from csf_tz.utils.settings import get_csf_tz_settings
 
 
 class VehicleFineRecord(Document):
@@ -40,45 +45,203 @@ class VehicleFineRecord(Document):
             )
 
 
-def check_fine_all_vehicles(batch_size=20):
-    plate_list = frappe.get_all(
+FINE_CHECK_URL = "https://tms.tpf.go.tz/api/OffenceCheck"
+FINE_CHECK_HEADERS = {"Content-Type": "application/json", "Accept": "application/json"}
+FINE_CHECK_CACHE_KEY = "vehicle_fine_last_clean_check"
+
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_WORKERS = 4
+DEFAULT_REQUESTS_PER_SECOND = 2
+
+
+class RateLimiter:
+    """Spaces calls evenly so that at most `rate` calls per second are made
+    across all threads sharing the limiter."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_slot = monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            sleep(slot - now)
+
+
+def get_fine_sync_settings():
+    settings = frappe._dict(
+        batch_size=DEFAULT_BATCH_SIZE,
+        workers=DEFAULT_WORKERS,
+        requests_per_second=DEFAULT_REQUESTS_PER_SECOND,
+        freshness_minutes=0,
+    )
+    values = get_csf_tz_settings()
+    if values.enable_sync:
+        settings.batch_size = values.batch_size or DEFAULT_BATCH_SIZE
+        settings.freshness_minutes = values.sync_interval or 0
+        settings.workers = values.fine_check_workers or DEFAULT_WORKERS
+        settings.requests_per_second = (
+            values.fine_check_requests_per_second or DEFAULT_REQUESTS_PER_SECOND
+        )
+    return settings
+
+
+def make_fine_check_session(workers):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1, pool_maxsize=max(workers, 1)
+    )
+    session.mount("https://", adapter)
+    session.headers.update(FINE_CHECK_HEADERS)
+    return session
+
+
+def fetch_pending_fines(session, limiter, vehicle):
+    """Query TPF for one vehicle. Runs inside worker threads, so it must not
+    touch the database."""
+    limiter.wait()
+    try:
+        response = session.post(FINE_CHECK_URL, json={"vehicle": vehicle}, timeout=10)
+        response.raise_for_status()
+        return vehicle, response.json().get("pending_transactions") or [], None
+    except Exception as e:
+        return vehicle, None, str(e)
+
+
+def check_fine_all_vehicles():
+    settings = get_fine_sync_settings()
+    vehicles = {}
+    for vehicle in frappe.get_all(
         "Vehicle", fields=["name", "number_plate"], limit_page_length=0
+    ):
+        plate = vehicle.number_plate or vehicle.name
+        if plate and len(plate) >= 7:
+            vehicles[plate] = vehicle.name
+
+    plates = list(vehicles)
+    if settings.freshness_minutes:
+        fresh_after = add_to_date(now_datetime(), minutes=-settings.freshness_minutes)
+        last_clean_checks = frappe.cache().hgetall(FINE_CHECK_CACHE_KEY) or {}
+        plates = [
+            plate
+            for plate in plates
+            if not last_clean_checks.get(plate)
+            or get_datetime(last_clean_checks[plate]) < fresh_after
+        ]
+
+    # a run still going from the last schedule is left to finish
+    start_chunked_job(
+        "csf_tz.csf_tz.doctype.vehicle_fine_record.vehicle_fine_record.check_fines",
+        [[plate, vehicles[plate]] for plate in plates],
+        job_key="check_fine_all_vehicles",
+        queue="long",
+        chunk_size=settings.batch_size,
     )
-    all_fine_list = []
-    total_vehicles = len(plate_list)
-
-    for i in range(0, total_vehicles, batch_size):
-        batch_vehicles = plate_list[i : i + batch_size]
-        for vehicle in batch_vehicles:
-            # Enqueue get_fine(number_plate=vehicle["number_plate"] or vehicle["name"])
-            frappe.enqueue(
-                "csf_tz.csf_tz.doctype.vehicle_fine_record.vehicle_fine_record.get_fine",
-                number_plate=vehicle["number_plate"] or vehicle["name"],
+
+
+def check_fines(vehicles):
+    """Chunk handler of `check_fine_all_vehicles`, `vehicles` are [number plate, Vehicle] pairs"""
+    settings = get_fine_sync_settings()
+    vehicles = dict(vehicles)
+    limiter = RateLimiter(settings.requests_per_second)
+    with make_fine_check_session(settings.workers) as session, ThreadPoolExecutor(
+        max_workers=settings.workers
+    ) as executor:
+        results = list(
+            executor.map(
+                lambda plate: fetch_pending_fines(session, limiter, plate), vehicles
             )
+        )
+    update_fine_records(results, vehicles)
+    return [vehicle for vehicle, fines, error in results if error]
 
-            fine_list = []
-            # fine_list = get_fine(
-            #     number_plate=vehicle["number_plate"] or vehicle["name"]
-            # )
-            if fine_list and len(fine_list) > 0:
-                all_fine_list.extend(fine_list)
-            sleep(2)  # Sleep to avoid hitting the server too frequently
 
-    # Get all the references that are not paid
-    reference_list = frappe.get_all(
-        "Vehicle Fine Record",
-        filters={"status": ["!=", "PAID"], "reference": ["not in", all_fine_list]},
-    )
+def update_fine_records(results, vehicles=None):
+    """Upsert the pending fines returned by TPF and mark the records of the
+    checked vehicles that are no longer pending as PAID."""
+    vehicles = vehicles or {}
+    valid_columns = set(frappe.get_meta("Vehicle Fine Record").get_valid_columns())
+    pending = {}
+    checked_vehicles = []
+    clean_vehicles = []
+    for vehicle, fines, error in results:
+        if error:
+            frappe.log_error(
+                title=_("Vehicle fine check failed for {0}").format(vehicle),
+                message=error,
+            )
+            continue
+        checked_vehicles.append(vehicle)
+        if not fines:
+            clean_vehicles.append(vehicle)
+        for fine in fines:
+            if not fine.get("reference"):
+                continue
+            row = {key: value for key, value in fine.items() if key in valid_columns}
+            row.setdefault("vehicle", vehicle)
+            if vehicles.get(vehicle):
+                row["vehicle_doc"] = vehicles[vehicle]
+            pending[row["reference"]] = row
 
-    for i in range(0, len(reference_list), batch_size):
-        batch_references = reference_list[i : i + batch_size]
-        for reference in batch_references:
-            # Enqueue get_fine(reference=reference["name"])
-            frappe.enqueue(
-                "csf_tz.csf_tz.doctype.vehicle_fine_record.vehicle_fine_record.get_fine",
-                reference=reference["vehicle"],
+    if pending:
+        existing = {
+            row.name: row
+            for row in frappe.get_all(
+                "Vehicle Fine Record",
+                filters={"name": ["in", list(pending)]},
+                fields=["name", "status", "total"],
             )
-            sleep(2)  # Sleep to avoid hitting the server too frequently
+        }
+        new_rows = [row for reference, row in pending.items() if reference not in existing]
+        for reference, row in pending.items():
+            current = existing.get(reference)
+            if current and (
+                current.status != row.get("status")
+                or current.total != row.get("total")
+            ):
+                frappe.db.set_value("Vehicle Fine Record", reference, row)
+        insert_fine_records(new_rows)
+
+    if checked_vehicles:
+        vfr = frappe.qb.DocType("Vehicle Fine Record")
+        query = (
+            frappe.qb.update(vfr)
+            .set(vfr.status, "PAID")
+            .set(vfr.modified, now_datetime())
+            .where(vfr.vehicle.isin(checked_vehicles))
+            .where(vfr.status != "PAID")
+        )
+        if pending:
+            query = query.where(vfr.name.notin(list(pending)))
+        query.run()
+
+    if clean_vehicles:
+        checked_at = str(now_datetime())
+        for vehicle in clean_vehicles:
+            frappe.cache().hset(FINE_CHECK_CACHE_KEY, vehicle, checked_at)
+
+
+def insert_fine_records(rows):
+    if not rows:
+        return
+    fields = sorted({key for row in rows for key in row})
+    timestamp = now_datetime()
+    user = frappe.session.user
+    values = [
+        [row["reference"], timestamp, timestamp, user, user, 0]
+        + [row.get(field) for field in fields]
+        for row in rows
+    ]
+    frappe.db.bulk_insert(
+        "Vehicle Fine Record",
+        ["name", "creation", "modified", "owner", "modified_by", "docstatus"] + fields,
+        values,
+        ignore_duplicates=True,
+    )
 
 
 @frappe.whitelist()
@@ -101,36 +264,16 @@ def get_fine(number_plate=None, reference=None):
         )
         return
 
-    fine_list = []
-    url = "https://tms.tpf.go.tz/api/OffenceCheck"
-    headers = {"Content-Type": "application/json", "Accept": "application/json"}
-
-    payload = {"vehicle": number_plate or reference}
-
-    try:
-        sleep(2)  # Sleep to avoid hitting the server too frequently
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        frappe.log_error("HTTP error", str(e))
-        frappe.throw(f"Error contacting traffic system: {str(e)}")
-
-    try:
-        result = response.json()
-    except Exception as e:
-        frappe.log_error("Invalid JSON", str(e))
-        frappe.throw("Invalid response format from traffic system")
-
-    data = result.get("pending_transactions", [])
-
-    if data:
-        print(f"Vehicle: {number_plate or reference} has no pending transactions")
-        return fine_list
-    else:
-        if frappe.db.exists("Vehicle Fine Record", payload):
-            doc = frappe.get_doc("Vehicle Fine Record", payload)
-            doc.status = "PAID"
-            doc.save()
+    vehicle = number_plate or reference
+    with make_fine_check_session(1) as session:
+        result = fetch_pending_fines(
+            session, RateLimiter(DEFAULT_REQUESTS_PER_SECOND), vehicle
+        )
+    if result[2]:
+        frappe.log_error("HTTP error", result[2])
+        frappe.throw(f"Error contacting traffic system: {result[2]}")
 
+    vehicle_name = frappe.get_value("Vehicle", {"number_plate": vehicle}, "name")
+    update_fine_records([result], {vehicle: vehicle_name} if vehicle_name else None)
     frappe.db.commit()
-    return fine_list
+    return result[1]
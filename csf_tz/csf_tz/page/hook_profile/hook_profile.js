@@ -0,0 +1,68 @@
+frappe.pages['hook-profile'].on_page_load = function (wrapper) {
+	var page = frappe.ui.make_app_page({
+		parent: wrapper,
+		title: __('Hook Profile'),
+		single_column: true
+	});
+
+	var $body = $('<div class="hook-profile"></div>').appendTo(page.main);
+	var measures = [
+		['wall_ms', __('Wall (ms)')],
+		['queries', __('Queries')],
+		['rows_read', __('Rows Read')]
+	];
+	var percentiles = [50, 95, 99];
+
+	var render = function (rows) {
+		if (!rows.length) {
+			$body.html(`<p class="text-muted" style="padding: 15px;">${__('No samples yet. Enable Hook Profiling in CSF TZ Settings.')}</p>`);
+			return;
+		}
+		var head = measures.map(([, label]) =>
+			percentiles.map(p => `<th class="text-right">${label} p${p}</th>`).join('')
+		).join('');
+		var body = rows.map(row => {
+			var cells = measures.map(([measure]) =>
+				percentiles.map(p => {
+					var value = row[`${measure}_p${p}`];
+					return `<td class="text-right">${value == null ? '' : format_number(value, null, measure == 'wall_ms' ? 1 : 0)}</td>`;
+				}).join('')
+			).join('');
+			return `<tr>
+				<td>${frappe.utils.escape_html(row.doctype)}</td>
+				<td>${frappe.utils.escape_html(row.event || '')}</td>
+				<td><code>${frappe.utils.escape_html(row.handler)}</code></td>
+				<td class="text-right">${row.samples}</td>
+				${cells}
+			</tr>`;
+		}).join('');
+		$body.html(`<div class="table-responsive">
+			<table class="table table-bordered table-condensed">
+				<thead><tr>
+					<th>${__('DocType')}</th><th>${__('Event')}</th><th>${__('Handler')}</th>
+					<th class="text-right">${__('Samples')}</th>${head}
+				</tr></thead>
+				<tbody>${body}</tbody>
+			</table>
+		</div>`);
+	};
+
+	var refresh = function () {
+		frappe.call({
+			method: 'csf_tz.utils.hook_profiler.get_hook_profile',
+			callback: r => render(r.message || [])
+		});
+	};
+
+	page.set_primary_action(__('Refresh'), refresh, 'refresh');
+	page.set_secondary_action(__('Clear Samples'), function () {
+		frappe.confirm(__('Drop all recorded samples?'), function () {
+			frappe.call({
+				method: 'csf_tz.utils.hook_profiler.clear_hook_profile',
+				callback: refresh
+			});
+		});
+	});
+
+	refresh();
+}
@@ -1,29 +1,130 @@
 from __future__ import unicode_literals
 import frappe
 from frappe import _
+from frappe.utils import cint, now_datetime
 import json
 from csf_tz import console
 
 
+OPEN_STATUSES = ["Open", "Work In Progress", "Material Transferred", "On Hold", "Submitted"]
+BOARD_FIELDS = [
+    "name",
+    "status",
+    "docstatus",
+    "company",
+    "operation",
+    "work_order",
+    "production_item",
+    "for_quantity",
+    "total_completed_qty",
+    "job_started",
+    "started_time",
+    "current_time",
+    "modified",
+]
+TIME_LOG_FIELDS = [
+    "name",
+    "parent",
+    "employee",
+    "from_time",
+    "to_time",
+    "time_in_mins",
+    "completed_qty",
+]
+BOARD_EVENT = "job_card_board_update"
+
+
 @frappe.whitelist()
 def get_job_cards():
-    data = frappe.get_list(
+    return get_job_card_board(page_length=0)["job_cards"]
+
+
+@frappe.whitelist()
+def get_job_card_board(modified_since=None, start=0, page_length=500):
+    """
+    Open job cards for the Job Cards page with their operation, work order image and time logs
+
+    With `modified_since` only the cards changed after that time are returned, cards
+    that left the board since then (submitted, cancelled, deleted or completed) are
+    listed in `removed`.
+    """
+    # taken before querying, a card saved while the board is read is returned by the next poll
+    server_time = now_datetime()
+    filters = {"docstatus": 0, "status": ["in", OPEN_STATUSES]}
+    if modified_since:
+        filters = {"modified": [">", modified_since]}
+
+    cards = frappe.get_list(
         "Job Card",
+        filters=filters,
+        fields=BOARD_FIELDS,
+        limit_start=cint(start),
+        limit_page_length=cint(page_length),
+        order_by="name",
+    )
+
+    removed = []
+    if modified_since:
+        removed = [
+            card.name
+            for card in cards
+            if card.docstatus != 0 or card.status not in OPEN_STATUSES
+        ]
+        cards = [card for card in cards if card.name not in removed]
+        removed += get_deleted_job_cards(modified_since)
+
+    if not cards:
+        return {"job_cards": cards, "removed": removed, "server_time": server_time}
+
+    operations = {
+        operation.name: operation
+        for operation in frappe.get_all(
+            "Operation",
+            filters={"name": ["in", list({card.operation for card in cards})]},
+            fields=["name", "description", "image"],
+        )
+    }
+    work_order_images = dict(
+        frappe.get_all(
+            "Work Order",
+            filters={"name": ["in", list({card.work_order for card in cards})]},
+            fields=["name", "image"],
+            as_list=True,
+        )
+    )
+    time_logs = {}
+    for time_log in frappe.get_all(
+        "Job Card Time Log",
         filters={
-            "status": ["in", ["Open", "Work In Progress", "Material Transferred", "On Hold", "Submitted"]],
-            "docstatus": 0,
+            "parent": ["in", [card.name for card in cards]],
+            "parenttype": "Job Card",
         },
-        fields=["*"],
-        limit_page_length=0,
-        order_by='name'
+        fields=TIME_LOG_FIELDS,
+        order_by="idx",
+    ):
+        time_logs.setdefault(time_log.pop("parent"), []).append(time_log)
+
+    for card in cards:
+        card["operation"] = operations.get(card.operation) or {"name": card.operation}
+        card["work_order_image"] = work_order_images.get(card.work_order)
+        card["time_logs"] = time_logs.get(card.name, [])
+
+    return {"job_cards": cards, "removed": removed, "server_time": server_time}
+
+
+def get_deleted_job_cards(modified_since):
+    return frappe.get_all(
+        "Deleted Document",
+        filters={"deleted_doctype": "Job Card", "creation": [">", modified_since]},
+        pluck="deleted_name",
+    )
+
+
+def publish_board_update(doc, method=None):
+    """Tell open Job Cards pages that a card changed so they fetch the delta"""
+    frappe.publish_realtime(
+        BOARD_EVENT, {"name": doc.name}, doctype="Job Card", after_commit=True
     )
-    for card in data:
-        card["operation"] = frappe.get_doc("Operation", card.operation)
-        card["work_order_image"] = frappe.get_value(
-            "Work Order", card.work_order, "image")
-        card["time_logs"] = frappe.get_all("Job Card Time Log", filters={
-                                           "parent": card.name}, fields=["*"])
-    return data
 
 
 @frappe.whitelist()
@@ -4,8 +4,9 @@
 from __future__ import unicode_literals
 import frappe, erpnext
 from frappe import _, scrub
-from frappe.utils import getdate, nowdate, flt, cint, formatdate, cstr, now, time_diff_in_seconds
+from frappe.utils import getdate, nowdate, flt, cint, formatdate, cstr, now, time_diff_in_seconds, create_batch
 from collections import OrderedDict
+from bisect import bisect_left
 from erpnext.accounts.utils import get_currency_precision
 from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import get_accounting_dimensions, get_dimension_with_children
 
@@ -24,6 +25,9 @@ from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import g
 #  9. Report amounts are in "Party Currency" if party is selected, or company currency for multi-party
 # 10. This reports is based on all GL Entries that are made against account_type "Receivable" or "Payable"
 
+# names per IN list when prefetching details of the vouchers and parties in the report
+BATCH_SIZE = 1000
+
 def execute(filters=None):
 	args = {
 		"party_type": "Customer",
@@ -82,6 +86,12 @@ class ReceivablePayableReport(object):
 		# Get return entries
 		self.get_return_entries()
 
+		# currency and amount of foreign currency invoices, payment terms and party details,
+		# one query per doctype instead of one per row
+		self.get_invoice_foreign_amounts()
+		self.get_payment_terms_map()
+		self.get_party_details_map()
+
 		self.data = []
 		for gle in self.gl_entries:
 			self.update_voucher_balance(gle)
@@ -162,7 +172,7 @@ class ReceivablePayableReport(object):
 				row.paid -= gle_balance
 		if row.account_currency != self.company_currency:
 			if row.voucher_type in ["Sales Invoice","Purchase Invoice"]:
-				row.foreign_currency, row.foreign_amount = frappe.get_value(row.voucher_type, row.voucher_no, ["currency","rounded_total"]) or ""
+				row.foreign_currency, row.foreign_amount = self.invoice_foreign_amounts.get(row.voucher_no) or ("", 0.0)
 			elif row.voucher_type in ["Payment Entry","Journal Entry"]:
 				row.foreign_amount = gle.credit_in_account_currency or gle.debit_in_account_currency
 				row.foreign_currency = row.account_currency
@@ -302,45 +312,65 @@ class ReceivablePayableReport(object):
 
 	def get_invoice_details(self):
 		self.invoice_details = frappe._dict()
-		if self.party_type == "Customer":
-			si_list = frappe.db.sql("""
-				select name, due_date, po_no
-				from `tabSales Invoice`
-				where posting_date <= %s
-			""",self.filters.report_date, as_dict=1)
-			for d in si_list:
-				self.invoice_details.setdefault(d.name, d)
-
-			# Get Sales Team
-			if self.filters.show_sales_person:
-				sales_team = frappe.db.sql("""
-					select parent, sales_person
-					from `tabSales Team`
-					where parenttype = 'Sales Invoice'
-				""", as_dict=1)
-				for d in sales_team:
-					self.invoice_details.setdefault(d.parent, {})\
-						.setdefault('sales_team', []).append(d.sales_person)
-
-		if self.party_type == "Supplier":
-			for pi in frappe.db.sql("""
+		# only the vouchers in the report
+		voucher_nos = list({gle.voucher_no for gle in self.gl_entries})
+
+		for batch in create_batch(voucher_nos, BATCH_SIZE):
+			batch = tuple(batch)
+			if self.party_type == "Customer":
+				si_list = frappe.db.sql("""
+					select name, due_date, po_no
+					from `tabSales Invoice`
+					where posting_date <= %s and name in %s
+				""", (self.filters.report_date, batch), as_dict=1)
+				for d in si_list:
+					self.invoice_details.setdefault(d.name, d)
+
+				# Get Sales Team
+				if self.filters.show_sales_person:
+					sales_team = frappe.db.sql("""
+						select parent, sales_person
+						from `tabSales Team`
+						where parenttype = 'Sales Invoice' and parent in %s
+					""", (batch,), as_dict=1)
+					for d in sales_team:
+						self.invoice_details.setdefault(d.parent, {})\
+							.setdefault('sales_team', []).append(d.sales_person)
+
+			if self.party_type == "Supplier":
+				for pi in frappe.db.sql("""
+					select name, due_date, bill_no, bill_date
+					from `tabPurchase Invoice`
+					where posting_date <= %s and name in %s
+				""", (self.filters.report_date, batch), as_dict=1):
+					self.invoice_details.setdefault(pi.name, pi)
+
+			# Invoices booked via Journal Entries
+			journal_entries = frappe.db.sql("""
 				select name, due_date, bill_no, bill_date
-				from `tabPurchase Invoice`
-				where posting_date <= %s
-			""", self.filters.report_date, as_dict=1):
-				self.invoice_details.setdefault(pi.name, pi)
-
-		# Invoices booked via Journal Entries
-		journal_entries = frappe.db.sql("""
-			select name, due_date, bill_no, bill_date
-			from `tabJournal Entry`
-			where posting_date <= %s
-				and voucher_type != "Exchange Rate Revaluation"
-		""", self.filters.report_date, as_dict=1)
-
-		for je in journal_entries:
-			if je.bill_no:
-				self.invoice_details.setdefault(je.name, je)
+				from `tabJournal Entry`
+				where posting_date <= %s and name in %s
+					and voucher_type != "Exchange Rate Revaluation"
+			""", (self.filters.report_date, batch), as_dict=1)
+
+			for je in journal_entries:
+				if je.bill_no:
+					self.invoice_details.setdefault(je.name, je)
+
+	def get_invoice_foreign_amounts(self):
+		# {invoice: (currency, rounded_total)} of the invoices booked in a foreign currency account
+		self.invoice_foreign_amounts = {}
+		invoices_by_doctype = {}
+		for row in self.voucher_balance.values():
+			if row.voucher_type in ("Sales Invoice", "Purchase Invoice") \
+				and row.account_currency != self.company_currency:
+					invoices_by_doctype.setdefault(row.voucher_type, set()).add(row.voucher_no)
+
+		for doctype, invoices in invoices_by_doctype.items():
+			for batch in create_batch(list(invoices), BATCH_SIZE):
+				for d in frappe.get_all(doctype, filters={"name": ["in", batch]},
+					fields=["name", "currency", "rounded_total"]):
+						self.invoice_foreign_amounts[d.name] = (d.currency, d.rounded_total)
 
 	def set_party_details(self, row):
 		# customer / supplier name
@@ -365,18 +395,34 @@ class ReceivablePayableReport(object):
 
 		row.payment_terms = sorted(row.payment_terms, key=lambda x: x['due_date'])
 
+	def get_payment_terms_map(self):
+		# payment schedules of all invoices in the report, by invoice
+		self.payment_terms_map = {}
+		if not self.filters.based_on_payment_terms:
+			return
+
+		invoices_by_doctype = {}
+		for row in self.voucher_balance.values():
+			if self.is_invoice(row):
+				invoices_by_doctype.setdefault(row.voucher_type, set()).add(row.voucher_no)
+
+		for doctype, invoices in invoices_by_doctype.items():
+			for batch in create_batch(list(invoices), BATCH_SIZE):
+				for d in frappe.db.sql("""
+					select
+						si.name, si.party_account_currency, si.currency, si.conversion_rate,
+						ps.due_date, ps.payment_amount, ps.description, ps.paid_amount
+					from `tab{0}` si, `tabPayment Schedule` ps
+					where
+						si.name = ps.parent and
+						si.name in %s
+					order by si.name, ps.paid_amount desc, due_date
+				""".format(doctype), (tuple(batch),), as_dict = 1):
+					self.payment_terms_map.setdefault(d.name, []).append(d)
+
 	def get_payment_terms(self, row):
 		# build payment_terms for row
-		payment_terms_details = frappe.db.sql("""
-			select
-				si.name, si.party_account_currency, si.currency, si.conversion_rate,
-				ps.due_date, ps.payment_amount, ps.description, ps.paid_amount
-			from `tab{0}` si, `tabPayment Schedule` ps
-			where
-				si.name = ps.parent and
-				si.name = %s
-			order by ps.paid_amount desc, due_date
-		""".format(row.voucher_type), row.voucher_no, as_dict = 1)
+		payment_terms_details = self.payment_terms_map.get(row.voucher_no, [])
 
 
 		original_row = frappe._dict(row)
@@ -525,9 +571,14 @@ class ReceivablePayableReport(object):
 		party_field = scrub(self.filters.party_type)
 		if self.filters.get(party_field):
 			filters.update({party_field: self.filters.get(party_field)})
-		self.return_entries = frappe._dict(
-			frappe.get_all(doctype, filters, ['name', 'return_against'], as_list=1)
-		)
+
+		# only the invoices payments in the report are made against
+		against_vouchers = list({gle.against_voucher for gle in self.gl_entries
+			if gle.against_voucher_type == doctype and gle.against_voucher})
+		self.return_entries = frappe._dict()
+		for batch in create_batch(against_vouchers, BATCH_SIZE):
+			self.return_entries.update(frappe.get_all(doctype, dict(filters, name=["in", batch]),
+				['name', 'return_against'], as_list=1))
 
 	def set_ageing(self, row):
 		if self.filters.ageing_based_on == "Due Date":
@@ -550,18 +601,16 @@ class ReceivablePayableReport(object):
 		if not (self.age_as_on and entry_date):
 			return
 
-		row.age = (getdate(self.age_as_on) - getdate(entry_date)).days or 0
-		index = None
-
-		if not (self.filters.range1 and self.filters.range2 and self.filters.range3 and self.filters.range4):
-			self.filters.range1, self.filters.range2, self.filters.range3, self.filters.range4 = 30, 60, 90, 120
+		row.age = (self.age_as_on - getdate(entry_date)).days or 0
 
-		for i, days in enumerate([self.filters.range1, self.filters.range2, self.filters.range3, self.filters.range4]):
-			if row.age <= days:
-				index = i
-				break
+		if not hasattr(self, "ageing_ranges"):
+			if not (self.filters.range1 and self.filters.range2 and self.filters.range3 and self.filters.range4):
+				self.filters.range1, self.filters.range2, self.filters.range3, self.filters.range4 = 30, 60, 90, 120
+			self.ageing_ranges = [cint(self.filters.range1), cint(self.filters.range2),
+				cint(self.filters.range3), cint(self.filters.range4)]
 
-		if index is None: index = 4
+		# first range whose upper limit is not below the age, the last range if none
+		index = bisect_left(self.ageing_ranges, row.age)
 		row['range' + str(index+1)] = row.outstanding
 
 	def get_gl_entries(self):
@@ -712,6 +761,18 @@ class ReceivablePayableReport(object):
 		if gle.voucher_type in ('Sales Invoice', 'Purchase Invoice'):
 			return True
 
+	def get_party_details_map(self):
+		# details of all parties in the report, misses are left to get_party_details
+		if self.party_type == 'Customer':
+			fields = ['name', 'customer_name', 'territory', 'customer_group', 'customer_primary_contact']
+		else:
+			fields = ['name', 'supplier_name', 'supplier_group']
+
+		parties = list({row.party for row in self.voucher_balance.values()})
+		for batch in create_batch(parties, BATCH_SIZE):
+			for d in frappe.get_all(self.party_type, filters={'name': ['in', batch]}, fields=fields):
+				self.party_details[d.pop('name')] = d
+
 	def get_party_details(self, party):
 		if not party in self.party_details:
 			if self.party_type == 'Customer':
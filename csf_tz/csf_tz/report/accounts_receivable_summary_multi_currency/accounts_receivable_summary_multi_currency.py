@@ -142,6 +142,7 @@ class AccountsReceivableSummary(ReceivablePayableReport):
 		data = []
 
 		partywise_total = self.get_partywise_total(party_naming_by, args)
+		self.parties = set(partywise_total)
 
 		partywise_advance_amount = get_partywise_advanced_payment_amount([args.get("party_type")],
 			self.filters.get("report_date")) or {}
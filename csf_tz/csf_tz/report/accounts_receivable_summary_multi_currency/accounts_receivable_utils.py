@@ -4,7 +4,11 @@
 from __future__ import unicode_literals
 import frappe
 from frappe import _, scrub
-from frappe.utils import getdate, nowdate, flt, cint, formatdate, cstr
+from frappe.utils import getdate, nowdate, flt, cint, formatdate, cstr, create_batch
+from bisect import bisect_left
+
+# names per IN list when prefetching details of the parties and vouchers in the report
+BATCH_SIZE = 1000
 
 class ReceivablePayableReport(object):
 	def __init__(self, filters=None):
@@ -175,21 +179,26 @@ class ReceivablePayableReport(object):
 		self.currency_precision = get_currency_precision() or 2
 		self.dr_or_cr = "debit" if args.get("party_type") == "Customer" else "credit"
 
-		future_vouchers = self.get_entries_after(self.filters.report_date, args.get("party_type"))
+		future_vouchers = set(self.get_entries_after(self.filters.report_date, args.get("party_type")))
 
 		if not self.filters.get("company"):
 			self.filters["company"] = frappe.db.get_single_value('Global Defaults', 'default_company')
 
 		self.company_currency = frappe.get_cached_value('Company',  self.filters.get("company"), "default_currency")
-
-		return_entries = self.get_return_entries(args.get("party_type"))
+		self.ageing_ranges = [cint(self.filters.range1), cint(self.filters.range2),
+			cint(self.filters.range3), cint(self.filters.range4)]
 
 		data = []
 		self.pdc_details = get_pdc_details(args.get("party_type"), self.filters.report_date)
 		gl_entries_data = self.get_entries_till(self.filters.report_date, args.get("party_type"))
 
+		# everything below is fetched once for the parties and vouchers in these entries
+		voucher_nos = list({d.voucher_no for d in gl_entries_data})
+		self.parties = {d.party for d in gl_entries_data}
+		self.gl_entries_map = self.get_gl_entries_map(gl_entries_data)
+		return_entries = self.get_return_entries(args.get("party_type"), voucher_nos)
+
 		if gl_entries_data:
-			voucher_nos = [d.voucher_no for d in gl_entries_data] or []
 			dn_details = get_dn_details(args.get("party_type"), voucher_nos)
 			self.voucher_details = get_voucher_details(args.get("party_type"), voucher_nos, dn_details)
 
@@ -331,8 +340,7 @@ class ReceivablePayableReport(object):
 		else:
 			entry_date = gle.posting_date
 
-		row += get_ageing_data(cint(self.filters.range1), cint(self.filters.range2),
-			cint(self.filters.range3), cint(self.filters.range4), self.age_as_on, entry_date, outstanding_amount)
+		row += get_ageing_data(self.ageing_ranges, self.age_as_on, entry_date, outstanding_amount)
 
 		# issue 6371-Ageing buckets should not have amounts if due date is not reached
 		if self.filters.ageing_based_on == "Due Date" \
@@ -399,10 +407,13 @@ class ReceivablePayableReport(object):
 		)
 
 	@staticmethod
-	def get_return_entries(party_type):
+	def get_return_entries(party_type, voucher_nos):
 		doctype = "Sales Invoice" if party_type=="Customer" else "Purchase Invoice"
-		return_entries = frappe._dict(frappe.get_all(doctype,
-			filters={"is_return": 1, "docstatus": 1}, fields=["name", "return_against"], as_list=1))
+		return_entries = frappe._dict()
+		for batch in create_batch(voucher_nos, BATCH_SIZE):
+			return_entries.update(frappe.get_all(doctype,
+				filters={"is_return": 1, "docstatus": 1, "name": ["in", batch]},
+				fields=["name", "return_against"], as_list=1))
 		return return_entries
 
 	def get_outstanding_amount(self, gle, report_date, dr_or_cr, return_entries):
@@ -445,12 +456,15 @@ class ReceivablePayableReport(object):
 	def get_party_map(self, party_type):
 		if not hasattr(self, "party_map"):
 			if party_type == "Customer":
-				select_fields = "name, customer_name, territory, customer_group, customer_primary_contact"
+				fields = ["name", "customer_name", "territory", "customer_group", "customer_primary_contact"]
 			elif party_type == "Supplier":
-				select_fields = "name, supplier_name, supplier_group"
+				fields = ["name", "supplier_name", "supplier_group"]
 
-			self.party_map = dict(((r.name, r) for r in frappe.db.sql("select {0} from `tab{1}`"
-				.format(select_fields, party_type), as_dict=True)))
+			# only the parties in the report, set by get_data
+			self.party_map = {}
+			for batch in create_batch(list(getattr(self, "parties", [])), BATCH_SIZE):
+				for r in frappe.get_all(party_type, filters={"name": ["in", batch]}, fields=fields):
+					self.party_map[r.name] = r
 
 		return self.party_map
 
@@ -550,31 +564,33 @@ class ReceivablePayableReport(object):
 
 		return " and ".join(conditions), values
 
+	@staticmethod
+	def get_gl_entries_map(gl_entries):
+		# entries up to the report date by party and the voucher they are against,
+		# built from the entries already fetched instead of a second query
+		gl_entries_map = {}
+		for gle in gl_entries:
+			if gle.against_voucher_type and gle.against_voucher:
+				gl_entries_map.setdefault((gle.party, gle.against_voucher_type, gle.against_voucher), [])\
+					.append(gle)
+
+		return gl_entries_map
+
 	def get_gl_entries_for(self, party, party_type, against_voucher_type, against_voucher):
-		if not hasattr(self, "gl_entries_map"):
-			self.gl_entries_map = {}
-			for gle in self.get_gl_entries(party_type):
-				if gle.against_voucher_type and gle.against_voucher:
-					self.gl_entries_map.setdefault(gle.party, {})\
-						.setdefault(gle.against_voucher_type, {})\
-						.setdefault(gle.against_voucher, [])\
-						.append(gle)
-
-		return self.gl_entries_map.get(party, {})\
-			.get(against_voucher_type, {})\
-			.get(against_voucher, [])
+		return self.gl_entries_map.get((party, against_voucher_type, against_voucher), [])
 
 	def get_payment_term_detail(self, voucher_nos):
 		payment_term_map = frappe._dict()
-		payment_terms_details = frappe.db.sql(""" select si.name,
-			party_account_currency, currency, si.conversion_rate,
-			ps.due_date, ps.payment_amount, ps.description
-			from `tabSales Invoice` si, `tabPayment Schedule` ps
-			where si.name = ps.parent and
-			si.docstatus = 1 and si.company = '%s' and
-			si.name in (%s) order by ps.due_date
-		"""	% (frappe.db.escape(self.filters.company), ','.join(['%s'] *len(voucher_nos))),
-		(tuple(voucher_nos)), as_dict = 1)
+		payment_terms_details = []
+		for batch in create_batch(voucher_nos, BATCH_SIZE):
+			payment_terms_details += frappe.db.sql(""" select si.name,
+				party_account_currency, currency, si.conversion_rate,
+				ps.due_date, ps.payment_amount, ps.description
+				from `tabSales Invoice` si, `tabPayment Schedule` ps
+				where si.name = ps.parent and
+				si.docstatus = 1 and si.company = %s and
+				si.name in %s order by ps.due_date
+			""", (self.filters.company, tuple(batch)), as_dict = 1)
 
 		for d in payment_terms_details:
 			payment_term_amount = d.payment_amount
@@ -612,23 +628,16 @@ def execute(filters=None):
 	}
 	return ReceivablePayableReport(filters).run(args)
 
-def get_ageing_data(first_range, second_range, third_range,
-	fourth_range, age_as_on, entry_date, outstanding_amount):
+def get_ageing_data(ageing_ranges, age_as_on, entry_date, outstanding_amount):
 	# [0-30, 30-60, 60-90, 90-120, 120-above]
 	outstanding_range = [0.0, 0.0, 0.0, 0.0, 0.0]
 
 	if not (age_as_on and entry_date):
 		return [0] + outstanding_range
 
-	age = (getdate(age_as_on) - getdate(entry_date)).days or 0
-	index = None
-	for i, days in enumerate([first_range, second_range, third_range, fourth_range]):
-		if age <= days:
-			index = i
-			break
-
-	if index is None: index = 4
-	outstanding_range[index] = outstanding_amount
+	age = (age_as_on - getdate(entry_date)).days or 0
+	# first range whose upper limit is not below the age, the last range if none
+	outstanding_range[bisect_left(ageing_ranges, age)] = outstanding_amount
 
 	return [age] + outstanding_range
 
@@ -4,11 +4,33 @@
 import frappe
 from frappe import _
 from frappe.query_builder.functions import CombineDatetime
-from frappe.utils import flt
+from frappe.utils import create_batch, flt, getdate
 from erpnext.stock.utils import is_reposting_item_valuation_in_progress
-from itertools import groupby
-from operator import itemgetter
-import math
+from csf_tz.csf_tz.report.stock_ledger_utils import (
+    get_compact_rows,
+    get_opening_balances,
+    get_opening_stock_reconciliations,
+)
+
+
+# movements summed per item, the closing balance is the sum of all of them
+MOVEMENTS = (
+    "opening",
+    "purchase",
+    "sold",
+    "adjustment",
+    "consumed",
+    "produced",
+    "received",
+    "issued",
+    "reconciliation",
+)
+STOCK_ENTRY_MOVEMENTS = {
+    "Material Transfer for Manufacture": "consumed",
+    "Manufacture": "produced",
+    "Material Receipt": "received",
+    "Material Issue": "issued",
+}
 
 
 def execute(filters=None):
@@ -17,173 +39,98 @@ def execute(filters=None):
     items = get_items(filters)
     sl_entries = get_stock_ledger_entries(filters, items)
     item_details = get_item_details(items, sl_entries)
+    stock_entry_types = get_stock_entry_types(sl_entries)
 
-    opening_balance_item_wise = []
+    opening_balances, opening_vouchers = get_opening_balances_for(filters, sl_entries)
+    opening_balance_item_wise = set()
+    item_totals = {}
     for row in sl_entries:
-        item_detail = item_details[row.item_code]
-        row.update(item_detail)
-
-        row["opening_qty"] = row["opening_value"] = row["reconciliation_qty"] = row[
-            "reconciliation_value"
-        ] = row["purchase_qty"] = row["purchase_value"] = row["sold_qty"] = row[
-            "sold_value"
-        ] = row[
-            "adjustment_qty"
-        ] = row[
-            "adjustment_value"
-        ] = row[
-            "consumed_qty"
-        ] = row[
-            "consumed_value"
-        ] = row[
-            "produced_qty"
-        ] = row[
-            "produced_value"
-        ] = row[
-            "received_qty"
-        ] = row[
-            "received_value"
-        ] = row[
-            "issued_qty"
-        ] = row[
-            "issued_value"
-        ] = 0
-
-        if not any(
-            record["item_code"] == row.item_code
-            and record["warehouse"] == row.warehouse
-            for record in opening_balance_item_wise
-        ):
-            opening_balance_item_wise.append(
-                {"item_code": row.item_code, "warehouse": row.warehouse}
-            )
-            opening_row = get_opening_balance(
-                filters, row.item_code, row.warehouse, sl_entries
+        totals = item_totals.get(row.item_code)
+        if not totals:
+            totals = item_totals[row.item_code] = get_item_totals(
+                row, item_details[row.item_code]
             )
 
+        movements = []
+        if (row.item_code, row.warehouse) not in opening_balance_item_wise:
+            opening_balance_item_wise.add((row.item_code, row.warehouse))
+            opening_row = opening_balances.get((row.item_code, row.warehouse))
+
             if opening_row:
-                row["opening_qty"] = opening_row["qty_after_transaction"]
-                row["opening_value"] = (
-                    flt(row["opening_qty"]) * opening_row["valuation_rate"]
+                opening_qty = flt(opening_row["qty_after_transaction"])
+                movements.append(
+                    ("opening", opening_qty, opening_qty * flt(opening_row["valuation_rate"]))
                 )
 
-        if row.voucher_type == "Stock Reconciliation":
-            row["reconciliation_qty"] = row.stock_value_difference / (
-                row.valuation_rate or 1
+        # an Opening Stock reconciliation on the first day is part of the opening
+        if (
+            row.voucher_type == "Stock Reconciliation"
+            and row.voucher_no not in opening_vouchers
+        ):
+            movements.append(
+                (
+                    "reconciliation",
+                    row.stock_value_difference / (row.valuation_rate or 1),
+                    row.stock_value_difference,
+                )
             )
 
-            row["reconciliation_value"] = row.stock_value_difference
-
         if (
             row.voucher_type == "Purchase Receipt"
             or row.voucher_type == "Purchase Invoice"
         ):
-            row["purchase_qty"] = row.actual_qty
-            row["purchase_value"] = row.stock_value_difference
+            movements.append(("purchase", row.actual_qty, row.stock_value_difference))
 
         if row.voucher_type == "Delivery Note" or row.voucher_type == "Sales Invoice":
-            row["sold_qty"] = row.actual_qty
-            row["sold_value"] = row.stock_value_difference
+            movements.append(("sold", row.actual_qty, row.stock_value_difference))
 
         if row.voucher_type == "Stock Entry":
-            row["adjustment_qty"] = row.actual_qty
-            row["adjustment_value"] = row.stock_value_difference
+            movements.append(("adjustment", row.actual_qty, row.stock_value_difference))
 
-            stock_entry_type = frappe.db.get_value(
-                row.voucher_type, row.voucher_no, "stock_entry_type"
-            )
-            if stock_entry_type == "Material Transfer for Manufacture":
-                row["consumed_qty"] = row.actual_qty
-                row["consumed_value"] = row.stock_value_difference
-
-            if stock_entry_type == "Manufacture":
-                row["produced_qty"] = row.actual_qty
-                row["produced_value"] = row.stock_value_difference
-
-            if stock_entry_type == "Material Receipt":
-                row["received_qty"] = row.actual_qty
-                row["received_value"] = row.stock_value_difference
-
-            if stock_entry_type == "Material Issue":
-                row["issued_qty"] = row.actual_qty
-                row["issued_value"] = row.stock_value_difference
-
-        row["closing_qty"] = (
-            ((row.opening_qty or 0) + (row.purchase_qty or 0))
-            + (row.sold_qty or 0)
-            + (
-                (row.adjustment_qty or 0)
-                + (
-                    (row.consumed_qty or 0)
-                    + (row.produced_qty or 0)
-                    + (row.received_qty or 0)
-                    + (row.issued_qty or 0)
-                )
-            )
-            + (row.reconciliation_qty or 0)
-        )
+            movement = STOCK_ENTRY_MOVEMENTS.get(stock_entry_types.get(row.voucher_no))
+            if movement:
+                movements.append((movement, row.actual_qty, row.stock_value_difference))
 
-        row["closing_value"] = (
-            ((row.opening_value or 0) + (row.purchase_value or 0))
-            + (row.sold_value or 0)
-            + (
-                (row.adjustment_value or 0)
-                + (
-                    (row.consumed_value or 0)
-                    + (row.produced_value or 0)
-                    + (row.received_value or 0)
-                    + (row.issued_value or 0)
-                )
-            )
-            + (row.reconciliation_value or 0)
-        )
+        for movement, qty, value in movements:
+            totals[movement + "_qty"] += qty or 0
+            totals[movement + "_value"] += value or 0
+            totals["closing_qty"] += qty or 0
+            totals["closing_value"] += value or 0
 
-    prepared_data = prepare_data(sl_entries)
+    prepared_data = [item_totals[item_code] for item_code in sorted(item_totals)]
 
     return columns, prepared_data
 
 
-def prepare_data(data):
-    sorted_data = sorted(data, key=itemgetter("item_code"))
-
-    grouped_data = {
-        key: list(group)
-        for key, group in groupby(sorted_data, key=itemgetter("item_code"))
+def get_item_totals(row, item_detail):
+    """Totals row of an item, dated with its first ledger entry"""
+    totals = {
+        "date": row.date,
+        "item_code": row.item_code,
+        "stock_uom": item_detail.stock_uom,
     }
-    result = []
-    for item_code, group in grouped_data.items():
-        result.append(
-            {
-                "date": group[0]["date"],
-                "item_code": item_code,
-                "stock_uom": group[0]["stock_uom"],
-                "opening_qty": sum(entry["opening_qty"] for entry in group),
-                "opening_value": sum(entry["opening_value"] for entry in group),
-                "purchase_qty": sum(entry["purchase_qty"] for entry in group),
-                "purchase_value": sum(entry["purchase_value"] for entry in group),
-                "sold_qty": sum(entry["sold_qty"] for entry in group),
-                "sold_value": sum(entry["sold_value"] for entry in group),
-                "adjustment_qty": sum(entry["adjustment_qty"] for entry in group),
-                "adjustment_value": sum(entry["adjustment_value"] for entry in group),
-                "consumed_qty": sum(entry["consumed_qty"] for entry in group),
-                "consumed_value": sum(entry["consumed_value"] for entry in group),
-                "produced_qty": sum(entry["produced_qty"] for entry in group),
-                "produced_value": sum(entry["produced_value"] for entry in group),
-                "received_qty": sum(entry["received_qty"] for entry in group),
-                "received_value": sum(entry["received_value"] for entry in group),
-                "issued_qty": sum(entry["issued_qty"] for entry in group),
-                "issued_value": sum(entry["issued_value"] for entry in group),
-                "reconciliation_qty": sum(
-                    entry["reconciliation_qty"] for entry in group
-                ),
-                "reconciliation_value": sum(
-                    entry["reconciliation_value"] for entry in group
-                ),
-                "closing_qty": sum(entry["closing_qty"] for entry in group),
-                "closing_value": sum(entry["closing_value"] for entry in group),
-            }
+    for movement in MOVEMENTS + ("closing",):
+        totals[movement + "_qty"] = 0
+        totals[movement + "_value"] = 0
+    return totals
+
+
+def get_stock_entry_types(sl_entries):
+    """{stock_entry: stock_entry_type} of the Stock Entries in `sl_entries`"""
+    stock_entries = list(
+        {sle.voucher_no for sle in sl_entries if sle.voucher_type == "Stock Entry"}
+    )
+    stock_entry_types = {}
+    for batch in create_batch(stock_entries, 1000):
+        stock_entry_types.update(
+            frappe.get_all(
+                "Stock Entry",
+                filters={"name": ["in", batch]},
+                fields=["name", "stock_entry_type"],
+                as_list=True,
+            )
         )
-    return result
+    return stock_entry_types
 
 
 def get_columns(filters):
@@ -353,6 +300,20 @@ def get_columns(filters):
     return columns
 
 
+SLE_FIELDS = (
+    "item_code",
+    "date",
+    "warehouse",
+    "posting_date",
+    "actual_qty",
+    "valuation_rate",
+    "voucher_type",
+    "voucher_no",
+    "qty_after_transaction",
+    "stock_value_difference",
+)
+
+
 def get_stock_ledger_entries(filters, items):
     sle = frappe.qb.DocType("Stock Ledger Entry")
     query = (
@@ -362,19 +323,12 @@ def get_stock_ledger_entries(filters, items):
             CombineDatetime(sle.posting_date, sle.posting_time).as_("date"),
             sle.warehouse,
             sle.posting_date,
-            sle.posting_time,
             sle.actual_qty,
             sle.valuation_rate,
-            sle.valuation_rate,
-            sle.company,
             sle.voucher_type,
+            sle.voucher_no,
             sle.qty_after_transaction,
             sle.stock_value_difference,
-            sle.voucher_no,
-            sle.stock_value,
-            sle.batch_no,
-            sle.serial_no,
-            sle.project,
         )
         .where(
             (sle.docstatus < 2)
@@ -389,7 +343,7 @@ def get_stock_ledger_entries(filters, items):
     if filters.item_code:
         query = query.where(sle.item_code == filters.get("item_code"))
 
-    return query.run(as_dict=True)
+    return get_compact_rows(query, SLE_FIELDS)
 
 
 def get_items(filters):
@@ -443,54 +397,34 @@ def get_item_details(items, sl_entries):
     return item_details
 
 
-def get_opening_balance(filters, item_code, warehouse, sl_entries):
+def get_opening_balances_for(filters, sl_entries):
+    """
+    Opening balance of every (item, warehouse) in `sl_entries` and the Opening Stock
+    reconciliations posted on `from_date`, which count as the opening balance
+    """
     if not filters.from_date:
-        return
+        return {}, set()
 
-    from erpnext.stock.stock_ledger import get_previous_sle
+    opening_balances = get_opening_balances(
+        filters.from_date,
+        items={sle.item_code for sle in sl_entries},
+        warehouses={sle.warehouse for sle in sl_entries},
+    )
 
-    last_entry = get_previous_sle(
+    from_date = getdate(filters.from_date)
+    opening_vouchers = get_opening_stock_reconciliations(
         {
-            "item_code": item_code,
-            "warehouse_condition": get_warehouse_condition(warehouse),
-            "posting_date": filters.from_date,
-            "posting_time": "00:00:00",
+            sle.voucher_no
+            for sle in sl_entries
+            if sle.voucher_type == "Stock Reconciliation"
+            and sle.posting_date == from_date
         }
     )
+    for sle in sl_entries:
+        if sle.voucher_no in opening_vouchers and sle.posting_date == from_date:
+            opening_balances[(sle.item_code, sle.warehouse)] = sle
 
-    # check if any SLEs are actually Opening Stock Reconciliation
-    for sle in list(sl_entries):
-        if (
-            sle.get("voucher_type") == "Stock Reconciliation"
-            and sle.posting_date == filters.from_date
-            and frappe.db.get_value("Stock Reconciliation", sle.voucher_no, "purpose")
-            == "Opening Stock"
-        ):
-            last_entry = sle
-            sl_entries.remove(sle)
-
-    row = {
-        "item_code": item_code,
-        "qty_after_transaction": last_entry.get("qty_after_transaction", 0),
-        "valuation_rate": last_entry.get("valuation_rate", 0),
-        "stock_value": last_entry.get("stock_value", 0),
-    }
-
-    return row
-
-
-def get_warehouse_condition(warehouse):
-    warehouse_details = frappe.db.get_value(
-        "Warehouse", warehouse, ["lft", "rgt"], as_dict=1
-    )
-    if warehouse_details:
-        return (
-            " exists (select name from `tabWarehouse` wh \
-			where wh.lft >= %s and wh.rgt <= %s and warehouse = wh.name)"
-            % (warehouse_details.lft, warehouse_details.rgt)
-        )
-
-    return ""
+    return opening_balances, opening_vouchers
 
 
 def get_item_group_condition(item_group, item_table=None):
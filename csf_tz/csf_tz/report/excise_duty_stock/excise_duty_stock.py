@@ -8,6 +8,11 @@ from frappe import _
 from frappe.utils import flt, cint, getdate
 from erpnext.stock.utils import add_additional_uom_columns
 from erpnext.stock.report.stock_ledger.stock_ledger import get_item_group_condition
+from csf_tz.csf_tz.report.stock_ledger_utils import (
+    get_leaf_warehouses,
+    get_stock_balances,
+    group_stock_balances,
+)
 
 
 from six import iteritems
@@ -29,14 +34,14 @@ def execute(filters=None):
     include_uom = filters.get("include_uom")
     columns = get_columns(filters)
     items = get_items(filters)
-    sle = get_stock_ledger_entries(filters, items)
+    iwb_map = get_item_warehouse_map(filters, items)
 
-    # if no stock ledger entry found return
-    if not sle:
+    if not iwb_map:
         return columns, []
 
-    iwb_map = get_item_warehouse_map(filters, sle)
-    item_map = get_item_details(items, sle, filters)
+    item_map = get_item_details(
+        items or list({item for company, item in iwb_map}), filters
+    )
 
     data = []
     conversion_factors = {}
@@ -143,141 +148,58 @@ def get_columns(filters):
     return columns
 
 
-def get_conditions(filters):
-    conditions = ""
-    if not filters.get("from_date"):
-        frappe.throw(_("'From Date' is required"))
-
-    if filters.get("to_date"):
-        conditions += " and sle.posting_date <= %s" % frappe.db.escape(
-            filters.get("to_date")
-        )
-    else:
-        frappe.throw(_("'To Date' is required"))
-
-    if filters.get("company"):
-        conditions += " and sle.company = %s" % frappe.db.escape(filters.get("company"))
-
+def get_warehouses(filters):
+    """Warehouses to report on, None for all"""
     if filters.get("warehouse"):
-        warehouse_details = frappe.db.get_value(
-            "Warehouse", filters.get("warehouse"), ["lft", "rgt"], as_dict=1
-        )
-        if warehouse_details:
-            conditions += (
-                " and exists (select name from `tabWarehouse` wh \
-                where wh.lft >= %s and wh.rgt <= %s and sle.warehouse = wh.name)"
-                % (warehouse_details.lft, warehouse_details.rgt)
-            )
+        return get_leaf_warehouses(filters.get("warehouse"))
 
-    if filters.get("warehouse_type") and not filters.get("warehouse"):
-        conditions += (
-            " and exists (select name from `tabWarehouse` wh \
-            where wh.warehouse_type = '%s' and sle.warehouse = wh.name)"
-            % (filters.get("warehouse_type"))
+    if filters.get("warehouse_type"):
+        return frappe.get_all(
+            "Warehouse",
+            filters={"warehouse_type": filters.get("warehouse_type")},
+            pluck="name",
         )
 
-    return conditions
-
 
-def get_stock_ledger_entries(filters, items):
-    item_conditions_sql = ""
-    if items:
-        item_conditions_sql = " and sle.item_code in ({})".format(
-            ", ".join([frappe.db.escape(i, percent=False) for i in items])
-        )
+def get_item_warehouse_map(filters, items):
+    """
+    Opening, in, out, excise and balance quantities per (company, item)
 
-    conditions = get_conditions(filters)
+    Movements are summed per item and warehouse in SQL by `get_stock_balances`
+    and added up across warehouses here. Material Transfer Stock Entries are left
+    out of the in and out quantities.
+    """
+    if not filters.get("from_date"):
+        frappe.throw(_("'From Date' is required"))
+    if not filters.get("to_date"):
+        frappe.throw(_("'To Date' is required"))
 
-    return frappe.db.sql(
-        """
-        select
-            sle.item_code, sle.warehouse, sle.posting_date, sle.actual_qty, sle.valuation_rate,
-            sle.company, sle.voucher_type, sle.qty_after_transaction, sle.stock_value_difference,
-            sle.item_code as name, sle.voucher_no, sle.stock_value, 0 as excise_stock
-        from
-            `tabStock Ledger Entry` sle
-        inner join `tabStock Entry` se on sle.voucher_type = "Stock Entry" and se.name = sle.voucher_no
-        inner join `tabItem` i on sle.item_code = i.name
-        where sle.is_cancelled = 0
-            and (se.purpose != "Material Transfer")
-            and i.excisable_item = 1
-            and sle.docstatus < 2 %s %s
-        UNION ALL
-        select
-            sle.item_code, sle.warehouse, sle.posting_date, sle.actual_qty, sle.valuation_rate,
-            sle.company, sle.voucher_type, sle.qty_after_transaction, sle.stock_value_difference,
-            sle.item_code as name, sle.voucher_no, sle.stock_value, sle.actual_qty * si.excise_duty_applicable as excise_stock
-        from
-            `tabStock Ledger Entry` sle
-        inner join `tabSales Invoice` si on sle.voucher_type = "Sales Invoice" and si.name = sle.voucher_no
-        inner join `tabItem` i on sle.item_code = i.name
-        where sle.is_cancelled = 0
-            and i.excisable_item = 1
-            and sle.docstatus < 2 %s %s
-        UNION ALL
-        select
-            sle.item_code, sle.warehouse, sle.posting_date, sle.actual_qty, sle.valuation_rate,
-            sle.company, sle.voucher_type, sle.qty_after_transaction, sle.stock_value_difference,
-            sle.item_code as name, sle.voucher_no, sle.stock_value, 0 as excise_stock
-        from
-            `tabStock Ledger Entry` sle
-        inner join `tabItem` i on sle.item_code = i.name
-        where sle.is_cancelled = 0
-            and sle.voucher_type NOT IN ("Stock Entry", "Sales Invoice")
-            and i.excisable_item = 1
-            and sle.docstatus < 2 %s %s
-        order by 3"""  # nosec
-        % (
-            item_conditions_sql,
-            conditions,
-            item_conditions_sql,
-            conditions,
-            item_conditions_sql,
-            conditions,
-        ),
-        as_dict=1,
+    excisable_items = frappe.get_all(
+        "Item",
+        filters={"excisable_item": 1, "name": ["in", items]}
+        if items
+        else {"excisable_item": 1},
+        pluck="name",
     )
 
+    balances = get_stock_balances(
+        getdate(filters.get("from_date")),
+        getdate(filters.get("to_date")),
+        items=excisable_items,
+        warehouses=get_warehouses(filters),
+        company=filters.get("company"),
+        with_excise=True,
+        exclude_material_transfer=True,
+    )
 
-def get_item_warehouse_map(filters, sle):
+    fields = ("opening_qty", "in_qty", "out_qty", "excise_stock", "bal_qty")
     iwb_map = {}
-    from_date = getdate(filters.get("from_date"))
-    to_date = getdate(filters.get("to_date"))
+    for key, balance in group_stock_balances(
+        balances, lambda company, item_code, warehouse: (company, item_code)
+    ).items():
+        iwb_map[key] = frappe._dict({field: balance[field] for field in fields})
 
     float_precision = cint(frappe.db.get_default("float_precision")) or 3
-
-    for d in sle:
-        key = (d.company, d.item_code)
-        if key not in iwb_map:
-            iwb_map[key] = frappe._dict(
-                {
-                    "opening_qty": 0.0,
-                    "in_qty": 0.0,
-                    "out_qty": 0.0,
-                    "excise_stock": 0.0,
-                    "bal_qty": 0.0,
-                }
-            )
-
-        qty_dict = iwb_map[(d.company, d.item_code)]
-
-        if d.voucher_type == "Stock Reconciliation":
-            qty_diff = flt(d.qty_after_transaction) - flt(qty_dict.bal_qty)
-        else:
-            qty_diff = flt(d.actual_qty)
-
-        if d.posting_date < from_date:
-            qty_dict.opening_qty += qty_diff
-
-        elif d.posting_date >= from_date and d.posting_date <= to_date:
-            if flt(qty_diff, float_precision) >= 0:
-                qty_dict.in_qty += qty_diff
-            else:
-                qty_dict.out_qty += abs(qty_diff)
-            qty_dict.excise_stock += abs(d.excise_stock) or 0
-
-        qty_dict.bal_qty += qty_diff
-
     iwb_map = filter_items_with_no_transactions(iwb_map, float_precision)
 
     return iwb_map
@@ -319,11 +241,8 @@ def get_items(filters):
     return items
 
 
-def get_item_details(items, sle, filters):
+def get_item_details(items, filters):
     item_details = {}
-    if not items:
-        items = list(set([d.item_code for d in sle]))
-
     if not items:
         return item_details
 
@@ -364,9 +283,7 @@ def get_item_details(items, sle, filters):
 
 def validate_filters(filters):
     if not (filters.get("item_code") or filters.get("warehouse")):
-        sle_count = flt(
-            frappe.db.sql("""select count(name) from `tabStock Ledger Entry`""")[0][0]
-        )
+        sle_count = frappe.db.estimate_count("Stock Ledger Entry")
         if sle_count > 500000:
             frappe.throw(
                 _(
@@ -6,11 +6,17 @@ import frappe
 from frappe import _, scrub
 from erpnext.stock.utils import get_incoming_rate
 from erpnext.controllers.queries import get_match_cond
-from frappe.utils import flt, cint
+from frappe.utils import flt, cint, create_batch
+from csf_tz.csf_tz.report.stock_ledger_utils import get_compact_rows
 
 
 from csf_tz import console
 
+CHUNK_SIZE = 500
+# columns of the stock ledger entries selected by load_stock_ledger_entries
+SLE_FIELDS = ("item_code", "voucher_type", "voucher_no", "voucher_detail_no", "stock_value",
+	"warehouse", "qty", "previous_stock_value")
+
 def execute(filters=None):
 	if not filters: filters = frappe._dict()
 	filters.currency = frappe.get_cached_value('Company',  filters.company,  "default_currency")
@@ -246,8 +252,8 @@ class GrossProfitGenerator(object):
 	def get_buying_amount(self, row, item_code):
 		console("in buying amount", item_code)
 		# IMP NOTE
-		# stock_ledger_entries should already be filtered by item_code and warehouse and
-		# sorted by posting_date desc, posting_time desc
+		# stock_ledger_entries are keyed by voucher, voucher row, item_code and warehouse
+		# and carry the stock value of the previous entry of the item and warehouse
 		if item_code in self.non_stock_items and (row.project or row.cost_center):
 			#Issue 6089-Get last purchasing rate for non-stock item
 			item_rate = self.get_last_purchase_rate(item_code, row)
@@ -256,31 +262,19 @@ class GrossProfitGenerator(object):
 			return flt(row.qty) * item_rate
 
 		else:
-			my_sle = self.sle.get((item_code, row.warehouse))
-			if (row.update_stock or row.dn_detail) and my_sle:
+			if row.update_stock or row.dn_detail:
 				parenttype, parent = row.parenttype, row.parent
 				if row.dn_detail:
 					parenttype, parent = "Delivery Note", row.delivery_note
 
-				for i, sle in enumerate(my_sle):
-					# find the stock valution rate from stock ledger entry
-					if sle.voucher_type == parenttype and parent == sle.voucher_no and \
-						sle.voucher_detail_no == row.item_row:
-							previous_stock_value = len(my_sle) > i+1 and \
-								flt(my_sle[i+1].stock_value) or 0.0
-
-							if previous_stock_value:
-								return (previous_stock_value - flt(sle.stock_value)) * flt(row.qty) / abs(flt(sle.qty))
-							else:
-								return flt(row.qty) * self.get_average_buying_rate(row, item_code)
-					else:
-						console("unknown criteria hit", sle.voucher_type, parenttype, parent, sle.voucher_no, sle.voucher_detail_no, row.item_row)
-			else:
-				console("NO update stock or dn detail and no my_sel")
-				return flt(row.qty) * self.get_average_buying_rate(row, item_code)
+				# find the stock valution rate from stock ledger entry
+				sle = self.sle.get((parenttype, parent, row.item_row, item_code, row.warehouse))
+				if sle and flt(sle.previous_stock_value) and flt(sle.qty):
+					return (flt(sle.previous_stock_value) - flt(sle.stock_value)) * flt(row.qty) / abs(flt(sle.qty))
+
+				console("no stock ledger entry or previous stock value", parenttype, parent, row.item_row)
 
-		console("0 returned as no matching code")
-		return 0.0
+			return flt(row.qty) * self.get_average_buying_rate(row, item_code)
 
 	def get_average_buying_rate(self, row, item_code):
 		args = row
@@ -298,22 +292,47 @@ class GrossProfitGenerator(object):
 		return self.average_buying_rate[item_code]
 
 	def get_last_purchase_rate(self, item_code, row):
-		condition = ''
+		if not hasattr(self, "last_purchase_rates"):
+			self.load_last_purchase_rates()
+
 		if row.project:
-			condition += " AND a.project=%s" % (frappe.db.escape(row.project))
-		elif row.cost_center:
-			condition += " AND a.cost_center=%s" % (frappe.db.escape(row.cost_center))
-		if self.filters.to_date:
-			condition += " AND modified='%s'" % (self.filters.to_date)
+			return self.last_purchase_rates["project"].get((item_code, row.project), 0)
+		return self.last_purchase_rates["cost_center"].get((item_code, row.cost_center), 0)
+
+	def load_last_purchase_rates(self):
+		"""Latest purchase rate per (item, project) and (item, cost center) of the non-stock items sold"""
+		self.last_purchase_rates = {"project": {}, "cost_center": {}}
 
-		last_purchase_rate = frappe.db.sql("""
-		select (a.base_rate / a.conversion_factor)
-		from `tabPurchase Invoice Item` a
-		where a.item_code = %s and a.docstatus=1
-		{0}
-		order by a.modified desc limit 1""".format(condition), item_code)
+		item_codes = {row.item_code for row in self.si_list}
+		for bundles in self.product_bundles.values():
+			for parent_items in bundles.values():
+				for packed_items in parent_items.values():
+					item_codes.update(d.item_code for d in packed_items)
+		item_codes = list(item_codes.intersection(self.non_stock_items))
 
-		return flt(last_purchase_rate[0][0]) if last_purchase_rate else 0
+		condition = ""
+		if self.filters.to_date:
+			condition = "and a.modified < DATE_ADD(%(to_date)s, INTERVAL 1 DAY)"
+
+		for items in create_batch(item_codes, CHUNK_SIZE):
+			for d in frappe.db.sql("""
+				select item_code, project, cost_center, rate, project_row_no, cost_center_row_no
+				from (
+					select a.item_code, a.project, a.cost_center,
+						(a.base_rate / a.conversion_factor) as rate,
+						row_number() over (partition by a.item_code, a.project
+							order by a.modified desc) as project_row_no,
+						row_number() over (partition by a.item_code, a.cost_center
+							order by a.modified desc) as cost_center_row_no
+					from `tabPurchase Invoice Item` a
+					where a.item_code in %(items)s and a.docstatus=1 {0}
+				) purchase
+				where project_row_no = 1 or cost_center_row_no = 1""".format(condition),
+				{"items": items, "to_date": self.filters.to_date}, as_dict=True):
+				if d.project_row_no == 1 and d.project:
+					self.last_purchase_rates["project"][(d.item_code, d.project)] = flt(d.rate)
+				if d.cost_center_row_no == 1 and d.cost_center:
+					self.last_purchase_rates["cost_center"][(d.item_code, d.cost_center)] = flt(d.rate)
 
 	def load_invoice_items(self):
 		conditions = ""
@@ -363,30 +382,60 @@ class GrossProfitGenerator(object):
 			.format(conditions=conditions, sales_person_cols=sales_person_cols,
 				sales_team_table=sales_team_table, match_cond = get_match_cond('Sales Invoice')), self.filters, as_dict=1)
 
+	def get_stock_vouchers(self):
+		"""(voucher_type, voucher_no) of the documents that moved stock for the rows in si_list"""
+		vouchers = set()
+		for row in self.si_list:
+			if row.update_stock:
+				vouchers.add((row.parenttype, row.parent))
+			elif row.dn_detail and row.delivery_note:
+				vouchers.add(("Delivery Note", row.delivery_note))
+		return vouchers
+
 	def load_stock_ledger_entries(self):
-		res = frappe.db.sql("""select item_code, voucher_type, voucher_no,
-				voucher_detail_no, stock_value, warehouse, actual_qty as qty
-			from `tabStock Ledger Entry`
-			where company=%(company)s and is_cancelled = 0
-			order by
-				item_code desc, warehouse desc, posting_date desc,
-				posting_time desc, creation desc""", self.filters, as_dict=True)
-		self.sle = {}
-		for r in res:
-			if (r.item_code, r.warehouse) not in self.sle:
-				self.sle[(r.item_code, r.warehouse)] = []
+		"""
+		Stock ledger entries of the vouchers in si_list, each with the stock value of the
+		entry before it for the same item and warehouse
 
-			self.sle[(r.item_code, r.warehouse)].append(r)
+		Only the entries of these vouchers are kept in memory, not the stock history of
+		the company, as compact rows.
+		"""
+		self.sle = {}
+		voucher_nos = list({voucher_no for voucher_type, voucher_no in self.get_stock_vouchers()})
+		for vouchers in create_batch(voucher_nos, CHUNK_SIZE):
+			for r in get_compact_rows("""select sle.item_code, sle.voucher_type, sle.voucher_no,
+					sle.voucher_detail_no, sle.stock_value, sle.warehouse, sle.actual_qty as qty,
+					(select prev.stock_value from `tabStock Ledger Entry` prev
+						where prev.item_code = sle.item_code and prev.warehouse = sle.warehouse
+							and prev.company = sle.company and prev.is_cancelled = 0
+							and (prev.posting_date < sle.posting_date
+								or (prev.posting_date = sle.posting_date
+									and (prev.posting_time < sle.posting_time
+										or (prev.posting_time = sle.posting_time
+											and prev.creation < sle.creation))))
+						order by prev.posting_date desc, prev.posting_time desc, prev.creation desc
+						limit 1) as previous_stock_value
+				from `tabStock Ledger Entry` sle
+				where sle.company=%(company)s and sle.is_cancelled = 0
+					and sle.voucher_no in %(vouchers)s
+				order by
+					sle.posting_date desc, sle.posting_time desc, sle.creation desc""",
+				SLE_FIELDS, {"company": self.filters.company, "vouchers": vouchers}):
+				self.sle.setdefault((r.voucher_type, r.voucher_no, r.voucher_detail_no,
+					r.item_code, r.warehouse), r)
 
 	def load_product_bundle(self):
 		self.product_bundles = {}
 
-		for d in frappe.db.sql("""select parenttype, parent, parent_item,
-			item_code, warehouse, -1*qty as total_qty, parent_detail_docname
-			from `tabPacked Item` where docstatus=1""", as_dict=True):
-			self.product_bundles.setdefault(d.parenttype, frappe._dict()).setdefault(d.parent,
-				frappe._dict()).setdefault(d.parent_item, []).append(d)
+		voucher_nos = list({voucher_no for voucher_type, voucher_no in self.get_stock_vouchers()})
+		for vouchers in create_batch(voucher_nos, CHUNK_SIZE):
+			for d in frappe.db.sql("""select parenttype, parent, parent_item,
+				item_code, warehouse, -1*qty as total_qty, parent_detail_docname
+				from `tabPacked Item` where docstatus=1 and parent in %(vouchers)s""",
+				{"vouchers": vouchers}, as_dict=True):
+				self.product_bundles.setdefault(d.parenttype, frappe._dict()).setdefault(d.parent,
+					frappe._dict()).setdefault(d.parent_item, []).append(d)
 
 	def load_non_stock_items(self):
-		self.non_stock_items = frappe.db.sql_list("""select name from tabItem
-			where is_stock_item=0""")
\ No newline at end of file
+		self.non_stock_items = set(frappe.db.sql_list("""select name from tabItem
+			where is_stock_item=0"""))
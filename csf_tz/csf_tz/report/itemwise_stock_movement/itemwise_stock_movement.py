@@ -4,7 +4,9 @@
 from __future__ import unicode_literals
 import frappe
 from frappe import _
+from frappe.utils import flt, getdate
 import pandas as pd
+from csf_tz.csf_tz.report.stock_ledger_utils import get_leaf_warehouses, get_opening_balances
 
 def execute(filters=None):
 	# frappe.msgprint(str(filters))
@@ -85,31 +87,23 @@ def get_stock_ledger_entries(filters, items):
 		), filters, as_dict = 1)
 
 def get_opening_balance_entries(filters, items):
-	item_conditions_sql = ''
-	if items:
-		item_conditions_sql = 'and sle.item_code in ({})'\
-			.format(', '.join(['"' + frappe.db.escape(i) + '"' for i in items]))
-
-	return frappe.db.sql("""SELECT	STR_TO_DATE(%(from_date)s, '%%Y-%%m-%%d') as posting_date, 
-									". Opening Balance" as "Particulars",
-									sle.item_code, 
-									sum(if(sle.actual_qty = 0, sle.qty_after_transaction, sle.actual_qty)) as "actual_qty"
-							FROM	`tabStock Ledger Entry` sle 
-								LEFT OUTER JOIN `tabSales Invoice` si 
-												ON sle.voucher_no = si.name
-												AND sle.company = si.company
-								LEFT OUTER JOIN `tabDelivery Note` dn 
-												ON sle.voucher_no = dn.name
-												AND sle.company = dn.company
-							WHERE sle.company = %(company)s
-									AND sle.posting_date < %(from_date)s
-									{sle_conditions}
-									{item_conditions_sql}
-							GROUP BY `Particulars`, sle.item_code"""\
-		.format(
-			sle_conditions=get_sle_conditions(filters),
-			item_conditions_sql = item_conditions_sql
-		), filters, as_dict = 1)
+	warehouses = get_leaf_warehouses(filters.get("warehouse")) if filters.get("warehouse") else None
+	opening_balances = get_opening_balances(filters.get("from_date"), items=items or None, warehouses=warehouses,
+		company=filters.get("company"))
+
+	opening_qty = {}
+	for (item_code, warehouse), row in opening_balances.items():
+		opening_qty[item_code] = opening_qty.get(item_code, 0) + flt(row.qty_after_transaction)
+
+	posting_date = getdate(filters.get("from_date"))
+	return [
+		frappe._dict({
+			"posting_date": posting_date,
+			"Particulars": ". Opening Balance",
+			"item_code": item_code,
+			"actual_qty": qty
+		}) for item_code, qty in opening_qty.items()
+	]
 
 def get_items(filters):
 	"""Get items based on filters."""
@@ -151,24 +145,6 @@ def get_sle_conditions(filters):
 
 	return "and {}".format(" and ".join(conditions)) if conditions else ""
 
-def get_opening_balance(filters, _columns, date, balance_type, item_code):
-	if not (item_code and filters.warehouse and date):
-		return
-
-	from erpnext.stock.stock_ledger import get_previous_sle
-	last_entry = get_previous_sle({
-		"item_code": item_code,
-		"warehouse_condition": get_warehouse_condition(filters.warehouse),
-		"posting_date": date,
-		"posting_time": "00:00:00"
-	})
-	row = {}
-	row["voucher_type"] = _(balance_type)
-	for dummy, v in ((9, 'actual_qty')):
-			row[v] = last_entry.get(v, 0)
-
-	return row
-
 def get_warehouse_condition(warehouse):
 	warehouse_details = frappe.db.get_value("Warehouse", warehouse, ["lft", "rgt"], as_dict=1)
 	if warehouse_details:
@@ -3,75 +3,64 @@
 
 from __future__ import unicode_literals
 import frappe
-from frappe.utils import fmt_money
+from frappe.utils import flt, fmt_money
 def execute(filters=None):
 	columns, data = get_columns(), []
 	credit_note_label = {"details": "Credit Note - Sales Returns"}
 	sales_label = {"details": "Sales - Sales Returns"}
-	totals = {}
-	generate_sales_returns(filters,data,totals,sales_label)
-	data[0]["std_sales"] = fmt_money(float(totals['total_std_sales']), 2, data[1]['invoice_currency'])
-	data[0]["vat"] = fmt_money(float(totals['vat']), 2, data[1]['invoice_currency'])
-	data[0]["ex_amount"] = fmt_money(float(totals['ex_amount']), 2, data[1]['invoice_currency'])
-	data[0]["total"] = fmt_money(float(totals['total']), 2, data[1]['invoice_currency'])
-	generate_credit_note(data,totals,credit_note_label)
 
-	data.append({
-		"details": "Sales as VAT Returns",
-		"std_sales": fmt_money(float(totals['total_std_sales']), 2, data[1]['invoice_currency']),
-		"vat": fmt_money(float(totals['vat']), 2, data[1]['invoice_currency']),
-		"ex_amount": fmt_money(float(totals['ex_amount']), 2, data[1]['invoice_currency']),
-		"total": fmt_money(float(totals['total']), 2, data[1]['invoice_currency'])
-	})
-	return columns, data
+	invoices = get_z_report_invoices(filters.get("efd_report"))
+	if not invoices:
+		return columns, data
+
+	currency = invoices[0].currency
+	sales_totals = get_totals(invoices)
+	data.append(dict(sales_label, **format_amounts(sales_totals, currency)))
+	data.extend(dict(details=row.name, invoice_currency=row.currency, **format_amounts(row, row.currency)) for row in invoices)
 
-def generate_credit_note(data,totals,credit_note_label):
+	credit_notes = get_credit_notes([row.name for row in invoices])
+	if credit_notes:
+		data.append(credit_note_label)
+		invoice_currency = {row.name: row.currency for row in invoices}
+		data.extend(dict(details=row.name, **format_amounts(row, invoice_currency.get(row.return_against))) for row in credit_notes)
 
-	for i in range(1,len(data)):
-		if data[i]['details'] != "Credit Note - Sales Returns":
-			credit_notes = frappe.get_list("Sales Invoice", filters={"is_return": 1, "return_against": "ACC-SINV-2019-07382", "docstatus": 1}, fields=["*"])
-			print(credit_notes)
-			for ii in credit_notes:
+	totals = get_totals(invoices + credit_notes)
+	data.append(dict(details="Sales as VAT Returns", **format_amounts(totals, currency)))
+	return columns, data
 
-				if i == 1:
-					data.append(credit_note_label)
+def get_z_report_invoices(efd_report):
+	return frappe.db.sql("""
+		SELECT si.name, si.currency, si.total AS std_sales, si.total_taxes_and_charges AS vat, si.grand_total AS ex_amount
+		FROM `tabEFD Z Report Invoice` zri
+		INNER JOIN `tabSales Invoice` si ON si.name = zri.invoice_number
+		WHERE zri.parent = %s AND zri.parenttype = 'EFD Z Report'
+		ORDER BY zri.idx
+	""", efd_report, as_dict=True)
 
-				totals['total_std_sales'] = totals['total_std_sales'] + float(ii.total) if "total_std_sales" in totals else float(ii.total)
-				totals['vat'] = totals['vat'] + float(ii.total_taxes_and_charges) if "vat" in totals else float(ii.total_taxes_and_charges)
-				totals['ex_amount'] = totals['ex_amount'] + float(ii.grand_total) if "ex_amount" in totals else float(ii.grand_total)
-				totals['total'] = totals['total'] + float(ii.total + ii.total_taxes_and_charges + ii.grand_total) if "total" in totals else float(ii.total + ii.total_taxes_and_charges + ii.grand_total)
+def get_credit_notes(invoice_names):
+	return frappe.db.sql("""
+		SELECT name, return_against, total AS std_sales, total_taxes_and_charges AS vat, grand_total AS ex_amount
+		FROM `tabSales Invoice`
+		WHERE is_return = 1 AND docstatus = 1 AND return_against IN %s
+		ORDER BY return_against, name
+	""", [invoice_names], as_dict=True)
 
-				data.append({
-					"details": ii.name,
-					"std_sales": fmt_money(float(ii.total), 2, data[i]['invoice_currency']),
-					"vat": fmt_money(float(ii.total_taxes_and_charges), 2, data[i]['invoice_currency']),
-					"ex_amount": fmt_money(ii.grand_total, 2, data[i]['invoice_currency']),
-					"total": fmt_money(
-						float(ii.total + ii.total_taxes_and_charges + ii.grand_total),2, data[i]['invoice_currency'])
-				})
+def get_totals(rows):
+	totals = {"std_sales": 0.0, "vat": 0.0, "ex_amount": 0.0}
+	for row in rows:
+		for key in totals:
+			totals[key] += flt(row[key])
+	return totals
 
-def generate_sales_returns(filters,data,totals,sales_label):
+def format_amounts(row, currency):
+	std_sales, vat, ex_amount = flt(row["std_sales"]), flt(row["vat"]), flt(row["ex_amount"])
+	return {
+		"std_sales": fmt_money(std_sales, 2, currency),
+		"vat": fmt_money(vat, 2, currency),
+		"ex_amount": fmt_money(ex_amount, 2, currency),
+		"total": fmt_money(std_sales + vat + ex_amount, 2, currency)
+	}
 
-	efd_z_report_invoices = frappe.get_list("EFD Z Report Invoice", filters={"parent": filters.get("efd_report")},
-											fields=["*"])
-	for idx,i in enumerate(efd_z_report_invoices):
-		sales_invoice = frappe.get_doc("Sales Invoice", i.invoice_number).__dict__
-		if idx == 0:
-			data.append(sales_label)
-		totals['total_std_sales'] = totals['total_std_sales'] + float(sales_invoice['total']) if "total_std_sales" in totals else float(sales_invoice['total'])
-		totals['vat'] = totals['vat'] + float(sales_invoice['total_taxes_and_charges']) if "vat" in totals else float(sales_invoice['total_taxes_and_charges'])
-		totals['ex_amount'] = totals['ex_amount'] + float(sales_invoice['grand_total']) if "ex_amount" in totals else float(sales_invoice['grand_total'])
-		totals['total'] = totals['total'] + float(sales_invoice['total'] + sales_invoice['total_taxes_and_charges'] + sales_invoice['grand_total']) if "total" in totals else float(sales_invoice['total'] + sales_invoice['total_taxes_and_charges'] + sales_invoice['grand_total'])
-		data.append({
-			"details": i.invoice_number,
-			"std_sales": fmt_money(float(sales_invoice['total']), 2, i.invoice_currency),
-			"vat": fmt_money(float(sales_invoice['total_taxes_and_charges']), 2, i.invoice_currency),
-			"ex_amount": fmt_money(sales_invoice['grand_total'], 2, i.invoice_currency),
-			"total": fmt_money(
-				float(sales_invoice['total'] + sales_invoice['total_taxes_and_charges'] + sales_invoice['grand_total']),
-				2, i.invoice_currency),
-			"invoice_currency": i.invoice_currency
-		})
 def get_columns():
 
 	columns = [
@@ -82,4 +71,4 @@ def get_columns():
 		{"label": "Total", "fieldname": "total", "fieldtype": "Data","width": 170},
 	]
 
-	return columns
\ No newline at end of file
+	return columns
@@ -5,6 +5,10 @@ import frappe
 from frappe import _
 from frappe.utils import flt, getdate
 
+from csf_tz.csf_tz.doctype.csf_payroll_fact.csf_payroll_fact import (
+	get_slip_component_map,
+)
+
 
 def execute(filters=None):
 	filters = frappe._dict(filters or {})
@@ -150,26 +154,10 @@ def get_salary_slips(filters):
 
 
 def get_basic_pay_map(slip_names):
-	if not slip_names:
-		return {}
-
-	basic_rows = frappe.get_all(
-		"Salary Detail",
-		filters={
-			"parent": ["in", slip_names],
-			"parenttype": "Salary Slip",
-			"parentfield": "earnings",
-			"salary_component": "Basic",
-		},
-		fields=["parent", "amount"],
-		limit_page_length=0,
+	basic_map = get_slip_component_map(
+		slip_names, component_type="Earning", salary_component="Basic"
 	)
-
-	basic_map = {}
-	for row in basic_rows:
-		basic_map[row.parent] = flt(basic_map.get(row.parent)) + flt(row.amount)
-
-	return basic_map
+	return {slip: components.get("Basic") for slip, components in basic_map.items()}
 
 
 def get_employee_map(employee_ids):
@@ -7,11 +7,14 @@ import erpnext
 from frappe import _
 from frappe.utils import flt
 from frappe.utils.nestedset import get_descendants_of
+from csf_tz.csf_tz.doctype.csf_payroll_fact.csf_payroll_fact import (
+    COMPONENT_TYPES,
+    get_component_totals,
+    get_slip_component_map,
+)
 
 
 salary_slip = frappe.qb.DocType("Salary Slip")
-salary_detail = frappe.qb.DocType("Salary Detail")
-salary_component = frappe.qb.DocType("Salary Component")
 
 
 def execute(filters=None):
@@ -38,14 +41,16 @@ def execute(filters=None):
 
 
 def get_data(filters, salary_slips, currency, company_currency):
-    earning_types, ded_types = get_earning_and_deduction_types(salary_slips)
+    # only submitted salary slips have payroll facts
+    submitted = filters.get("docstatus") == "Submitted"
+    earning_types, ded_types = get_earning_and_deduction_types(salary_slips, submitted)
     columns = get_columns(filters, company_currency, earning_types, ded_types)
 
     ss_earning_map = get_salary_slip_details(
-        salary_slips, currency, company_currency, "earnings"
+        salary_slips, currency, company_currency, "earnings", submitted
     )
     ss_ded_map = get_salary_slip_details(
-        salary_slips, currency, company_currency, "deductions"
+        salary_slips, currency, company_currency, "deductions", submitted
     )
 
     doj_map = get_employee_doj_map()
@@ -305,9 +310,9 @@ def get_data(filters, salary_slips, currency, company_currency):
     return columns, data
 
 
-def get_earning_and_deduction_types(salary_slips):
+def get_earning_and_deduction_types(salary_slips, submitted):
     salary_component_and_type = {_("Earning"): [], _("Deduction"): []}
-    salary_components = get_salary_components(salary_slips)
+    salary_components = get_salary_components(salary_slips, submitted)
 
     for component in salary_components:
         component_type = get_salary_component_type(component.salary_component)
@@ -413,16 +418,10 @@ def get_columns(filters, company_currency, earning_types, ded_types):
     return columns
 
 
-def get_salary_components(salary_slips):
-    return (
-        frappe.qb.from_(salary_detail)
-        .where(
-            (salary_detail.amount != 0)
-            & (salary_detail.parent.isin([d.name for d in salary_slips]))
-        )
-        .select(salary_detail.salary_component)
-        .distinct()
-    ).run(as_dict=True)
+def get_salary_components(salary_slips, submitted):
+    return get_component_totals(
+        [d.name for d in salary_slips], submitted=submitted, non_zero=True
+    )
 
 
 def get_salary_component_type(salary_component):
@@ -474,37 +473,15 @@ def get_employee_doj_map():
     return frappe._dict(result)
 
 
-def get_salary_slip_details(salary_slips, currency, company_currency, component_type):
-    salary_slips = [ss.name for ss in salary_slips]
-
-    result = (
-        frappe.qb.from_(salary_slip)
-        .join(salary_detail)
-        .on(salary_slip.name == salary_detail.parent)
-        .where(
-            (salary_detail.parent.isin(salary_slips))
-            & (salary_detail.parentfield == component_type)
-        )
-        .select(
-            salary_detail.parent,
-            salary_detail.salary_component,
-            salary_detail.amount,
-            salary_slip.exchange_rate,
-        )
-    ).run(as_dict=1)
-
-    ss_map = {}
-
-    for d in result:
-        ss_map.setdefault(d.parent, frappe._dict()).setdefault(d.salary_component, 0.0)
-        if currency == company_currency:
-            ss_map[d.parent][d.salary_component] += flt(d.amount) * flt(
-                d.exchange_rate if d.exchange_rate else 1
-            )
-        else:
-            ss_map[d.parent][d.salary_component] += flt(d.amount)
-
-    return ss_map
+def get_salary_slip_details(
+    salary_slips, currency, company_currency, component_type, submitted
+):
+    return get_slip_component_map(
+        [ss.name for ss in salary_slips],
+        submitted=submitted,
+        base_currency=currency == company_currency,
+        component_type=COMPONENT_TYPES[component_type],
+    )
 
 
 def get_departments(department, company):
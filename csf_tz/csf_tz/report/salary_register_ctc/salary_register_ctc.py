@@ -6,6 +6,10 @@ import erpnext
 from frappe.utils import flt
 from frappe import _, msgprint
 from frappe.utils.nestedset import get_descendants_of
+from csf_tz.csf_tz.doctype.csf_payroll_fact.csf_payroll_fact import (
+    get_component_totals,
+    get_slip_component_map,
+)
 
 
 def execute(filters=None):
@@ -19,9 +23,15 @@ def execute(filters=None):
     if not salary_slips:
         return [], []
 
-    columns, earning_types, ded_types, ded_types_ctc = get_columns(salary_slips)
-    ss_earning_map = get_ss_earning_map(salary_slips, currency, company_currency)
-    ss_ded_map = get_ss_ded_map(salary_slips, currency, company_currency)
+    # only submitted salary slips have payroll facts
+    submitted = filters.get("docstatus") == "Submitted"
+    columns, earning_types, ded_types, ded_types_ctc = get_columns(
+        salary_slips, submitted
+    )
+    ss_earning_map = get_ss_earning_map(
+        salary_slips, currency, company_currency, submitted
+    )
+    ss_ded_map = get_ss_ded_map(salary_slips, currency, company_currency, submitted)
     doj_map = get_employee_doj_map()
     
     data = []
@@ -86,7 +96,7 @@ def execute(filters=None):
     return columns, data
 
 
-def get_columns(salary_slips):
+def get_columns(salary_slips, submitted):
     """
     columns = [
         _("Salary Slip ID") + ":Link/Salary Slip:150",
@@ -120,16 +130,14 @@ def get_columns(salary_slips):
     ]
 
     salary_components = {_("Earning"): [], _("Deduction"): []}
+    components = {_("Deduction"): []}
 
-    for component in frappe.db.sql(
-        """select distinct sd.salary_component, sc.type
-        from `tabSalary Detail` sd, `tabSalary Component` sc
-        where sc.do_not_include_in_total = 0 and sc.name=sd.salary_component and sd.amount != 0 and sd.parent in (%s)"""
-        % (", ".join(["%s"] * len(salary_slips))),
-        tuple([d.name for d in salary_slips]),
-        as_dict=1,
-    ):
-        salary_components[_(component.type)].append(component.salary_component)
+    component_details = get_salary_component_details(salary_slips, submitted)
+    for component in component_details:
+        if not component.do_not_include_in_total:
+            salary_components[_(component.type)].append(component.name)
+        elif component.type == "Deduction":
+            components[_(component.type)].append(component.name)
 
     columns = (
         columns
@@ -142,25 +150,30 @@ def get_columns(salary_slips):
             _("Net Pay") + ":Currency:120",
         ]
     )
-    components = {_("Deduction"): []}
-    company_expenses = frappe.db.sql("""
-        SELECT distinct sd.salary_component, sc.type
-        FROM `tabSalary Detail` sd, `tabSalary Component` sc
-        WHERE sc.do_not_include_in_total = 1
-        AND sc.type = "Deduction"
-        AND sc.name=sd.salary_component
-        AND sd.amount != 0
-        AND sd.parent in (%s)"""
-        % (", ".join(["%s"] * len(salary_slips))), tuple([d.name for d in salary_slips]), as_dict=1
-    )
-    for entry in company_expenses:
-        components[_(entry.type)].append(entry.salary_component)
-    
     columns = (columns + [(d_ctc + ":Currency:120") for d_ctc in components[_("Deduction")]])
 
     return columns, salary_components[_("Earning")], salary_components[_("Deduction")], components[_("Deduction")]
 
 
+def get_salary_component_details(salary_slips, submitted):
+    """Type and total inclusion of the components with amounts on the given salary slips"""
+    salary_components = [
+        d.salary_component
+        for d in get_component_totals(
+            [d.name for d in salary_slips], submitted=submitted, non_zero=True
+        )
+    ]
+    if not salary_components:
+        return []
+
+    return frappe.get_all(
+        "Salary Component",
+        filters={"name": ["in", salary_components]},
+        fields=["name", "type", "do_not_include_in_total"],
+        order_by="name",
+    )
+
+
 def get_salary_slips(filters, company_currency):
     filters.update(
         {"from_date": filters.get("from_date"), "to_date": filters.get("to_date")}
@@ -222,53 +235,21 @@ def get_employee_doj_map():
     )
 
 
-def get_ss_earning_map(salary_slips, currency, company_currency):
-    ss_earnings = frappe.db.sql(
-        """select sd.parent, sd.salary_component, sd.amount, ss.exchange_rate, ss.name
-        from `tabSalary Detail` sd, `tabSalary Slip` ss where sd.parent=ss.name and sd.parent in (%s)"""
-        % (", ".join(["%s"] * len(salary_slips))),
-        tuple([d.name for d in salary_slips]),
-        as_dict=1,
+def get_ss_earning_map(salary_slips, currency, company_currency, submitted):
+    return get_slip_component_map(
+        [d.name for d in salary_slips],
+        submitted=submitted,
+        base_currency=currency == company_currency,
     )
 
-    ss_earning_map = {}
-    for d in ss_earnings:
-        ss_earning_map.setdefault(d.parent, frappe._dict()).setdefault(
-            d.salary_component, []
-        )
-        if currency == company_currency:
-            ss_earning_map[d.parent][d.salary_component] = flt(d.amount) * flt(
-                d.exchange_rate if d.exchange_rate else 1
-            )
-        else:
-            ss_earning_map[d.parent][d.salary_component] = flt(d.amount)
-
-    return ss_earning_map
-
 
-def get_ss_ded_map(salary_slips, currency, company_currency):
-    ss_deductions = frappe.db.sql(
-        """select sd.parent, sd.salary_component, sd.amount, ss.exchange_rate, ss.name
-        from `tabSalary Detail` sd, `tabSalary Slip` ss where sd.parent=ss.name and sd.parent in (%s)"""
-        % (", ".join(["%s"] * len(salary_slips))),
-        tuple([d.name for d in salary_slips]),
-        as_dict=1,
+def get_ss_ded_map(salary_slips, currency, company_currency, submitted):
+    return get_slip_component_map(
+        [d.name for d in salary_slips],
+        submitted=submitted,
+        base_currency=currency == company_currency,
     )
 
-    ss_ded_map = {}
-    for d in ss_deductions:
-        ss_ded_map.setdefault(d.parent, frappe._dict()).setdefault(
-            d.salary_component, []
-        )
-        if currency == company_currency:
-            ss_ded_map[d.parent][d.salary_component] = flt(d.amount) * flt(
-                d.exchange_rate if d.exchange_rate else 1
-            )
-        else:
-            ss_ded_map[d.parent][d.salary_component] = flt(d.amount)
-        
-    return ss_ded_map
-
 
 def get_departments(department, company):
     departments_list = get_descendants_of("Department", department)
@@ -7,6 +7,7 @@ import erpnext
 from frappe.utils import flt
 from frappe import _, msgprint
 from frappe.utils.nestedset import get_descendants_of
+from csf_tz.csf_tz.doctype.csf_payroll_fact.csf_payroll_fact import get_component_totals
 
 
 def execute(filters=None):
@@ -38,6 +39,8 @@ def get_data(filters=None):
     salary_slips = get_salary_slips(filters, company_currency)
     if not salary_slips:
         return []
+    # only submitted salary slips have payroll facts
+    submitted = filters.get("docstatus") == "Submitted"
 
     blank_line = {"salary_component": "", "total": ""}
     total_employees = len(salary_slips)
@@ -46,14 +49,14 @@ def get_data(filters=None):
     data.append(total_employee_record)
     data.append(blank_line)
 
-    ss_basic_map = get_ss_basic_map(salary_slips, currency, company_currency)
+    ss_basic_map = get_ss_basic_map(salary_slips, currency, company_currency, submitted)
     data.extend(ss_basic_map)
     t_basic = 0
     for basic in ss_basic_map:
         t_basic = t_basic + basic["total"]
 
     ss_earning_map = get_ss_earning_map(
-        salary_slips, currency, company_currency)
+        salary_slips, currency, company_currency, submitted)
     data.extend(ss_earning_map)
 
     #frappe.msgprint(str(ss_earning_map))
@@ -67,7 +70,7 @@ def get_data(filters=None):
     gp_record = {"salary_component": "GROSS PAY", "total": gross_pay}
     data.append(gp_record)
 
-    ss_deduction_map = get_ss_ded_map(salary_slips, currency, company_currency)
+    ss_deduction_map = get_ss_ded_map(salary_slips, currency, company_currency, submitted)
     data.extend(ss_deduction_map)
 
     total_deduction = 0
@@ -93,46 +96,41 @@ def get_salary_slips(filters, company_currency):
     return salary_slips or []
 
 
-def get_ss_basic_map(salary_slips, currency, company_currency):
-    ss_basic = frappe.db.sql("""
-        SELECT sd.salary_component, SUM(sd.amount) as total 
-        FROM `tabSalary Detail` sd, `tabSalary Slip` ss where sd.parent=ss.name 
-        AND sd.parent in (%s)
-        AND do_not_include_in_total = 0 
-        AND sd.parentfield = 'earnings' 
-        AND sd.salary_component = 'Basic'
-        GROUP BY sd.salary_component 
-        ORDER BY sd.salary_component ASC""" %
-                             (', '.join(['%s']*len(salary_slips))), tuple([d.name for d in salary_slips]), as_dict=1)
-
-    return ss_basic
-
-
-def get_ss_earning_map(salary_slips, currency, company_currency):
-    ss_earnings = frappe.db.sql("""
-        SELECT sd.salary_component, SUM(sd.amount) as total 
-        FROM `tabSalary Detail` sd, `tabSalary Slip` ss where sd.parent=ss.name 
-        AND sd.parent in (%s)
-        AND do_not_include_in_total = 0 
-        AND sd.parentfield = 'earnings' 
-        AND sd.salary_component != 'Basic'
-        GROUP BY sd.salary_component 
-        ORDER BY sd.salary_component ASC""" %
-                                (', '.join(['%s']*len(salary_slips))), tuple([d.name for d in salary_slips]), as_dict=1)
-
-    return ss_earnings
-
-
-def get_ss_ded_map(salary_slips, currency, company_currency):
-    ss_deductions = frappe.db.sql("""
-        SELECT sd.salary_component, SUM(sd.amount) * -1 as total 
-        FROM `tabSalary Detail` sd, `tabSalary Slip` ss where sd.parent=ss.name AND sd.parent in (%s)
-        AND do_not_include_in_total = 0 
-        AND sd.parentfield = 'deductions' 
-        GROUP BY sd.salary_component 
-        ORDER BY sd.salary_component ASC""" %
-                                  (', '.join(['%s']*len(salary_slips))), tuple([d.name for d in salary_slips]), as_dict=1)
-    return ss_deductions
+def get_ss_basic_map(salary_slips, currency, company_currency, submitted):
+    return get_totals(
+        salary_slips,
+        submitted,
+        component_type="Earning",
+        salary_component="Basic",
+    )
+
+
+def get_ss_earning_map(salary_slips, currency, company_currency, submitted):
+    return get_totals(
+        salary_slips,
+        submitted,
+        component_type="Earning",
+        exclude_salary_component="Basic",
+    )
+
+
+def get_ss_ded_map(salary_slips, currency, company_currency, submitted):
+    return [
+        {"salary_component": d["salary_component"], "total": d["total"] * -1}
+        for d in get_totals(salary_slips, submitted, component_type="Deduction")
+    ]
+
+
+def get_totals(salary_slips, submitted, **filters):
+    return [
+        {"salary_component": d.salary_component, "total": d.amount}
+        for d in get_component_totals(
+            [d.name for d in salary_slips],
+            submitted=submitted,
+            include_in_total_only=True,
+            **filters
+        )
+    ]
 
 
 def get_conditions(filters, company_currency):
@@ -4,10 +4,10 @@ import calendar
 from frappe.utils import flt, cstr, getdate
 from frappe import _, msgprint
 from frappe.utils.nestedset import get_descendants_of
-from frappe.query_builder import DocType, functions as fn, Order
+from frappe.query_builder import DocType
+from csf_tz.csf_tz.doctype.csf_payroll_fact.csf_payroll_fact import get_component_totals
 
 ss = DocType("Salary Slip")
-sd = DocType("Salary Detail")
 
 
 def execute(filters=None):
@@ -630,117 +630,6 @@ def get_prev_month_date(filters):
     return prev_first_date, prev_last_date, prev_month, prev_year
 
 
-def get_prev_ss_basic_map(filters, prev_salary_slips):
-    prev_ss_basic_query = (
-        frappe.qb.from_(sd)
-        .inner_join(ss)
-        .on(sd.parent == ss.name)
-        .select(sd.salary_component, fn.Sum(sd.amount).as_("total_prev_month"))
-        .where(
-            (sd.parent.isin([d.name for d in prev_salary_slips]))
-            & (sd.do_not_include_in_total == 0)
-            & (sd.parentfield == "earnings")
-            & (sd.salary_component.like("Basic"))
-        )
-        .groupby(sd.salary_component)
-        .orderby(sd.salary_component, Order.asc)
-    )
-    if filters.get("based_on_department") == 1:
-        prev_ss_basic_query = prev_ss_basic_query.select(ss.department)
-        prev_ss_basic_query = prev_ss_basic_query.groupby(ss.department)
-        if filters.get("department"):
-            prev_ss_basic_query = prev_ss_basic_query.where(
-                ss.department == filters.get("department")
-            )
-
-    if filters.get("based_on_cost_center") == 1:
-        prev_ss_basic_query = prev_ss_basic_query.select(ss.payroll_cost_center)
-        prev_ss_basic_query = prev_ss_basic_query.groupby(ss.payroll_cost_center)
-        if filters.get("cost_center"):
-            prev_ss_basic_query = prev_ss_basic_query.where(
-                ss.payroll_cost_center == filters.get("cost_center")
-            )
-    prev_ss_basic_query = prev_ss_basic_query.groupby(sd.salary_component)
-    prev_ss_basic_data = prev_ss_basic_query.run(as_dict=1)
-
-    return prev_ss_basic_data or []
-
-
-def get_prev_ss_earn_map(filters, prev_salary_slips):
-    prev_ss_earnings_query = (
-        frappe.qb.from_(sd)
-        .inner_join(ss)
-        .on(sd.parent == ss.name)
-        .select(sd.salary_component, fn.Sum(sd.amount).as_("total_prev_month"))
-        .where(
-            (sd.parent.isin([d.name for d in prev_salary_slips]))
-            & (sd.do_not_include_in_total == 0)
-            & (sd.parentfield == "earnings")
-            & (sd.salary_component.not_like("Basic"))
-        )
-        .groupby(sd.salary_component)
-        .orderby(sd.salary_component, Order.asc)
-    )
-    if filters.get("based_on_department") == 1:
-        prev_ss_earnings_query = prev_ss_earnings_query.select(ss.department)
-        prev_ss_earnings_query = prev_ss_earnings_query.groupby(ss.department)
-        if filters.get("department"):
-            prev_ss_earnings_query = prev_ss_earnings_query.where(
-                ss.department == filters.get("department")
-            )
-
-    if filters.get("based_on_cost_center") == 1:
-        prev_ss_earnings_query = prev_ss_earnings_query.select(ss.payroll_cost_center)
-        prev_ss_earnings_query = prev_ss_earnings_query.groupby(ss.payroll_cost_center)
-        if filters.get("cost_center"):
-            prev_ss_earnings_query = prev_ss_earnings_query.where(
-                ss.payroll_cost_center == filters.get("cost_center")
-            )
-    prev_ss_earnings_query = prev_ss_earnings_query.groupby(sd.salary_component)
-    prev_ss_earnings_data = prev_ss_earnings_query.run(as_dict=1)
-
-    return prev_ss_earnings_data or []
-
-
-def get_prev_ss_ded_map(filters, prev_salary_slips):
-    prev_ss_deductions_query = (
-        frappe.qb.from_(sd)
-        .inner_join(ss)
-        .on(sd.parent == ss.name)
-        .select(sd.salary_component, fn.Sum(sd.amount).as_("total_prev_month"))
-        .where(
-            (sd.parent.isin([d.name for d in prev_salary_slips]))
-            & (sd.do_not_include_in_total == 0)
-            & (sd.parentfield == "deductions")
-        )
-        .groupby(sd.salary_component)
-        .orderby(sd.salary_component, Order.asc)
-    )
-    if filters.get("based_on_department") == 1:
-        prev_ss_deductions_query = prev_ss_deductions_query.select(ss.department)
-        prev_ss_deductions_query = prev_ss_deductions_query.groupby(ss.department)
-        if filters.get("department"):
-            prev_ss_deductions_query = prev_ss_deductions_query.where(
-                ss.department == filters.get("department")
-            )
-
-    if filters.get("based_on_cost_center") == 1:
-        prev_ss_deductions_query = prev_ss_deductions_query.select(
-            ss.payroll_cost_center
-        )
-        prev_ss_deductions_query = prev_ss_deductions_query.groupby(
-            ss.payroll_cost_center
-        )
-        if filters.get("cost_center"):
-            prev_ss_deductions_query = prev_ss_deductions_query.where(
-                ss.payroll_cost_center == filters.get("cost_center")
-            )
-    prev_ss_deductions_query = prev_ss_deductions_query.groupby(sd.salary_component)
-    prev_ss_deductions_data = prev_ss_deductions_query.run(as_dict=1)
-
-    return prev_ss_deductions_data or []
-
-
 def get_prev_salary_slips(filters, company_currency, prev_first_date, prev_last_date):
     prev_ss_query = (
         frappe.qb.from_(ss)
@@ -812,110 +701,103 @@ def get_cur_salary_slips(filters, company_currency):
     return cur_salary_slips or []
 
 
-def get_cur_ss_basic_map(filters, cur_salary_slips):
-    cur_ss_basic_query = (
-        frappe.qb.from_(sd)
-        .inner_join(ss)
-        .on(sd.parent == ss.name)
-        .select(sd.salary_component, fn.Sum(sd.amount).as_("total_cur_month"))
-        .where(
-            (sd.parent.isin([d.name for d in cur_salary_slips]))
-            & (sd.do_not_include_in_total == 0)
-            & (sd.parentfield == "earnings")
-            & (sd.salary_component.like("Basic"))
-        )
-        .groupby(sd.salary_component)
-        .orderby(sd.salary_component, Order.asc)
+def get_prev_ss_basic_map(filters, prev_salary_slips):
+    return get_component_totals_for(
+        filters,
+        prev_salary_slips,
+        "total_prev_month",
+        component_type="Earning",
+        salary_component="Basic",
     )
-    if filters.get("based_on_department") == 1:
-        cur_ss_basic_query = cur_ss_basic_query.select(ss.department)
-        cur_ss_basic_query = cur_ss_basic_query.groupby(ss.department)
-        if filters.get("department"):
-            cur_ss_basic_query = cur_ss_basic_query.where(
-                ss.department == filters.get("department")
-            )
 
-    if filters.get("based_on_cost_center") == 1:
-        cur_ss_basic_query = cur_ss_basic_query.select(ss.payroll_cost_center)
-        cur_ss_basic_query = cur_ss_basic_query.groupby(ss.payroll_cost_center)
-        if filters.get("cost_center"):
-            cur_ss_basic_query = cur_ss_basic_query.where(
-                ss.payroll_cost_center == filters.get("cost_center")
-            )
-    cur_ss_basic_query = cur_ss_basic_query.groupby(sd.salary_component)
-    cur_ss_basic_data = cur_ss_basic_query.run(as_dict=1)
 
-    return cur_ss_basic_data or []
+def get_prev_ss_earn_map(filters, prev_salary_slips):
+    return get_component_totals_for(
+        filters,
+        prev_salary_slips,
+        "total_prev_month",
+        component_type="Earning",
+        exclude_salary_component="Basic",
+    )
 
 
-def get_cur_ss_earning_map(filters, cur_salary_slips):
-    cur_ss_earnings_query = (
-        frappe.qb.from_(sd)
-        .inner_join(ss)
-        .on(sd.parent == ss.name)
-        .select(sd.salary_component, fn.Sum(sd.amount).as_("total_cur_month"))
-        .where(
-            (sd.parent.isin([d.name for d in cur_salary_slips]))
-            & (sd.do_not_include_in_total == 0)
-            & (sd.parentfield == "earnings")
-            & (sd.salary_component.not_like("Basic"))
-        )
-        .groupby(sd.salary_component)
-        .orderby(sd.salary_component, Order.asc)
+def get_prev_ss_ded_map(filters, prev_salary_slips):
+    return get_component_totals_for(
+        filters, prev_salary_slips, "total_prev_month", component_type="Deduction"
     )
-    if filters.get("based_on_department") == 1:
-        cur_ss_earnings_query = cur_ss_earnings_query.select(ss.department)
-        cur_ss_earnings_query = cur_ss_earnings_query.groupby(ss.department)
-        if filters.get("department"):
-            cur_ss_earnings_query = cur_ss_earnings_query.where(
-                ss.department == filters.get("department")
-            )
 
-    if filters.get("based_on_cost_center") == 1:
-        cur_ss_earnings_query = cur_ss_earnings_query.select(ss.payroll_cost_center)
-        cur_ss_earnings_query = cur_ss_earnings_query.groupby(ss.payroll_cost_center)
-        if filters.get("cost_center"):
-            cur_ss_earnings_query = cur_ss_earnings_query.where(
-                ss.payroll_cost_center == filters.get("cost_center")
-            )
 
-    cur_ss_earnings_query = cur_ss_earnings_query.groupby(sd.salary_component)
-    cur_ss_earnings_data = cur_ss_earnings_query.run(as_dict=1)
+def get_cur_ss_basic_map(filters, cur_salary_slips):
+    return get_component_totals_for(
+        filters,
+        cur_salary_slips,
+        "total_cur_month",
+        submitted=filters.get("docstatus") == "Submitted",
+        component_type="Earning",
+        salary_component="Basic",
+    )
 
-    return cur_ss_earnings_data or []
+
+def get_cur_ss_earning_map(filters, cur_salary_slips):
+    return get_component_totals_for(
+        filters,
+        cur_salary_slips,
+        "total_cur_month",
+        submitted=filters.get("docstatus") == "Submitted",
+        component_type="Earning",
+        exclude_salary_component="Basic",
+    )
 
 
 def get_cur_ss_ded_map(filters, cur_salary_slips):
-    cur_ss_deduction_query = (
-        frappe.qb.from_(sd)
-        .inner_join(ss)
-        .on(sd.parent == ss.name)
-        .select(sd.salary_component, fn.Sum(sd.amount).as_("total_cur_month"))
-        .where(
-            (sd.parent.isin([d.name for d in cur_salary_slips]))
-            & (sd.do_not_include_in_total == 0)
-            & (sd.parentfield == "deductions")
-        )
+    return get_component_totals_for(
+        filters,
+        cur_salary_slips,
+        "total_cur_month",
+        submitted=filters.get("docstatus") == "Submitted",
+        component_type="Deduction",
     )
-    if filters.get("based_on_department") == 1:
-        cur_ss_deduction_query = cur_ss_deduction_query.select(ss.department)
-        cur_ss_deduction_query = cur_ss_deduction_query.groupby(ss.department)
-        if filters.get("department"):
-            cur_ss_deduction_query = cur_ss_deduction_query.where(
-                ss.department == filters.get("department")
-            )
 
+
+def get_component_totals_for(
+    filters, salary_slips, total_field, submitted=True, **component_filters
+):
+    """
+    Component totals of the salary slips from the payroll facts, by department or
+    cost center when the report is based on one
+    """
+    group_by = ["salary_component"]
+    if filters.get("based_on_department") == 1:
+        group_by.append("department")
     if filters.get("based_on_cost_center") == 1:
-        cur_ss_deduction_query = cur_ss_deduction_query.select(ss.payroll_cost_center)
-        cur_ss_deduction_query = cur_ss_deduction_query.groupby(ss.payroll_cost_center)
-        if filters.get("cost_center"):
-            cur_ss_deduction_query = cur_ss_deduction_query.where(
-                ss.payroll_cost_center == filters.get("cost_center")
-            )
-    cur_ss_deduction_query = cur_ss_deduction_query.groupby(sd.salary_component)
-    cur_ss_deductions_data = cur_ss_deduction_query.run(as_dict=1)
+        group_by.append("payroll_cost_center")
+
+    data = []
+    for row in get_component_totals(
+        [d.name for d in salary_slips],
+        group_by=group_by,
+        submitted=submitted,
+        include_in_total_only=True,
+        **component_filters,
+    ):
+        if (
+            filters.get("based_on_department") == 1
+            and filters.get("department")
+            and row.department != filters.get("department")
+        ):
+            continue
+        if (
+            filters.get("based_on_cost_center") == 1
+            and filters.get("cost_center")
+            and row.payroll_cost_center != filters.get("cost_center")
+        ):
+            continue
+
+        row[total_field] = row.pop("amount")
+        del row["base_amount"]
+        data.append(row)
 
-    return cur_ss_deductions_data or []
+    return data
 
 
 def get_departments(department, company):
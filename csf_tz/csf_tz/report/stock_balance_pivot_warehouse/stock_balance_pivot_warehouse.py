@@ -3,85 +3,77 @@
 
 from __future__ import unicode_literals
 import frappe
-from frappe.utils import flt
+from frappe.utils import flt, getdate
 from frappe import _
+from csf_tz.csf_tz.report.stock_ledger_utils import (
+	get_leaf_warehouses,
+	get_stock_balances,
+	group_stock_balances,
+)
 
 def execute(filters=None):
 	if not filters: filters = {}
-	stock_ledger_entry = get_stock_ledger_entries(filters)
-	if not stock_ledger_entry: return [], []
-
-	columns, warehouses = get_columns(stock_ledger_entry)
-	sle_warehouse_map = get_sle_warehouse_map(stock_ledger_entry)
 
+	balances = group_stock_balances(
+		get_stock_balances(
+			getdate(filters.get("from_date")),
+			getdate(filters.get("to_date")),
+			items=get_items(filters),
+			warehouses=get_leaf_warehouses(filters.get("warehouse")) if filters.get("warehouse") else None,
+		),
+		lambda company, item_code, warehouse: (item_code, warehouse),
+	)
+	if not balances: return [], []
+
+	# items that moved in the period, with their balance in every warehouse at the end of it
+	moved_items = {item_code for (item_code, warehouse), balance in balances.items()
+		if balance.in_qty or balance.out_qty}
+	item_warehouse_map = {}
+	for (item_code, warehouse), balance in balances.items():
+		if item_code in moved_items:
+			item_warehouse_map.setdefault(item_code, {})[warehouse] = flt(balance.bal_qty)
+
+	warehouses = sorted({warehouse for warehouse_map in item_warehouse_map.values()
+		for warehouse, qty in warehouse_map.items() if qty})
+	columns = get_columns(warehouses)
 
 	data = []
-	for sle in stock_ledger_entry:
-		row = [sle.item_code, sle.item_name, sle.brand, sle.item_group]
+	for item in get_item_details(item_warehouse_map):
+		warehouse_map = item_warehouse_map[item.item_code]
+		total_qty = sum(warehouse_map.values())
+		if filters.get("filter_total_zero_qty") and not flt(total_qty):
+			continue
 
-		for e in warehouses:
-			row.append(sle_warehouse_map.get(sle.item_code, {}).get(e))
-		#row += [total_qty]
+		row = [item.item_code, item.item_name, item.brand, item.item_group]
+		row += [warehouse_map.get(warehouse) for warehouse in warehouses]
+		row += [total_qty]
 
 		data.append(row)
 
 	return columns, data
 
-def get_columns(stock_ledger_entry):
+def get_columns(warehouses):
 	columns = [
 		_("Item Code") + ":Link/Item:150", _("Item") + ":Data/Item Name:150", _("Brand") + ":Link/Brand:150", _("Item Group") + ":Link/Item Group:150"
 	]
 
-	warehouses = {_("Warehouse"): []}
-
-	for warehouse in frappe.db.sql("""select distinct sle.warehouse
-		from `tabStock Ledger Entry` sle
-		where sle.actual_qty != 0 and sle.item_code in (%s)""" %
-		(', '.join(['%s']*len(stock_ledger_entry))), tuple([d.item_code for d in stock_ledger_entry]), as_dict=1):
-		warehouses[_("Warehouse")].append(warehouse.warehouse)
-
-	columns = columns + [(e + ":Float:120") for e in warehouses[_("Warehouse")]] + \
+	columns = columns + [(e + ":Float:120") for e in warehouses] + \
 		[_("Total Stock") + ":Float:120"]
-	
-	#frappe.msgprint(warehouses[_("Warehouse")])
-
-	return columns, warehouses[_("Warehouse")]
-
-def get_stock_ledger_entries(filters):
-	filters.update({"from_date": filters.get("from_date"), "to_date":filters.get("to_date")})
-	conditions, filters = get_conditions(filters)
-	stock_ledger_entry = frappe.db.sql("""select sle.item_code, i.item_name, i.brand, i.item_group, sle.warehouse, sum(sle.actual_qty)
-		from `tabStock Ledger Entry` sle
-		inner join `tabItem` i on sle.item_code = i.item_code
-		where %s
-		group by i.item_name, i.brand, i.item_group, sle.warehouse
-		order by i.brand, i.item_group, sle.item_code""" % conditions, filters, as_dict=1)
-
-	return stock_ledger_entry or []
-
-def get_conditions(filters):
-	conditions = ""
-
-	if filters.get("from_date"): conditions += "posting_date >= %(from_date)s"
-	if filters.get("to_date"): conditions += " and posting_date <= %(to_date)s"
-	if filters.get("item_group"): conditions += " and i.item_group = %(item_group)s"
-	if filters.get("brand"): conditions += " and i.brand = %(brand)s"
-	if filters.get("warehouse"): conditions += " and sle.warehouse = %(warehouse)s"
 
-	return conditions, filters
+	return columns
 
-def get_sle_warehouse_map(stock_ledger_entry):
-	sle_warehouses = frappe.db.sql("""select sle.item_code, sle.warehouse, sum(actual_qty)
-		from `tabStock Ledger Entry` sle
-		inner join `tabItem` i on sle.item_code = i.item_code
-		where item_code in (%s)
-		group by i.item_name, i.brand, i.item_group, sle.warehouse""" %
-		(', '.join(['%s']*len(stock_ledger_entry))), tuple([d.item_code for d in stock_ledger_entry]), as_dict=1)
+def get_items(filters):
+	"""Items matching the item filters, None when there are none"""
+	item_filters = {}
+	if filters.get("item_code"): item_filters["name"] = filters.get("item_code")
+	if filters.get("item_group"): item_filters["item_group"] = filters.get("item_group")
+	if filters.get("brand"): item_filters["brand"] = filters.get("brand")
 
-	sle_warehouse_map = {}
-	for d in sle_warehouses:
-		sle_warehouse_map.setdefault(d.item_code, frappe._dict()).setdefault(d.warehouse, [])
-		#frappe.msgprint(d)
-		sle_warehouse_map[d.item_code][d.warehouse] = flt(d.actual_qty)
+	if item_filters:
+		return frappe.get_all("Item", filters=item_filters, pluck="name")
 
-	return sle_warehouse_map
+def get_item_details(item_warehouse_map):
+	return frappe.get_all("Item",
+		filters={"name": ["in", list(item_warehouse_map)]},
+		fields=["item_code", "item_name", "brand", "item_group"],
+		order_by="brand, item_group, item_code")
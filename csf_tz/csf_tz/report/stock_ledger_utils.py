@@ -0,0 +1,400 @@
+# Copyright (c) 2026, Aakvatech and contributors
+# For license information, please see license.txt
+
+import sys
+from functools import lru_cache
+
+import frappe
+from frappe.utils import flt
+
+# string columns repeated on many ledger rows, one copy of each value is kept
+INTERNED_FIELDS = {"item_code", "warehouse", "voucher_type", "company", "batch_no"}
+
+
+class CompactRow:
+    """
+    A row with fixed fields stored in `__slots__`
+
+    Reads like a `frappe._dict` (`row.field`, `row["field"]`, `row.get("field")`)
+    at a fraction of the memory, for reports that hold many ledger rows at once.
+    Classes with the fields are made by `get_compact_row_type`.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for field, value in zip(self.__slots__, values):
+            setattr(self, field, value)
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field)
+
+    def __setitem__(self, field, value):
+        setattr(self, field, value)
+
+    def get(self, field, default=None):
+        return getattr(self, field, default)
+
+    def as_dict(self):
+        return frappe._dict({field: getattr(self, field) for field in self.__slots__})
+
+
+@lru_cache(maxsize=None)
+def get_compact_row_type(fields):
+    """`CompactRow` class with the given tuple of fields, missing values default to None"""
+
+    def __init__(self, *values):
+        CompactRow.__init__(self, *values)
+        for field in fields[len(values) :]:
+            setattr(self, field, None)
+
+    return type(
+        "CompactRow", (CompactRow,), {"__slots__": fields, "__init__": __init__}
+    )
+
+
+def get_compact_rows(query, fields, values=None, extra_fields=()):
+    """
+    Rows of `query` as `CompactRow`s, read through an unbuffered cursor
+
+    Args:
+        query: SQL string or query builder query selecting `fields`, in that order
+        fields (list): Names of the selected columns
+        values: Query values of an SQL string
+        extra_fields (list): More fields on each row for the report to fill in,
+            None until set
+
+    Returns:
+        list: One `CompactRow` per result row
+    """
+    row_type = get_compact_row_type(tuple(fields) + tuple(extra_fields))
+    interned = [i for i, field in enumerate(fields) if field in INTERNED_FIELDS]
+
+    rows = []
+    # the result is streamed from the server instead of being copied to the client first,
+    # no other query can run until it is read to the end
+    with frappe.db.unbuffered_cursor():
+        if isinstance(query, str):
+            result = frappe.db.sql(query, values, as_iterator=True)
+        else:
+            result = query.run(as_iterator=True)
+
+        for row in result:
+            if interned:
+                row = list(row)
+                for i in interned:
+                    if row[i]:
+                        row[i] = sys.intern(row[i])
+            rows.append(row_type(*row))
+
+    return rows
+
+
+def get_opening_balances(from_date, items=None, warehouses=None, company=None):
+    """
+    Balance of each (item_code, warehouse) before `from_date`
+
+    Picks the last Stock Ledger Entry before `from_date` of every pair in one query,
+    instead of a `get_previous_sle` call per pair.
+
+    Returns:
+        dict: {(item_code, warehouse): {company, qty_after_transaction, valuation_rate, stock_value}}
+    """
+    conditions = []
+    values = {"from_date": from_date}
+    if items is not None:
+        if not items:
+            return {}
+        conditions.append("AND sle.item_code IN %(items)s")
+        values["items"] = list(items)
+    if warehouses is not None:
+        if not warehouses:
+            return {}
+        conditions.append("AND sle.warehouse IN %(warehouses)s")
+        values["warehouses"] = list(warehouses)
+    if company:
+        conditions.append("AND sle.company = %(company)s")
+        values["company"] = company
+
+    rows = frappe.db.sql(
+        """
+        SELECT company, item_code, warehouse, qty_after_transaction, valuation_rate, stock_value
+        FROM (
+            SELECT
+                sle.company,
+                sle.item_code,
+                sle.warehouse,
+                sle.qty_after_transaction,
+                sle.valuation_rate,
+                sle.stock_value,
+                ROW_NUMBER() OVER (
+                    PARTITION BY sle.item_code, sle.warehouse
+                    ORDER BY sle.posting_date DESC, sle.posting_time DESC, sle.creation DESC
+                ) AS row_no
+            FROM `tabStock Ledger Entry` sle
+            WHERE sle.is_cancelled = 0
+                AND sle.posting_date < %(from_date)s
+                {conditions}
+        ) last_sle
+        WHERE row_no = 1
+        """.format(conditions=" ".join(conditions)),
+        values,
+        as_dict=True,
+    )
+
+    return {(row.item_code, row.warehouse): row for row in rows}
+
+
+def get_stock_balances(
+    from_date,
+    to_date,
+    items=None,
+    warehouses=None,
+    company=None,
+    with_excise=False,
+    exclude_material_transfer=False,
+):
+    """
+    Opening, in, out and balance quantities and values per (company, item_code, warehouse)
+
+    The opening comes from the balance snapshot before `from_date`
+    (`get_opening_balances`), the movements between `from_date` and `to_date` are
+    summed in SQL. A Stock Reconciliation moves the quantity from the previous
+    balance of the item and warehouse to its `qty_after_transaction`; the previous
+    balance is taken with a window function, or from the snapshot for the first
+    entry of the period.
+
+    Args:
+        items (list): Only these items, all items if None
+        warehouses (list): Only these warehouses, all warehouses if None
+        with_excise (bool): Add `excise_stock`, the quantity sold on Sales Invoices
+            with excise duty applicable
+        exclude_material_transfer (bool): Leave Material Transfer Stock Entries out
+            of the in and out quantities, and out of the opening by subtracting the
+            transfers posted before `from_date`, so that the balance is the opening
+            plus the in and out columns
+
+    Returns:
+        dict: {(company, item_code, warehouse): {opening_qty, in_qty, out_qty, bal_qty,
+            opening_val, bal_val, excise_stock}}
+    """
+    conditions = []
+    joins = []
+    values = {"from_date": from_date, "to_date": to_date}
+    if items is not None:
+        if not items:
+            return {}
+        conditions.append("AND sle.item_code IN %(items)s")
+        values["items"] = list(items)
+    if warehouses is not None:
+        if not warehouses:
+            return {}
+        conditions.append("AND sle.warehouse IN %(warehouses)s")
+        values["warehouses"] = list(warehouses)
+    if company:
+        conditions.append("AND sle.company = %(company)s")
+        values["company"] = company
+
+    excluded = "0"
+    if exclude_material_transfer:
+        joins.append(
+            "LEFT JOIN `tabStock Entry` se ON sle.voucher_type = 'Stock Entry' AND se.name = sle.voucher_no"
+        )
+        excluded = "IFNULL(se.purpose, '') = 'Material Transfer'"
+
+    excise_stock = "0"
+    if with_excise:
+        joins.append(
+            "LEFT JOIN `tabSales Invoice` si ON sle.voucher_type = 'Sales Invoice' AND si.name = sle.voucher_no"
+        )
+        excise_stock = "ABS(sle.actual_qty * IFNULL(si.excise_duty_applicable, 0))"
+
+    previous_qty = """LAG(sle.qty_after_transaction) OVER (
+        PARTITION BY sle.item_code, sle.warehouse
+        ORDER BY sle.posting_date, sle.posting_time, sle.creation
+    )"""
+
+    movements = frappe.db.sql(
+        """
+        SELECT
+            company,
+            item_code,
+            warehouse,
+            SUM(CASE WHEN NOT excluded AND qty_diff >= 0 THEN qty_diff ELSE 0 END) AS in_qty,
+            SUM(CASE WHEN NOT excluded AND qty_diff < 0 THEN -qty_diff ELSE 0 END) AS out_qty,
+            MAX(CASE WHEN first_reconciliation THEN qty_after_transaction END) AS first_reconciliation_qty,
+            SUM(CASE WHEN NOT excluded THEN stock_value_difference ELSE 0 END) AS value_diff,
+            SUM(CASE WHEN NOT excluded THEN excise_stock ELSE 0 END) AS excise_stock
+        FROM (
+            SELECT
+                sle.company,
+                sle.item_code,
+                sle.warehouse,
+                sle.qty_after_transaction,
+                sle.stock_value_difference,
+                {excluded} AS excluded,
+                {excise_stock} AS excise_stock,
+                sle.voucher_type = 'Stock Reconciliation' AND {previous_qty} IS NULL
+                    AS first_reconciliation,
+                CASE
+                    WHEN sle.voucher_type = 'Stock Reconciliation'
+                        THEN sle.qty_after_transaction - {previous_qty}
+                    ELSE sle.actual_qty
+                END AS qty_diff
+            FROM `tabStock Ledger Entry` sle
+            {joins}
+            WHERE sle.is_cancelled = 0
+                AND sle.posting_date BETWEEN %(from_date)s AND %(to_date)s
+                {conditions}
+        ) sle
+        GROUP BY company, item_code, warehouse
+        """.format(
+            excluded=excluded,
+            excise_stock=excise_stock,
+            previous_qty=previous_qty,
+            joins=" ".join(joins),
+            conditions=" ".join(conditions),
+        ),
+        values,
+        as_dict=True,
+    )
+
+    balances = {}
+
+    def get_balance(company, item_code, warehouse):
+        key = (company, item_code, warehouse)
+        if key not in balances:
+            balances[key] = frappe._dict(
+                opening_qty=0.0,
+                in_qty=0.0,
+                out_qty=0.0,
+                bal_qty=0.0,
+                opening_val=0.0,
+                bal_val=0.0,
+                excise_stock=0.0,
+            )
+        return balances[key]
+
+    opening_balances = get_opening_balances(
+        from_date, items=items, warehouses=warehouses, company=company
+    )
+    for (item_code, warehouse), row in opening_balances.items():
+        balance = get_balance(row.company, item_code, warehouse)
+        balance.opening_qty = flt(row.qty_after_transaction)
+        balance.opening_val = flt(row.stock_value)
+
+    if exclude_material_transfer:
+        for row in get_material_transfer_totals(
+            from_date, items=items, warehouses=warehouses, company=company
+        ):
+            balance = get_balance(row.company, row.item_code, row.warehouse)
+            balance.opening_qty -= flt(row.qty)
+            balance.opening_val -= flt(row.value)
+
+    for row in movements:
+        balance = get_balance(row.company, row.item_code, row.warehouse)
+        balance.in_qty += flt(row.in_qty)
+        balance.out_qty += flt(row.out_qty)
+        balance.bal_val += flt(row.value_diff)
+        balance.excise_stock += flt(row.excise_stock)
+        if row.first_reconciliation_qty is not None:
+            qty_diff = flt(row.first_reconciliation_qty) - balance.opening_qty
+            if qty_diff >= 0:
+                balance.in_qty += qty_diff
+            else:
+                balance.out_qty -= qty_diff
+
+    for balance in balances.values():
+        balance.bal_qty = balance.opening_qty + balance.in_qty - balance.out_qty
+        balance.bal_val += balance.opening_val
+
+    return balances
+
+
+def get_material_transfer_totals(from_date, items=None, warehouses=None, company=None):
+    """
+    Quantity and value moved by Material Transfer Stock Entries before `from_date`
+
+    Returns:
+        list: {company, item_code, warehouse, qty, value} per pair with transfers
+    """
+    conditions = []
+    values = {"from_date": from_date}
+    if items is not None:
+        conditions.append("AND sle.item_code IN %(items)s")
+        values["items"] = list(items)
+    if warehouses is not None:
+        conditions.append("AND sle.warehouse IN %(warehouses)s")
+        values["warehouses"] = list(warehouses)
+    if company:
+        conditions.append("AND sle.company = %(company)s")
+        values["company"] = company
+
+    return frappe.db.sql(
+        """
+        SELECT
+            sle.company,
+            sle.item_code,
+            sle.warehouse,
+            SUM(sle.actual_qty) AS qty,
+            SUM(sle.stock_value_difference) AS value
+        FROM `tabStock Ledger Entry` sle
+        INNER JOIN `tabStock Entry` se
+            ON sle.voucher_type = 'Stock Entry' AND se.name = sle.voucher_no
+        WHERE sle.is_cancelled = 0
+            AND sle.posting_date < %(from_date)s
+            AND se.purpose = 'Material Transfer'
+            {conditions}
+        GROUP BY sle.company, sle.item_code, sle.warehouse
+        """.format(conditions=" ".join(conditions)),
+        values,
+        as_dict=True,
+    )
+
+
+def group_stock_balances(balances, get_key):
+    """Sum `get_stock_balances` rows by `get_key(company, item_code, warehouse)`"""
+    grouped = {}
+    for (company, item_code, warehouse), balance in balances.items():
+        key = get_key(company, item_code, warehouse)
+        if key not in grouped:
+            grouped[key] = frappe._dict({field: 0.0 for field in balance})
+        for field, value in balance.items():
+            grouped[key][field] += value
+    return grouped
+
+
+def get_opening_stock_reconciliations(voucher_nos):
+    """Names of the given Stock Reconciliations whose purpose is Opening Stock"""
+    if not voucher_nos:
+        return set()
+
+    return set(
+        frappe.get_all(
+            "Stock Reconciliation",
+            filters={"name": ["in", list(voucher_nos)], "purpose": "Opening Stock"},
+            pluck="name",
+        )
+    )
+
+
+def get_leaf_warehouses(warehouse):
+    """The warehouse itself, or the non-group warehouses under it"""
+    warehouse_details = frappe.db.get_value(
+        "Warehouse", warehouse, ["lft", "rgt"], as_dict=1
+    )
+    if not warehouse_details:
+        return [warehouse]
+
+    return frappe.get_all(
+        "Warehouse",
+        filters={
+            "lft": [">=", warehouse_details.lft],
+            "rgt": ["<=", warehouse_details.rgt],
+            "is_group": 0,
+        },
+        pluck="name",
+    )
@@ -57,94 +57,106 @@ def get_columns():
     return columns
 
 
+VAT_RATE = 0.18
+
+
 def get_data(filters):
+    values = {
+        "company": filters.company,
+        "from_date": filters.from_date,
+        "to_date": filters.to_date,
+        "vat_rate": VAT_RATE,
+    }
+
+    # imported: supplier outside Tanzania, taxable: VAT charged, the part of a taxable
+    # invoice above the VAT base counts as non-creditable
+    purchases = frappe.db.sql(
+        """
+        SELECT
+            SUM(CASE WHEN imported THEN base_net_total ELSE 0 END) AS imported_excl,
+            SUM(CASE WHEN NOT imported AND vat != 0 THEN vat ELSE 0 END) AS taxable_vat,
+            SUM(CASE WHEN NOT imported AND vat != 0 THEN vat / %(vat_rate)s ELSE 0 END) AS taxable_excl,
+            SUM(CASE
+                WHEN imported THEN 0
+                WHEN vat = 0 THEN base_net_total
+                ELSE base_net_total - vat / %(vat_rate)s
+            END) AS non_creditable_excl
+        FROM (
+            SELECT
+                pi.base_net_total,
+                IFNULL(pi.base_total_taxes_and_charges, 0) AS vat,
+                IFNULL(s.country, '') NOT IN ('', 'Tanzania') AS imported
+            FROM `tabPurchase Invoice` pi
+            LEFT JOIN `tabSupplier` s ON s.name = pi.supplier
+            WHERE pi.docstatus = 1
+                AND pi.is_return = 0
+                AND pi.company = %(company)s
+                AND pi.posting_date BETWEEN %(from_date)s AND %(to_date)s
+        ) purchase
+        """,
+        values,
+        as_dict=True,
+    )[0]
+
+    sales = frappe.db.sql(
+        """
+        SELECT
+            SUM(CASE WHEN vat != 0 THEN vat ELSE 0 END) AS taxable_vat,
+            SUM(CASE WHEN vat != 0 THEN vat / %(vat_rate)s ELSE 0 END) AS taxable_excl,
+            SUM(CASE
+                WHEN vat = 0 THEN base_net_total
+                ELSE base_net_total - vat / %(vat_rate)s
+            END) AS non_creditable_excl
+        FROM (
+            SELECT
+                base_net_total,
+                IFNULL(base_total_taxes_and_charges, 0) AS vat
+            FROM `tabSales Invoice`
+            WHERE docstatus = 1
+                AND is_return = 0
+                AND status != 'Credit Note Issued'
+                AND company = %(company)s
+                AND posting_date BETWEEN %(from_date)s AND %(to_date)s
+        ) sales
+        """,
+        values,
+        as_dict=True,
+    )[0]
 
     imported = {
         "type": "Foreign Purchase",
         "line": "Line 3",
-        "excl": 0,
+        "excl": flt(purchases.imported_excl),
         "vat": 0,
         "category": "Value of imported services"
     }
     non_creditable_purchases = {
         "type": "Purchase",
         "line": "Line 2",
-        "excl": 0,
+        "excl": flt(purchases.non_creditable_excl),
         "vat": 0,
         "category": "Non-creditable purchases"
     }
     taxable_purchases = {
         "type": "Purchase",
         "line": "Line 1",
-        "excl": 0,
-        "vat": 0,
+        "excl": flt(purchases.taxable_excl),
+        "vat": flt(purchases.taxable_vat),
         "category": "Taxable purchases"
     }
-
-    purchase_list = frappe.get_all("Purchase Invoice", filters={
-        "docstatus": 1,
-        "is_return": 0,
-        "company": filters.company,
-        "posting_date": ["between", [
-            filters.from_date,
-            filters.to_date
-        ]
-        ]
-    },
-        fields={"*"}
-    )
-
-    for element in purchase_list:
-        country = frappe.get_value(
-            "Supplier", element.supplier, "country")
-        if country and country != "Tanzania":
-            imported["excl"] += element.base_net_total
-        elif not element.base_total_taxes_and_charges:
-            non_creditable_purchases["excl"] += element.base_net_total
-        else:
-            taxable_purchases["vat"] += element.base_total_taxes_and_charges
-            taxable = element.base_total_taxes_and_charges / 0.18
-            taxable_purchases["excl"] += taxable
-            non_creditable = element.base_net_total - taxable
-            non_creditable_purchases["excl"] += non_creditable
-
     non_creditable_supplies = {
         "type": "Sales",
         "line": "Line 2",
-        "excl": 0,
+        "excl": flt(sales.non_creditable_excl),
         "vat": 0,
         "category": "Non-creditable supplies"
     }
     taxable_supplies = {
         "type": "Sales",
         "line": "Line 1",
-        "excl": 0,
-        "vat": 0,
+        "excl": flt(sales.taxable_excl),
+        "vat": flt(sales.taxable_vat),
         "category": "Taxable supplies"
     }
 
-    sales_list = frappe.get_all("Sales Invoice", filters={
-        "docstatus": 1,
-        "is_return": 0,
-        "status": ["!=", "Credit Note Issued"],
-        "company": filters.company,
-        "posting_date": ["between", [
-            filters.from_date,
-            filters.to_date
-        ]
-        ]
-    },
-        fields={"*"}
-    )
-
-    for element in sales_list:
-        if not element.base_total_taxes_and_charges:
-            non_creditable_supplies["excl"] += element.base_net_total
-        else:
-            taxable_supplies["vat"] += element.base_total_taxes_and_charges
-            taxable = element.base_total_taxes_and_charges / 0.18
-            taxable_supplies["excl"] += taxable
-            non_creditable = element.base_net_total - taxable
-            non_creditable_supplies["excl"] += non_creditable
-
     return [taxable_purchases, non_creditable_purchases, taxable_supplies, non_creditable_supplies, imported]
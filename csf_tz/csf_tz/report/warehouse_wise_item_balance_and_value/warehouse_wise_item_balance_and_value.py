@@ -4,9 +4,10 @@
 from __future__ import unicode_literals
 import frappe
 from frappe import _
-from frappe.utils import flt
-from erpnext.stock.report.stock_balance.stock_balance import (get_item_details, get_item_warehouse_map, get_items, get_stock_ledger_entries)
+from frappe.utils import getdate
 from erpnext.stock.report.stock_ageing.stock_ageing import get_fifo_queue, get_average_age
+from erpnext.stock.report.stock_ledger.stock_ledger import get_item_group_condition
+from csf_tz.csf_tz.report.stock_ledger_utils import get_stock_balances
 from six import iteritems
 
 def execute(filters=None):
@@ -17,11 +18,15 @@ def execute(filters=None):
 	columns = get_columns(filters)
 
 	items = get_items(filters)
-	sle = get_stock_ledger_entries(filters, items)
-
-	item_map = get_item_details(items, sle, filters)
-	iwb_map = get_item_warehouse_map(filters, sle)
 	warehouse_list = get_warehouse_list(filters)
+	iwb_map = get_stock_balances(
+		getdate(filters.get("from_date")),
+		getdate(filters.get("to_date")),
+		items=items,
+		warehouses=[wh.name for wh in warehouse_list],
+		company=filters.get("company"),
+	)
+	item_map = get_item_details({item for company, item, warehouse in iwb_map})
 	item_ageing = get_fifo_queue(filters)
 	data = []
 	item_balance = {}
@@ -35,8 +40,8 @@ def execute(filters=None):
 		item_balance.setdefault((item, item_map[item]["item_group"]), [])
 		total_stock_value = 0.00
 		for wh in warehouse_list:
-			row += [qty_dict.bal_qty] if wh.name in warehouse else [0.00]
-			total_stock_value += qty_dict.bal_val if wh.name in warehouse else 0.00
+			row += [qty_dict.bal_qty] if wh.name == warehouse else [0.00]
+			total_stock_value += qty_dict.bal_val if wh.name == warehouse else 0.00
 
 		item_balance[(item, item_map[item]["item_group"])].append(row)
 		item_value.setdefault((item, item_map[item]["item_group"]),[])
@@ -87,12 +92,34 @@ def get_columns(_filters):
 
 def validate_filters(filters):
 	if not (filters.get("item_code") or filters.get("warehouse")):
-		sle_count = flt(frappe.db.sql("""select count(name) from `tabStock Ledger Entry`""")[0][0])
+		sle_count = frappe.db.estimate_count("Stock Ledger Entry")
 		if sle_count > 500000:
 			frappe.throw(_("Please set filter based on Item or Warehouse"))
 	if not filters.get("company"):
 		filters["company"] = frappe.defaults.get_user_default("Company")
 
+def get_items(filters):
+	"""Items matching the item filters, None for all items"""
+	conditions = []
+	if filters.get("item_code"):
+		conditions.append("item.name=%(item_code)s")
+	else:
+		if filters.get("brand"):
+			conditions.append("item.brand=%(brand)s")
+		if filters.get("item_group"):
+			conditions.append(get_item_group_condition(filters.get("item_group")))
+
+	if conditions:
+		return frappe.db.sql_list("""select name from `tabItem` item where {}"""
+			.format(" and ".join(conditions)), filters)
+
+def get_item_details(items):
+	if not items:
+		return {}
+
+	return {item.name: item for item in frappe.get_all("Item",
+		filters={"name": ["in", list(items)]}, fields=["name", "item_group"])}
+
 def get_warehouse_list(filters):
 	from frappe.core.doctype.user_permission.user_permission import get_permitted_documents
 
@@ -1,6 +1,7 @@
 import frappe
 from frappe import _
 from frappe.utils import flt, add_days, getdate, add_months, today
+from csf_tz.utils.settings import get_csf_tz_setting
 
 
 @frappe.whitelist()
@@ -8,8 +9,8 @@ def create_additional_salary_journal(doc, method):
     if frappe.get_value(
         "Salary Component", doc.salary_component, "create_cash_journal"
     ):
-        cash_account = frappe.db.get_single_value(
-            "CSF TZ Settings", "default_account_for_additional_component_cash_journal"
+        cash_account = get_csf_tz_setting(
+            "default_account_for_additional_component_cash_journal"
         )
         if not cash_account:
             frappe.throw(
@@ -179,9 +180,7 @@ def get_employee_base_salary_in_hours(employee, payroll_date):
         last_salary_assignment[0] if last_salary_assignment else None
     )
 
-    working_hours_per_month = frappe.db.get_single_value(
-        "CSF TZ Settings", "working_hours_per_month"
-    )
+    working_hours_per_month = get_csf_tz_setting("working_hours_per_month")
     if not working_hours_per_month:
         frappe.throw(
             _(
@@ -6,10 +6,11 @@ from frappe.utils import (
     get_weekday,
 )
 from datetime import datetime, timedelta
+from csf_tz.utils.settings import get_csf_tz_setting
 
 
 def process_overtime(doc, method):
-    if not frappe.db.get_single_value("CSF TZ Settings", "enable_overtime_calculation"):
+    if not get_csf_tz_setting("enable_overtime_calculation"):
         return
 
     if (
@@ -3,10 +3,9 @@
 # For license information, please see license.txt
 
 from __future__ import unicode_literals
-import frappe
-from frappe import _
 from frappe.utils import flt
 from erpnext.accounts.doctype.budget.budget import validate_expense_against_budget
+from csf_tz.utils.settings import get_csf_tz_setting
 
 
 def check_budget_for_journal_entry(doc, method=None):
@@ -16,9 +15,7 @@ def check_budget_for_journal_entry(doc, method=None):
 	For Journal Entry, budget is checked against each account entry
 	when making GL entries.
 	"""
-	if frappe.db.get_single_value(
-		"CSF TZ Settings", "check_budget_in_je"
-	):
+	if get_csf_tz_setting("check_budget_in_je"):
 		for account in doc.get("accounts") or []:
 			# Check if account has at least one budget dimension (cost_center or project)
 			# ERPNext's budget validation can work with either dimension independently
@@ -55,9 +52,7 @@ def check_budget_for_material_request(doc, method=None):
 
 	Material Request has items and the budget is checked against each item.
 	"""
-	if frappe.db.get_single_value(
-		"CSF TZ Settings", "check_budget_in_mr"
-	):
+	if get_csf_tz_setting("check_budget_in_mr"):
 		for item in doc.get("items") or []:
 			# Prepare args for budget validation
 			args = item.as_dict()
@@ -90,9 +85,7 @@ def check_budget_for_purchase_order(doc, method=None):
 
 	Purchase Order has items and the budget is checked against each item.
 	"""
-	if frappe.db.get_single_value(
-		"CSF TZ Settings", "check_budget_in_po"
-	):
+	if get_csf_tz_setting("check_budget_in_po"):
 		for item in doc.get("items") or []:
 			# Prepare args for budget validation
 			args = item.as_dict()
@@ -124,7 +117,7 @@ def check_budget_for_purchase_invoice(doc, method=None):
 
 	Purchase Invoice has items and the budget is checked against each item.
 	"""
-	if frappe.db.get_single_value("CSF TZ Settings", "check_budget_in_pi"):
+	if get_csf_tz_setting("check_budget_in_pi"):
 		# frappe.throw("Budget check is enabled for Purchase Invoice")
 		for item in doc.get("items") or []:
 			# Prepare args for budget validation
@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 from frappe.query_builder import Criterion
 from hrms.hr.utils import validate_active_employee
 from frappe.utils import cint, get_datetime, now_datetime, add_days
+from csf_tz.utils.settings import get_csf_tz_setting
 from hrms.hr.doctype.shift_assignment.shift_assignment import (
     get_actual_start_end_datetime_of_shift,
     get_exact_shift,
@@ -14,9 +15,7 @@ from hrms.hr.doctype.shift_assignment.shift_assignment import (
 
 
 def validate(doc, method):
-    override_fetch_shift_details = frappe.db.get_single_value(
-        "CSF TZ Settings", "override_fetch_shift_details"
-    )
+    override_fetch_shift_details = get_csf_tz_setting("override_fetch_shift_details")
     if override_fetch_shift_details == 0:
         return
     
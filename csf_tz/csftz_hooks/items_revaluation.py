@@ -2,6 +2,22 @@ import frappe
 from frappe import _
 from frappe.utils import flt
 
+from csf_tz.csf_tz.report.stock_ledger_utils import get_compact_rows
+
+SLE_FIELDS = (
+    "name",
+    "voucher_type",
+    "voucher_no",
+    "item_code",
+    "actual_qty",
+    "posting_date",
+    "posting_time",
+    "company",
+    "warehouse",
+    "qty_after_transaction",
+    "batch_no",
+)
+
 
 @frappe.whitelist()
 def get_data(filters):
@@ -22,7 +38,7 @@ def validate_data(itewise_balance_qty):
     for key, data in itewise_balance_qty.items():
         row = get_incorrect_data(data)
         if row:
-            res.append(row)
+            res.append(row.as_dict())
 
     return res
 
@@ -43,30 +59,23 @@ def get_incorrect_data(data):
 
 
 def get_stock_ledger_entries(report_filters):
-    filters = {"is_cancelled": 0}
-    fields = [
-        "name",
-        "voucher_type",
-        "voucher_no",
-        "item_code",
-        "actual_qty",
-        "posting_date",
-        "posting_time",
-        "company",
-        "warehouse",
-        "qty_after_transaction",
-        "batch_no",
-    ]
+    """All ledger entries matching the filters as compact rows, the whole ledger without filters"""
+    sle = frappe.qb.DocType("Stock Ledger Entry")
+    query = (
+        frappe.qb.from_(sle)
+        .select(*[sle[field] for field in SLE_FIELDS])
+        .where(sle.is_cancelled == 0)
+        .orderby(sle.posting_date)
+        .orderby(sle.posting_time)
+        .orderby(sle.creation)
+    )
 
     for field in ["warehouse", "item_code", "company"]:
         if report_filters.get(field):
-            filters[field] = report_filters.get(field)
+            query = query.where(sle[field] == report_filters.get(field))
 
-    return frappe.get_all(
-        "Stock Ledger Entry",
-        fields=fields,
-        filters=filters,
-        order_by="timestamp(posting_date, posting_time) asc, creation asc",
+    return get_compact_rows(
+        query, SLE_FIELDS, extra_fields=("expected_balance_qty", "differnce")
     )
 
 
@@ -0,0 +1,133 @@
+import frappe
+from frappe.utils import cint
+
+LINK_GRAPH_CACHE_KEY = "csf_tz_doctype_link_graph"
+
+
+def get_link_graph():
+    """
+    Return the doctype link graph, built once and shared through Redis
+
+    Returns:
+        dict: {
+            "modules": {doctype: module},
+            "links": {doctype: [doctypes its Link fields point to]},
+            "linked_from": {doctype: [doctypes with Link fields pointing to it]},
+        }
+    """
+    cache = frappe.cache()
+    graph = cache.get_value(LINK_GRAPH_CACHE_KEY)
+    if graph is None:
+        graph = build_link_graph()
+        cache.set_value(LINK_GRAPH_CACHE_KEY, graph)
+    return graph
+
+
+def build_link_graph():
+    """Build the link graph from the Link fields of DocField and Custom Field, one grouped query each"""
+    modules = dict(frappe.db.sql("SELECT name, module FROM `tabDocType`"))
+    links = {}
+    linked_from = {}
+
+    for query in (
+        """SELECT df.parent, df.options
+        FROM `tabDocField` df
+        WHERE df.fieldtype = 'Link' AND IFNULL(df.options, '') != ''
+        GROUP BY df.parent, df.options""",
+        """SELECT cf.dt, cf.options
+        FROM `tabCustom Field` cf
+        WHERE cf.fieldtype = 'Link' AND IFNULL(cf.options, '') != ''
+        GROUP BY cf.dt, cf.options""",
+    ):
+        for doctype, target in frappe.db.sql(query):
+            if doctype not in modules:
+                continue
+            targets = links.setdefault(doctype, [])
+            if target not in targets:
+                targets.append(target)
+                linked_from.setdefault(target, []).append(doctype)
+
+    return {"modules": modules, "links": links, "linked_from": linked_from}
+
+
+def clear_link_graph(doc=None, method=None):
+    """Drop the cached graph when a DocType or Custom Field changes, it is rebuilt on the next use"""
+    frappe.cache().delete_value(LINK_GRAPH_CACHE_KEY)
+
+
+def iter_linked_doctypes(doctype, direction, max_depth=None):
+    """
+    Walk the link graph breadth first from `doctype`, yielding (doctype, depth)
+
+    Each doctype is yielded once, at the depth it is first reached. The walk is
+    lazy, callers can stop at any point without visiting the rest of the graph.
+
+    Args:
+        direction (str): "links" for the doctypes `doctype` points to,
+            "linked_from" for the doctypes pointing to it
+        max_depth (int): Stop after this many links, no limit if None
+    """
+    adjacency = get_link_graph()[direction]
+    seen = {doctype}
+    level = [doctype]
+    depth = 0
+    while level and (max_depth is None or depth < max_depth):
+        depth += 1
+        next_level = []
+        for current in level:
+            for linked in adjacency.get(current, ()):
+                if linked not in seen:
+                    seen.add(linked)
+                    next_level.append(linked)
+                    yield linked, depth
+        level = next_level
+
+
+def iter_ancestors(doctype, max_depth=None):
+    """Doctypes `doctype` links to, directly or through other doctypes, with their depth"""
+    return iter_linked_doctypes(doctype, "links", max_depth)
+
+
+def iter_successors(doctype, max_depth=None):
+    """Doctypes linking to `doctype`, directly or through other doctypes, with their depth"""
+    return iter_linked_doctypes(doctype, "linked_from", max_depth)
+
+
+@frappe.whitelist()
+def get_ancestors(doctype, max_depth=1):
+    """[{doctype, depth}] of the doctypes `doctype` links to, up to `max_depth` links away"""
+    return [
+        {"doctype": ancestor, "depth": depth}
+        for ancestor, depth in iter_ancestors(doctype, cint(max_depth) or None)
+    ]
+
+
+@frappe.whitelist()
+def get_successors(doctype, max_depth=1):
+    """[{doctype, depth}] of the doctypes linking to `doctype`, up to `max_depth` links away"""
+    return [
+        {"doctype": successor, "depth": depth}
+        for successor, depth in iter_successors(doctype, cint(max_depth) or None)
+    ]
+
+
+def get_graph_nodes(doctypes):
+    """
+    Nodes of `doctypes` with Link fields in the hierarchical edge bundling format,
+    `imports` are named with the module of the linking doctype
+    """
+    graph = get_link_graph()
+    nodes = []
+    for doctype in doctypes:
+        module = graph["modules"].get(doctype)
+        targets = graph["links"].get(doctype)
+        if not module or not targets:
+            continue
+        nodes.append(
+            {
+                "name": f"erpnext.{module}.{doctype}",
+                "doctype_name": doctype,
+                "imports": [f"erpnext.{module}.{target}" for target in targets],
+            }
+        )
+    return nodes
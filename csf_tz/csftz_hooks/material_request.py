@@ -1,67 +1,97 @@
 import frappe
 from frappe.query_builder import DocType
-from frappe.utils.background_jobs import enqueue
-from frappe.utils import add_days, nowdate, create_batch
+from frappe.utils import now_datetime, nowdate
+from csf_tz.utils.background_job import start_chunked_job
 
 
-cp = DocType("Company")
 mr = DocType("Material Request")
 
-def _auto_close_material_request_batch(material_request_names):
+def close_material_requests(material_request_names):
+    """
+    Chunk handler of `auto_close_material_request` for requests with quantities still
+    to order, `update_status` releases their requested quantity on the Bins.
+    Returns the requests that failed.
+    """
+    failed = []
     for name in material_request_names:
         try:
             material_request_doc = frappe.get_doc("Material Request", name)
             material_request_doc.update_status("Stopped")
         except Exception:
+            failed.append(name)
             frappe.log_error(frappe.get_traceback(), f"Auto Close Material Request Error: {name}")
+    return failed
 
 
+def stop_material_requests(material_request_names):
+    """
+    Chunk handler of `auto_close_material_request` for fully ordered requests, they
+    hold no requested quantity so only their status changes, in one update
+    """
+    (
+        frappe.qb.update(mr)
+        .set(mr.status, "Stopped")
+        .set(mr.modified, now_datetime())
+        .set(mr.modified_by, frappe.session.user)
+        .where(mr.name.isin(material_request_names))
+        .where(mr.docstatus == 1)
+        .where(mr.status != "Stopped")
+    ).run()
 
-def auto_close_material_request():
+
+def get_material_requests_to_close():
     """
-    Auto close Material Request based on settings specified on Company under section of stock settings
+    Submitted Material Requests older than the auto close age of their company
+
+    Returns:
+        list: {name, company, has_pending_qty} of each request, `has_pending_qty` is
+            set when an item is not fully ordered in stock UOM, as the Bins count it
     """
+    return frappe.db.sql(
+        """
+        SELECT
+            mr.name,
+            mr.company,
+            EXISTS(
+                SELECT 1 FROM `tabMaterial Request Item` mri
+                WHERE mri.parent = mr.name
+                    AND mri.parenttype = 'Material Request'
+                    AND IFNULL(mri.ordered_qty, 0) < mri.stock_qty
+            ) AS has_pending_qty
+        FROM `tabMaterial Request` mr
+        INNER JOIN `tabCompany` cp ON cp.name = mr.company
+        WHERE cp.enable_auto_close_material_request = 1
+            AND mr.docstatus = 1
+            AND mr.status != 'Stopped'
+            AND mr.transaction_date
+                <= DATE_SUB(%(today)s, INTERVAL IFNULL(cp.close_material_request_after, 0) DAY)
+        """,
+        {"today": nowdate()},
+        as_dict=True,
+    )
 
-    def close_request_docs(date_before, row):
-        material_requests = (
-            frappe.qb.from_(mr)
-            .select(
-                mr.name
-            )
-            .where(
-                (mr.docstatus == 1)
-                & (mr.company == row.name)
-                & (mr.status != "Stopped")
-                & (mr.transaction_date <= date_before)
-            )
-        ).run(as_dict=True)
 
-        if len(material_requests) == 0:
-            return
+def auto_close_material_request():
+    """
+    Auto close Material Request based on settings specified on Company under section of stock settings
 
-        for records in create_batch(material_requests, 100):
-            enqueue(
-                _auto_close_material_request_batch,
-                queue="long",
-                timeout=1200,
-                job_name=f"auto_close_material_request_{row.name}_{records[0].name}",
-                kwargs={"material_request_names": [record.name for record in records]},
-            )
+    Each company gets its own jobs, so companies are closed in parallel. Requests with
+    quantities still to order go through `update_status`, the others are stopped with
+    bulk updates. The CSF Background Jobs record the requests closed by each run.
+    """
+    partitions = {}
+    for row in get_material_requests_to_close():
+        path = "documents" if row.has_pending_qty else "bulk"
+        partitions.setdefault((row.company, path), []).append(row.name)
 
-    company_details = (
-        frappe.qb.from_(cp)
-        .select(
-            cp.name,
-            cp.close_material_request_after
-        )
-        .where(
-            cp.enable_auto_close_material_request == 1
+    for (company, path), material_requests in partitions.items():
+        start_chunked_job(
+            "csf_tz.csftz_hooks.material_request."
+            + ("close_material_requests" if path == "documents" else "stop_material_requests"),
+            material_requests,
+            job_key=f"auto_close_material_request::{company}::{path}::{nowdate()}",
+            queue="long",
+            chunk_size=100 if path == "documents" else 1000,
+            timeout=1200,
+            once=True,
         )
-    ).run(as_dict=True)
-    
-    if len(company_details) == 0:
-        return
-    
-    for row in company_details:
-        before_days = add_days(nowdate(), -row.close_material_request_after)
-        close_request_docs(before_days, row)
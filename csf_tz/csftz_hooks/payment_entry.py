@@ -15,12 +15,13 @@ from erpnext.accounts.doctype.payment_entry.payment_entry import (
     get_negative_outstanding_invoices,
 )
 from frappe import ValidationError, _, qb, scrub, throw
+from csf_tz.utils.settings import get_csf_tz_setting
 
 
 @frappe.whitelist()
 def get_outstanding_reference_documents(args):
     # Check if the feature is disabled in CSF TZ Settings
-    if frappe.db.get_single_value("CSF TZ Settings", "disable_get_outstanding_functionality"):
+    if get_csf_tz_setting("disable_get_outstanding_functionality"):
         return []
     
     if isinstance(args, str):
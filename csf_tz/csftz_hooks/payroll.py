@@ -7,24 +7,34 @@ from PyPDF3 import PdfFileReader, PdfFileWriter
 from csf_tz import console
 from frappe.model.workflow import apply_workflow
 from frappe.utils import cint, flt
+from csf_tz.csf_tz.doctype.csf_payroll_fact.csf_payroll_fact import (
+    delete_payroll_facts,
+    make_payroll_facts,
+)
+from csf_tz.utils.background_job import start_chunked_job
+from csf_tz.utils.settings import get_csf_tz_setting
 
 
 def before_insert_payroll_entry(doc, method):
-    enable_payroll_approval = frappe.db.get_single_value(
-        "CSF TZ Settings", "enable_payroll_approval"
-    )
+    enable_payroll_approval = get_csf_tz_setting("enable_payroll_approval")
     if enable_payroll_approval:
         doc.has_payroll_approval = 1
 
 
 def before_insert_salary_slip(doc, method):
-    enable_payroll_approval = frappe.db.get_single_value(
-        "CSF TZ Settings", "enable_payroll_approval"
-    )
+    enable_payroll_approval = get_csf_tz_setting("enable_payroll_approval")
     if enable_payroll_approval:
         doc.has_payroll_approval = 1
 
 
+def on_submit_salary_slip(doc, method):
+    make_payroll_facts(doc)
+
+
+def on_cancel_salary_slip(doc, method):
+    delete_payroll_facts(doc.name)
+
+
 def before_cancel_payroll_entry(doc, method):
     if not doc.has_payroll_approval:
         return
@@ -73,36 +83,34 @@ def update_slips(payroll_entry):
     )
     count = len(salary_slips)
 
-    job = enqueue(
-        method=enqueue_update_slips,
+    start_chunked_job(
+        "csf_tz.csftz_hooks.payroll.update_salary_slips",
+        salary_slips,
+        job_key=f"update-salary-slips::{payroll_entry}",
         queue="short",
+        chunk_size=50,
         timeout=4600,
-        is_async=True,
-        enqueue_after_commit=False,
-        job_id=f"update-salary-slips::{payroll_entry}",
-        deduplicate=True,
-        payroll_entry=payroll_entry,
     )
 
     frappe.msgprint(_("{0} Salary Slips is updated".format(count)))
     return count
 
 
-def enqueue_update_slips(payroll_entry):
-    salary_slips = frappe.get_all(
-        "Salary Slip", filters={"payroll_entry": payroll_entry}, pluck="name"
-    )
-
+def update_salary_slips(salary_slips):
+    """Chunk handler of `update_slips`, returns the slips that failed"""
+    failed = []
     for salary_slip in salary_slips:
         try:
             _update_salary_slip(salary_slip)
         except frappe.DocumentLockedError:
             continue
         except Exception:
+            failed.append(salary_slip)
             frappe.log_error(
                 frappe.get_traceback(),
                 _("Failed to update Salary Slip {0}").format(salary_slip),
             )
+    return failed
 
 
 @frappe.whitelist()
@@ -125,16 +133,25 @@ def _update_salary_slip(salary_slip):
 
 @frappe.whitelist()
 def print_slips(payroll_entry):
-    enqueue(
-        method=enqueue_print_slips,
-        queue="short",
+    # one PDF of all slips, so the whole payroll entry is a single chunk; on the long
+    # queue so a long render does not hold the only short slot of update_slips
+    start_chunked_job(
+        "csf_tz.csftz_hooks.payroll.print_payroll_entries",
+        [payroll_entry],
+        job_key=f"print-salary-slips::{payroll_entry}",
+        queue="long",
+        chunk_size=1,
         timeout=100000,
-        is_async=True,
-        job_name="print_salary_slips",
-        kwargs=payroll_entry,
+        max_attempts=1,
     )
 
 
+def print_payroll_entries(payroll_entries):
+    """Chunk handler of `print_slips`"""
+    for payroll_entry in payroll_entries:
+        enqueue_print_slips(payroll_entry)
+
+
 def enqueue_print_slips(kwargs):
     console("Start Printing")
     payroll_entry = kwargs
@@ -14,9 +14,9 @@ from frappe.utils import (
     get_datetime,
     nowdate,
     nowtime,
-    add_days,
     unique,
-    create_batch
+    create_batch,
+    now_datetime,
 )
 from frappe.model.mapper import get_mapped_doc
 from frappe.desk.form.linked_with import get_linked_docs, get_linked_doctypes
@@ -25,9 +25,15 @@ from erpnext.stock.doctype.batch.batch import get_batch_qty
 from erpnext.accounts.utils import get_account_currency
 import csf_tz
 from csf_tz import console
+from csf_tz.utils.background_job import start_chunked_job
+from csf_tz.utils.settings import (
+    get_csf_tz_setting,
+    get_csf_tz_settings,
+    get_single_setting,
+)
 import json
-from frappe.query_builder import DocType
-from frappe.query_builder.functions import Sum
+from frappe.query_builder import Case, DocType, Tuple
+from frappe.query_builder.functions import IfNull, Sum
 from frappe.utils.background_jobs import enqueue
 
 
@@ -180,7 +186,7 @@ def get_item_info(item_code):
 def get_item_prices(item_code, currency, customer=None, company=None):
     item_code = "'{0}'".format(item_code)
     currency = "'{0}'".format(currency)
-    unique_records = int(frappe.db.get_value("CSF TZ Settings", None, "unique_records"))
+    unique_records = get_csf_tz_setting("unique_records")
     prices_list = []
     unique_price_list = []
     max_records = frappe.db.get_value("Company", company, "max_records_in_dialog") or 20
@@ -240,7 +246,7 @@ def get_item_prices_custom(filters=None, start=0, limit=20):
     if not filters:  # Default to an empty dictionary if filters is None or invalid
         filters = {}
 
-    unique_records = int(frappe.db.get_value("CSF TZ Settings", None, "unique_records"))
+    unique_records = get_csf_tz_setting("unique_records")
     customer = filters.get("customer", "")
     company = filters.get("company", "")
     item_code = "'{0}'".format(filters.get("item_code", ""))
@@ -708,7 +714,7 @@ def validate_item_remaining_qty(
 ):
     if not warehouse or not stock_qty:
         return
-    if frappe.db.get_single_value("Stock Settings", "allow_negative_stock"):
+    if get_single_setting("Stock Settings", "allow_negative_stock"):
         return
     is_stock_item = frappe.get_value("Item", item_code, "is_stock_item")
     if is_stock_item == 1:
@@ -736,9 +742,7 @@ def validate_item_remaining_qty(
 
         item_remaining_qty = item_balance - qty_to_reduce - pending_si
         if item_remaining_qty < 0:
-            if not frappe.db.get_single_value(
-                "CSF TZ Settings", "item_qty_poppup_message"
-            ):
+            if not get_csf_tz_setting("item_qty_poppup_message"):
                 frappe.msgprint(
                     _(
                         "Item Balance: '{2}'<br>Pending Sales Order: '{3}'<br>Pending Direct Sales Invoice: {5}<br>Current request is {4}<br><b>Results into balance Qty for '{0}' to '{1}'</b>".format(
@@ -995,23 +999,24 @@ def get_list_pending_sales_invoice(invoice_name=None, warehouse=None):
 
 def create_delivery_note_for_all_pending_sales_invoice(doc=None, method=None):
     company_list = frappe.get_all(
-        "Company", fiters={"enabled_auto_create_delivery_notes": 1}, pluck="name"
+        "Company", filters={"enabled_auto_create_delivery_notes": 1}, pluck="name"
     )
     invoices = get_list_pending_sales_invoice()
-    for i in invoices:
-        if i.company not in company_list:
-            continue
-        invoice = frappe.get_doc("Sales Invoice", i.name)
-        create_delivery_note(invoice)
+    start_chunked_job(
+        "csf_tz.custom_api.create_delivery_notes_for_invoices",
+        [i.name for i in invoices if i.company in company_list],
+        job_key=f"create_delivery_note_for_all_pending_sales_invoice::{nowdate()}",
+        queue="long",
+        chunk_size=20,
+        once=True,
+    )
 
 
-def get_pending_material_request():
-    mat_req_list = frappe.get_all(
-        "Material Request",
-        filters=[["Material Request", "status", "in", ["Pending"]]],
-        fields=["name"],
-    )
-    return mat_req_list
+def create_delivery_notes_for_invoices(invoices):
+    """Chunk handler of `create_delivery_note_for_all_pending_sales_invoice`"""
+    for name in invoices:
+        invoice = frappe.get_doc("Sales Invoice", name)
+        create_delivery_note(invoice)
 
 
 def make_stock_reconciliation(items, company):
@@ -1080,59 +1085,124 @@ def get_stock_balance_for(
 
 @frappe.whitelist()
 def make_stock_reconciliation_for_all_pending_material_request(*args):
-    auto_stock_reconciliation = frappe.db.get_value("CSF TZ Settings", "CSF TZ Settings", "auto_stock_reconciliation") or 0
+    auto_stock_reconciliation = get_csf_tz_setting("auto_stock_reconciliation")
     if auto_stock_reconciliation != 1:
         return
-    mat_req_list = get_pending_material_request()
+
+    rows = get_pending_material_request_items()
+    if not rows:
+        return
+
+    balances = get_bin_balances({(row.item_code, row.warehouse) for row in rows})
+
+    # one Stock Reconciliation per company and warehouse, one line per item with the
+    # requested quantity of all pending rows added to the current balance
     data = {}
-    for i in mat_req_list:
-        mat_req_doc = frappe.get_doc("Material Request", i["name"])
+    for row in rows:
+        items = data.setdefault((row.company, row.warehouse), {})
+        if row.item_code not in items:
+            balance = balances.get((row.item_code, row.warehouse), {})
+            items[row.item_code] = {
+                "item_code": row.item_code,
+                "warehouse": row.warehouse,
+                "valuation_rate": flt(balance.get("valuation_rate")),
+                "batch_no": "",
+                "qty": flt(balance.get("actual_qty")),
+                "material_request": row.parent,
+                "rows": [],
+            }
+        items[row.item_code]["qty"] += flt(row.stock_qty)
+        items[row.item_code]["rows"].append(row.name)
+
+    row_reconciliations = {}
+    for (company, warehouse), items in data.items():
+        stock_rec_name = make_stock_reconciliation(
+            [
+                {key: value for key, value in item.items() if key != "rows"}
+                for item in items.values()
+            ],
+            company,
+        )
+        if stock_rec_name:
+            for item in items.values():
+                for row_name in item["rows"]:
+                    row_reconciliations[row_name] = stock_rec_name
+
+    if row_reconciliations:
+        material_request_item = DocType("Material Request Item")
+        stock_reconciliation = Case()
+        for row_name, stock_rec_name in row_reconciliations.items():
+            stock_reconciliation = stock_reconciliation.when(
+                material_request_item.name == row_name, stock_rec_name
+            )
+        (
+            frappe.qb.update(material_request_item)
+            .set(material_request_item.stock_reconciliation, stock_reconciliation)
+            .where(material_request_item.name.isin(list(row_reconciliations)))
+        ).run()
+
+
+def get_pending_material_request_items():
+    """Rows of pending Material Requests for stock items that have no Stock Reconciliation yet"""
+    material_request = DocType("Material Request")
+    material_request_item = DocType("Material Request Item")
+    item = DocType("Item")
+    return (
+        frappe.qb.from_(material_request_item)
+        .inner_join(material_request)
+        .on(material_request.name == material_request_item.parent)
+        .inner_join(item)
+        .on(item.name == material_request_item.item_code)
+        .select(
+            material_request_item.name,
+            material_request_item.parent,
+            material_request_item.item_code,
+            material_request_item.warehouse,
+            material_request_item.stock_qty,
+            material_request.company,
+        )
+        .where(
+            (material_request.status == "Pending")
+            & (material_request_item.parenttype == "Material Request")
+            & (IfNull(material_request_item.stock_reconciliation, "") == "")
+            & (item.is_stock_item == 1)
+            & (item.has_serial_no == 0)
+            & (item.has_batch_no == 0)
+        )
+        .orderby(material_request.name)
+        .orderby(material_request_item.idx)
+    ).run(as_dict=True)
 
-        if not data.get(mat_req_doc.company):
-            data[mat_req_doc.company] = {}
 
-        for item in mat_req_doc.items:
-            if not check_item_is_maintain(item.item_code):
-                continue
-            if (
-                not data.get(mat_req_doc.company).get(item.warehouse)
-                and not item.stock_reconciliation
-            ):
-                data[mat_req_doc.company][item.warehouse] = []
-                item_dict = get_stock_balance_for(item.item_code, item.warehouse)
-                item.valuation_rate = item_dict.get("rate")
-                item_dict = {
-                    "item_code": item.item_code,
-                    "warehouse": item.warehouse,
-                    "valuation_rate": item_dict.get("rate"),
-                    "batch_no": "",
-                    "qty": item_dict.get("qty") + item.stock_qty,
-                    "material_request": i["name"],
-                    "company": mat_req_doc.company,
-                    "row_name": item.name,
-                }
-                data[mat_req_doc.company][item.warehouse].append(item_dict)
-
-    for key, value in data.items():
-        for key1, value1 in value.items():
-            if len(value1) > 0:
-                items_list = []
-                items = []
-                for item in value1:
-                    if item["item_code"] not in items_list:
-                        items.append(item)
-                        items_list.append(item["item_code"])
-                if len(items) > 0:
-                    stock_rec_name = make_stock_reconciliation(value1, key)
-                    if stock_rec_name:
-                        for item in items:
-                            frappe.db.set_value(
-                                "Material Request Item",
-                                item["row_name"],
-                                "stock_reconciliation",
-                                stock_rec_name,
-                                update_modified=False,
-                            )
+def get_bin_balances(item_warehouses):
+    """
+    Current qty and valuation rate per (item_code, warehouse) from Bin
+
+    Bin keeps the qty after and valuation rate of the latest Stock Ledger Entry,
+    so this matches `get_stock_balance` as of now without a ledger lookup per item.
+    """
+    if not item_warehouses:
+        return {}
+
+    bin_table = DocType("Bin")
+    balances = {}
+    for items in create_batch(sorted(item_warehouses), 500):
+        for row in (
+            frappe.qb.from_(bin_table)
+            .select(
+                bin_table.item_code,
+                bin_table.warehouse,
+                bin_table.actual_qty,
+                bin_table.valuation_rate,
+            )
+            .where(
+                Tuple(bin_table.item_code, bin_table.warehouse).isin(
+                    [Tuple(item_code, warehouse) for item_code, warehouse in items]
+                )
+            )
+        ).run(as_dict=True):
+            balances[(row.item_code, row.warehouse)] = row
+    return balances
 
 
 def calculate_price_reduction(doc, method):
@@ -1174,7 +1244,7 @@ def validate_net_rate(doc, method):
             ).format(idx, item_name, ref_rate_field, rate)
         )
 
-    if not frappe.db.get_single_value("CSF TZ Settings", "validate_net_rate"):
+    if not get_csf_tz_setting("validate_net_rate"):
         return
 
     if hasattr(doc, "is_return") and doc.is_return:
@@ -1433,10 +1503,8 @@ def enroll_students(self):
 
 @frappe.whitelist()
 def get_tax_category(doc_type, company):
-    fetch_default_tax_category = (
-        frappe.db.get_value("CSF TZ Settings", None, "fetch_default_tax_category") or 0
-    )
-    if int(fetch_default_tax_category) != 1:
+    fetch_default_tax_category = get_csf_tz_setting("fetch_default_tax_category")
+    if fetch_default_tax_category != 1:
         return ""
     sales_list_types = ["Sales Order", "Sales Invoice", "Delivery Note", "Quotation"]
     Puchase_list_types = ["Purchase Order", "Purchase Invoice", "Purchase Receipt"]
@@ -1607,36 +1675,43 @@ def auto_close_dn():
     This routine will run every day 3:30am at night
     """
 
-    dn_list = []
-
-    customer_details = frappe.get_all(
-        "Customer",
-        filters={"csf_tz_is_auto_close_dn": 1},
-        fields=["name", "csf_tz_close_dn_after"],
+    delivery_notes = frappe.db.sql(
+        """
+        SELECT dn.name, dn.customer
+        FROM `tabDelivery Note` dn
+        INNER JOIN `tabCustomer` c ON c.name = dn.customer
+        WHERE c.csf_tz_is_auto_close_dn = 1
+            AND dn.docstatus = 1
+            AND dn.status != 'Closed'
+            AND dn.posting_date < DATE_SUB(%(today)s, INTERVAL IFNULL(c.csf_tz_close_dn_after, 0) DAY)
+        """,
+        {"today": nowdate()},
+        as_dict=True,
     )
 
-    if not customer_details:
-        return
-
-    for customer in customer_details:
-        filters = {
-            "docstatus": 1,
-            "customer": customer.name,
-            "status": ["!=", "Closed"],
-            "posting_date": [
-                "<",
-                add_days(nowdate(), days=(-1 * customer.csf_tz_close_dn_after)),
-            ],
-        }
-        dn_list += frappe.get_all(
-            "Delivery Note", filters=filters, fields=["name"], pluck="name"
-        )
-
-    for dn in dn_list:
-        frappe.db.set_value("Delivery Note", dn, "status", "Closed")
-
+    if not delivery_notes:
+        return {}
+
+    closed_per_customer = {}
+    for dn in delivery_notes:
+        closed_per_customer[dn.customer] = closed_per_customer.get(dn.customer, 0) + 1
+
+    delivery_note = DocType("Delivery Note")
+    dn_names = [dn.name for dn in delivery_notes]
+    for names in create_batch(dn_names, 1000):
+        (
+            frappe.qb.update(delivery_note)
+            .set(delivery_note.status, "Closed")
+            .set(delivery_note.modified, now_datetime())
+            .where(delivery_note.name.isin(names))
+        ).run()
         frappe.db.commit()
 
+    frappe.logger("csf_tz").info(
+        {"auto_close_dn": closed_per_customer, "total": len(dn_names)}
+    )
+    return closed_per_customer
+
 
 def batch_splitting(doc, method):
     """Splitting of batches before insert of sales invoice
@@ -1648,7 +1723,7 @@ def batch_splitting(doc, method):
     if doc.update_stock == 0:
         return
 
-    if not frappe.db.get_single_value("CSF TZ Settings", "allow_batch_splitting"):
+    if not get_csf_tz_setting("allow_batch_splitting"):
         return
 
     if not doc.set_warehouse and doc.pos_profile:
@@ -2095,8 +2170,8 @@ def update_row_item(row, batch_obj, quantity, fields_to_clear, conversion_factor
 
 def validate_grand_total(doc, method):
     """Validate grand total of sales invoice if 'validate_grand_total_vs_payment_amount_on_sales_invoice' is checked in CSF TZ Settings"""
-    if not frappe.db.get_single_value(
-        "CSF TZ Settings", "validate_grand_total_vs_payment_amount_on_sales_invoice"
+    if not get_csf_tz_setting(
+        "validate_grand_total_vs_payment_amount_on_sales_invoice"
     ):
         return
 
@@ -2575,7 +2650,7 @@ def get_item_prices_custom_po(filters=None, start=0, limit=20):
     if not filters:  # Default to an empty dictionary if filters is None or invalid
         filters = {}
 
-    unique_records = int(frappe.db.get_value("CSF TZ Settings", None, "unique_records"))
+    unique_records = get_csf_tz_setting("unique_records")
     customer = filters.get("customer", "")
     company = filters.get("company", "")
     item_code = "'{0}'".format(filters.get("item_code", ""))
@@ -2636,7 +2711,7 @@ def get_item_prices_custom_po(filters=None, start=0, limit=20):
 def get_item_prices_po(item_code, currency, customer=None, company=None):
     item_code = "'{0}'".format(item_code)
     currency = "'{0}'".format(currency)
-    unique_records = int(frappe.db.get_value("CSF TZ Settings", None, "unique_records"))
+    unique_records = get_csf_tz_setting("unique_records")
     prices_list = []
     unique_price_list = []
     max_records = frappe.db.get_value("Company", company, "max_records_in_dialog") or 20
@@ -2859,7 +2934,7 @@ def create_trade_in_stock_entry(doc, method):
         frappe.msgprint("No valid items found for stock entry.")
 @frappe.whitelist()
 def create_write_off_jv_si(sales_invoice, account):
-    settings = frappe.get_single("CSF TZ Settings")
+    settings = get_csf_tz_settings()
 
     # Feature flag check
     if not getattr(settings, "enable_write_off_jv_si", False):
@@ -2908,7 +2983,7 @@ def create_write_off_jv_si(sales_invoice, account):
 
 @frappe.whitelist()
 def create_write_off_jv_pi(purchase_invoice, account):
-    settings = frappe.get_single("CSF TZ Settings")
+    settings = get_csf_tz_settings()
 
     # Feature flag check
     if not getattr(settings, "enable_write_off_jv_pi", False):
@@ -2957,7 +3032,7 @@ def create_write_off_jv_pi(purchase_invoice, account):
 
 @frappe.whitelist()
 def create_write_off_jv_pe(payment_entry, account):
-    settings = frappe.get_single("CSF TZ Settings")
+    settings = get_csf_tz_settings()
 
     # Feature flag check
     if not getattr(settings, "enable_write_off_jv_pe", False):
@@ -131,6 +131,7 @@ after_migrate = [
     "csf_tz.patches.custom_fields.create_custom_fields_for_trade_in_feature.execute",
     "csf_tz.patches.custom_fields.vfd_providers_updated_custom_fields.execute",
     "csf_tz.patches.migrate_vfd_providers_to_csf_tz.execute",
+    "csf_tz.csftz_hooks.link_graph.clear_link_graph",
 ]
 
 # Desk Notifications
@@ -239,6 +240,8 @@ doc_events = {
     },
     "Salary Slip": {
         "before_insert": "csf_tz.csftz_hooks.payroll.before_insert_salary_slip",
+        "on_submit": "csf_tz.csftz_hooks.payroll.on_submit_salary_slip",
+        "on_cancel": "csf_tz.csftz_hooks.payroll.on_cancel_salary_slip",
     },
     "Attendance": {
         "validate": "csf_tz.csftz_hooks.attendance.process_overtime",
@@ -272,15 +275,56 @@ doc_events = {
         "on_submit": "csf_tz.csftz_hooks.exchange_calculations.link_lcv_to_import_tracker",
         "on_cancel": "csf_tz.csftz_hooks.exchange_calculations.unlink_lcv_from_import_tracker",
     },
+    "TZ Region": {
+        "on_update": "csf_tz.api.tz_location.clear_location_index",
+        "on_trash": "csf_tz.api.tz_location.clear_location_index",
+        "after_rename": "csf_tz.api.tz_location.clear_location_index",
+    },
+    "TZ District": {
+        "on_update": "csf_tz.api.tz_location.clear_location_index",
+        "on_trash": "csf_tz.api.tz_location.clear_location_index",
+        "after_rename": "csf_tz.api.tz_location.clear_location_index",
+    },
+    "TZ Ward": {
+        "on_update": "csf_tz.api.tz_location.clear_location_index",
+        "on_trash": "csf_tz.api.tz_location.clear_location_index",
+        "after_rename": "csf_tz.api.tz_location.clear_location_index",
+    },
+    "TZ Village": {
+        "on_update": "csf_tz.api.tz_location.clear_location_index",
+        "on_trash": "csf_tz.api.tz_location.clear_location_index",
+        "after_rename": "csf_tz.api.tz_location.clear_location_index",
+    },
+    "DocType": {
+        "on_update": "csf_tz.csftz_hooks.link_graph.clear_link_graph",
+        "on_trash": "csf_tz.csftz_hooks.link_graph.clear_link_graph",
+        "after_rename": "csf_tz.csftz_hooks.link_graph.clear_link_graph",
+    },
+    "Custom Field": {
+        "on_update": "csf_tz.csftz_hooks.link_graph.clear_link_graph",
+        "on_trash": "csf_tz.csftz_hooks.link_graph.clear_link_graph",
+    },
+    "Job Card": {
+        "on_change": "csf_tz.csf_tz.page.jobcards.jobcards.publish_board_update",
+        "on_trash": "csf_tz.csf_tz.page.jobcards.jobcards.publish_board_update",
+    },
+}
+
+standard_queries = {
+    "TZ Region": "csf_tz.api.tz_location.location_link_query",
+    "TZ District": "csf_tz.api.tz_location.location_link_query",
+    "TZ Ward": "csf_tz.api.tz_location.location_link_query",
+    "TZ Village": "csf_tz.api.tz_location.location_link_query",
 }
 
 # Scheduled Tasks
 # ---------------
 
 scheduler_events = {
-    # "all": [
-    # 	"csf_tz.tasks.all"
-    # ],
+    "all": [
+        "csf_tz.utils.integration_log.flush_integration_logs",
+        "csf_tz.utils.background_job.process_queued_jobs",
+    ],
     "cron": {
         "0 */2 * * *": [
             "csf_tz.csf_tz.doctype.vehicle_fine_record.vehicle_fine_record.check_fine_all_vehicles",
@@ -324,6 +368,11 @@ scheduler_events = {
     ],
 }
 
+default_log_clearing_doctypes = {
+    "CSF Integration Log": 30,
+    "CSF Background Job": 30,
+}
+
 jinja = {"methods": ["csf_tz.custom_api.generate_qrcode"]}
 
 
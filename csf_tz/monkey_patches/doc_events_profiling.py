@@ -0,0 +1,21 @@
+import frappe
+
+from csf_tz.utils.hook_profiler import get_profiling_settings, instrument_doc_events
+
+get_doc_hooks = frappe.get_doc_hooks
+
+
+def get_profiled_doc_hooks():
+    """
+    `frappe.get_doc_hooks` with the csf_tz handlers wrapped by csf_tz.utils.hook_profiler
+    while Hook Profiling is enabled, decided once per request or job
+    """
+    doc_hooks = get_doc_hooks()
+    if not hasattr(frappe.local, "csf_tz_profiled_doc_hooks"):
+        frappe.local.csf_tz_profiled_doc_hooks = (
+            instrument_doc_events(doc_hooks) if get_profiling_settings() else None
+        )
+    return frappe.local.csf_tz_profiled_doc_hooks or doc_hooks
+
+
+frappe.get_doc_hooks = get_profiled_doc_hooks
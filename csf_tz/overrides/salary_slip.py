@@ -2,6 +2,8 @@ import frappe
 from frappe import _
 from frappe.utils.background_jobs import enqueue
 
+from csf_tz.utils.settings import get_csf_tz_settings
+
 try:
     from hrms.payroll.doctype.salary_slip.salary_slip import (
         SalarySlip as _SalarySlip,
@@ -46,7 +48,7 @@ class SalarySlip(_SalarySlip):
         return min(fixed_working_days, payment_days)
 
     def email_salary_slip(self):
-        csf_tz_settings = frappe.get_cached_doc("CSF TZ Settings", "CSF TZ Settings")
+        csf_tz_settings = get_csf_tz_settings()
         if not csf_tz_settings.override_salary_slip_email_message:
             return super().email_salary_slip()
 
@@ -99,7 +101,7 @@ class SalarySlip(_SalarySlip):
 
 
 def get_fixed_working_days():
-    csf_tz_settings = frappe.get_cached_doc("CSF TZ Settings", "CSF TZ Settings")
+    csf_tz_settings = get_csf_tz_settings()
     if csf_tz_settings.enable_fixed_working_days_per_month:
         return csf_tz_settings.working_days_per_month
 
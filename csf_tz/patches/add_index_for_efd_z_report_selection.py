@@ -0,0 +1,10 @@
+import frappe
+
+
+def execute():
+    # EFD Z Report picks unreported invoices of a device up to the report date
+    frappe.db.add_index(
+        "Sales Invoice",
+        ["electronic_fiscal_device", "efd_z_report", "posting_date"],
+        index_name="efd_z_report_selection_index",
+    )
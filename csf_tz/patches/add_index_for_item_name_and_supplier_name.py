@@ -0,0 +1,7 @@
+import frappe
+
+
+def execute():
+    # TRA TAX Inv conversion resolves items and suppliers by name
+    frappe.db.add_index("Item", ["item_name"])
+    frappe.db.add_index("Supplier", ["supplier_name"])
@@ -0,0 +1,6 @@
+import frappe
+
+
+def execute():
+    # TRA Input VAT Returns eFiling selects purchase invoices by bill date
+    frappe.db.add_index("Purchase Invoice", ["bill_date"], index_name="bill_date_index")
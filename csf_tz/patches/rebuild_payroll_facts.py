@@ -0,0 +1,10 @@
+import frappe
+
+from csf_tz.csf_tz.doctype.csf_payroll_fact.csf_payroll_fact import (
+    rebuild_payroll_facts,
+)
+
+
+def execute():
+    frappe.reload_doc("csf_tz", "doctype", "csf_payroll_fact")
+    rebuild_payroll_facts()
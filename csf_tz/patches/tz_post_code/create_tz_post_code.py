@@ -2,43 +2,64 @@ import frappe
 import os
 import json
 import glob
+import hashlib
+from frappe.utils import now_datetime
+from csf_tz.api.tz_location import clear_location_index
 
 
-def execute():
+REGIONS_JSON_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "regions_json"
+)
+FILE_HASH_KEY = "tz_gazetteer_file_hash:{0}"
+
+# `format:X-{#######}` autonames draw their number from the "" series,
+# the same counter frappe uses when these documents are inserted one by one
+NAMING = {
+    "TZ District": ("D-", 7),
+    "TZ Ward": ("W-", 10),
+    "TZ Village": ("V-", 10),
+}
+
+
+def execute(force=False):
     """
     Read JSON files from regions_json directory and create TZ location records
     in hierarchical order: Region -> District -> Ward -> Village
-    """
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    regions_json_dir = os.path.join(script_dir, "regions_json")
 
+    Files whose content hash matches the last load are skipped, unless `force` is set.
+    Each level is inserted with multi-row inserts, rows that already exist are skipped.
+    """
     # Check if regions_json directory exists
-    if not os.path.exists(regions_json_dir):
+    if not os.path.exists(REGIONS_JSON_DIR):
         frappe.log_error(
-            "regions_json directory not found", f"Directory path: {regions_json_dir}"
+            "regions_json directory not found", f"Directory path: {REGIONS_JSON_DIR}"
         )
         return
 
     # Get all JSON files in the regions_json directory
-    json_files = glob.glob(os.path.join(regions_json_dir, "*.json"))
+    json_files = sorted(glob.glob(os.path.join(REGIONS_JSON_DIR, "*.json")))
 
     if not json_files:
-        frappe.log_error("No JSON files found", f"Directory: {regions_json_dir}")
+        frappe.log_error("No JSON files found", f"Directory: {REGIONS_JSON_DIR}")
         return
 
-    # Track created records to avoid duplicates
-    created_regions = set()
-    created_districts = set()
-    created_wards = set()
+    changed_files = {}
+    for json_file in json_files:
+        file_hash = get_file_hash(json_file)
+        if force or frappe.db.get_default(get_file_hash_key(json_file)) != file_hash:
+            changed_files[json_file] = file_hash
+
+    if not changed_files:
+        print("TZ gazetteer is up to date.")
+        return
 
+    gazetteer = TZGazetteer()
     total_processed = 0
     total_errors = 0
 
-    for json_file in json_files:
+    for json_file, file_hash in changed_files.items():
         try:
-            file_processed, file_errors = process_json_file(
-                json_file, created_regions, created_districts, created_wards
-            )
+            file_processed, file_errors = gazetteer.add_file(json_file)
             total_processed += file_processed
             total_errors += file_errors
 
@@ -47,6 +68,14 @@ def execute():
             frappe.log_error("JSON File Processing Error", error_msg)
             print(error_msg)
             total_errors += 1
+            changed_files[json_file] = None
+
+    gazetteer.save()
+    clear_location_index()
+
+    for json_file, file_hash in changed_files.items():
+        if file_hash:
+            frappe.db.set_default(get_file_hash_key(json_file), file_hash)
 
     # Final commit
     frappe.db.commit()
@@ -56,237 +85,214 @@ def execute():
     )
 
 
-def process_json_file(
-    json_file_path, created_regions, created_districts, created_wards
-):
-    """
-    Process a single JSON file and create location records
-    """
-    processed_count = 0
-    error_count = 0
+def get_file_hash(json_file_path):
+    with open(json_file_path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
 
-    try:
-        with open(json_file_path, "r", encoding="utf-8") as file:
-            data = json.load(file)
 
-        if not isinstance(data, list):
-            raise ValueError(f"Expected list in JSON file, got {type(data)}")
-
-        print(
-            f"Processing {os.path.basename(json_file_path)} with {len(data)} records..."
-        )
-
-        for record in data:
-            try:
-                if not isinstance(record, dict):
-                    continue
-
-                # Extract data from JSON record
-                region_name = record.get("Region", "").strip()
-                district_name = record.get("District", "").strip()
-                ward_name = record.get("Ward", "").strip()
-                village_name = record.get(
-                    "Location", ""
-                ).strip()  # Location maps to Village
-                postcode = record.get("Postcode", "").strip()
-
-                # Skip if essential data is missing
-                if not all([region_name, district_name, ward_name]):
-                    continue
-
-                # Create/get region
-                region_doc = create_or_get_region(region_name, created_regions)
-                if not region_doc:
-                    error_count += 1
-                    continue
-
-                # Create/get district
-                district_doc = create_or_get_district(
-                    district_name, region_name, created_districts
-                )
-                if not district_doc:
-                    error_count += 1
-                    continue
-
-                # Create/get ward (pass district document name, not district name)
-                ward_doc = create_or_get_ward(
-                    ward_name, district_doc.name, created_wards
-                )
-                if not ward_doc:
-                    error_count += 1
-                    continue
-
-                # Create village (always create as villages can have same name in different wards)
-                if village_name:
-                    village_doc = create_village(village_name, ward_doc.name, postcode)
-                    if village_doc:
-                        processed_count += 1
-                    else:
-                        error_count += 1
-                else:
-                    processed_count += 1  # Count even if no village name
-
-            except Exception as e:
-                error_msg = f"Error processing record in {json_file_path}: {str(e)}"
-                frappe.log_error("Record Processing Error", error_msg)
-                error_count += 1
-
-        # Commit after each file
-        frappe.db.commit()
-
-    except Exception as e:
-        error_msg = f"Error reading JSON file {json_file_path}: {str(e)}"
-        frappe.log_error("JSON File Read Error", error_msg)
-        error_count += 1
-
-    return processed_count, error_count
+def get_file_hash_key(json_file_path):
+    return FILE_HASH_KEY.format(os.path.basename(json_file_path))
 
 
-def create_or_get_region(region_name, created_regions):
+class TZGazetteer:
     """
-    Create or get TZ Region record
-    """
-    if not region_name or region_name in created_regions:
-        return (
-            frappe.get_doc("TZ Region", region_name)
-            if region_name in created_regions
-            else None
-        )
-
-    try:
-        # Check if region already exists
-        if frappe.db.exists("TZ Region", region_name):
-            created_regions.add(region_name)
-            return frappe.get_doc("TZ Region", region_name)
-
-        # Create new region
-        region_doc = frappe.get_doc({"doctype": "TZ Region", "region": region_name})
-        region_doc.insert(ignore_permissions=True)
-        created_regions.add(region_name)
+    In-memory copy of the TZ Region/District/Ward/Village hierarchy.
 
-        return region_doc
-
-    except Exception as e:
-        error_msg = f"Error creating region '{region_name}': {str(e)}"
-        frappe.log_error("Region Creation Error", error_msg)
-        return None
-
-
-def create_or_get_district(district_name, region_name, created_districts):
-    """
-    Create or get TZ District record
+    Records are keyed by their names up the hierarchy (district names are unique
+    across regions). Existing records are loaded once, records from the JSON files
+    are deduplicated against them and only the new ones are written by `save`.
     """
-    district_key = f"{district_name}|{region_name}"
-
-    if district_key in created_districts:
-        # Find existing district by name and region
-        existing = frappe.db.get_value(
-            "TZ District", {"district": district_name, "region": region_name}, "name"
-        )
-        if existing:
-            return frappe.get_doc("TZ District", existing)
-
-    try:
-        # Check if district with same name and region exists
-        existing = frappe.db.get_value(
-            "TZ District", {"district": district_name, "region": region_name}, "name"
-        )
-
-        if existing:
-            created_districts.add(district_key)
-            return frappe.get_doc("TZ District", existing)
-
-        # Create new district
-        district_doc = frappe.get_doc(
-            {"doctype": "TZ District", "district": district_name, "region": region_name}
-        )
-        district_doc.insert(ignore_permissions=True)
-        created_districts.add(district_key)
-
-        return district_doc
-
-    except Exception as e:
-        error_msg = f"Error creating district '{district_name}' in region '{region_name}': {str(e)}"
-        frappe.log_error("District Creation Error", error_msg)
-        return None
 
+    def __init__(self):
+        self.regions = set(frappe.get_all("TZ Region", pluck="name"))
+
+        self.districts = {}
+        district_names = {}
+        for row in frappe.get_all("TZ District", fields=["name", "district", "region"]):
+            self.districts[row.district] = {"name": row.name, "region": row.region}
+            district_names[row.name] = row.district
+
+        self.wards = {}
+        ward_keys = {}
+        for row in frappe.get_all("TZ Ward", fields=["name", "ward", "district"]):
+            key = (row.ward, district_names.get(row.district))
+            self.wards[key] = {"name": row.name}
+            ward_keys[row.name] = key
+
+        self.villages = {}
+        for row in frappe.get_all(
+            "TZ Village", fields=["name", "village", "ward", "postcode"]
+        ):
+            key = (row.village,) + ward_keys.get(row.ward, (row.ward, None))
+            self.villages[key] = {"name": row.name, "postcode": row.postcode}
+
+        self.new_regions = []
+        self.new_districts = []
+        self.new_wards = []
+        self.new_villages = []
+        self.postcode_updates = {}
+
+    def add_file(self, json_file_path):
+        """
+        Add the records of a single JSON file
+        """
+        processed_count = 0
+        error_count = 0
 
-def create_or_get_ward(ward_name, district_doc_name, created_wards):
-    """
-    Create or get TZ Ward record
-    district_doc_name should be the document name (e.g., 'D-0000001'), not the district field value
-    """
-    ward_key = f"{ward_name}|{district_doc_name}"
-
-    if ward_key in created_wards:
-        # Find existing ward by name and district document name
-        existing = frappe.db.get_value(
-            "TZ Ward", {"ward": ward_name, "district": district_doc_name}, "name"
-        )
-        if existing:
-            return frappe.get_doc("TZ Ward", existing)
-
-    try:
-        # Check if ward with same name and district exists
-        existing = frappe.db.get_value(
-            "TZ Ward", {"ward": ward_name, "district": district_doc_name}, "name"
-        )
+        with open(json_file_path, "r", encoding="utf-8") as file:
+            data = json.load(file)
 
-        if existing:
-            created_wards.add(ward_key)
-            return frappe.get_doc("TZ Ward", existing)
+        if not isinstance(data, list):
+            raise ValueError(f"Expected list in JSON file, got {type(data)}")
 
-        # Create new ward
-        ward_doc = frappe.get_doc(
-            {"doctype": "TZ Ward", "ward": ward_name, "district": district_doc_name}
-        )
-        ward_doc.insert(ignore_permissions=True)
-        created_wards.add(ward_key)
+        print(f"Processing {os.path.basename(json_file_path)} with {len(data)} records...")
 
-        return ward_doc
+        for record in data:
+            if not isinstance(record, dict):
+                continue
+
+            # Extract data from JSON record
+            region_name = (record.get("Region") or "").strip()
+            district_name = (record.get("District") or "").strip()
+            ward_name = (record.get("Ward") or "").strip()
+            # Location maps to Village
+            village_name = (record.get("Location") or "").strip()
+            postcode = (record.get("Postcode") or "").strip()
+
+            # Skip if essential data is missing
+            if not all([region_name, district_name, ward_name]):
+                continue
+
+            if self.add(region_name, district_name, ward_name, village_name, postcode):
+                processed_count += 1
+            else:
+                error_count += 1
 
-    except Exception as e:
-        error_msg = f"Error creating ward '{ward_name}' in district '{district_doc_name}': {str(e)}"
-        frappe.log_error("Ward Creation Error", error_msg)
-        return None
+        return processed_count, error_count
+
+    def add(self, region_name, district_name, ward_name, village_name, postcode):
+        if region_name not in self.regions:
+            self.regions.add(region_name)
+            self.new_regions.append({"name": region_name, "region": region_name})
+
+        district = self.districts.get(district_name)
+        if not district:
+            district = {"name": None, "district": district_name, "region": region_name}
+            self.districts[district_name] = district
+            self.new_districts.append(district)
+        elif district["region"] != region_name:
+            # same district name already used in another region
+            return False
+
+        ward_key = (ward_name, district_name)
+        if ward_key not in self.wards:
+            ward = {"name": None, "ward": ward_name, "district": district}
+            self.wards[ward_key] = ward
+            self.new_wards.append(ward)
+
+        if not village_name:
+            return True
+
+        village_key = (village_name,) + ward_key
+        village = self.villages.get(village_key)
+        if not village:
+            village = {
+                "name": None,
+                "village": village_name,
+                "ward": self.wards[ward_key],
+                "postcode": postcode,
+            }
+            self.villages[village_key] = village
+            self.new_villages.append(village)
+        elif postcode and village["postcode"] != postcode:
+            village["postcode"] = postcode
+            if village["name"]:
+                self.postcode_updates[village["name"]] = postcode
+
+        return True
+
+    def save(self):
+        """Insert new records level by level and apply postcode changes"""
+        insert_rows("TZ Region", self.new_regions)
+
+        for doctype, rows, parent_field in (
+            ("TZ District", self.new_districts, None),
+            ("TZ Ward", self.new_wards, "district"),
+            ("TZ Village", self.new_villages, "ward"),
+        ):
+            for row, name in zip(rows, reserve_names(doctype, len(rows))):
+                row["name"] = name
+            insert_rows(
+                doctype,
+                [
+                    dict(row, **{parent_field: row[parent_field]["name"]})
+                    if parent_field
+                    else row
+                    for row in rows
+                ],
+            )
 
+        by_postcode = {}
+        for village, postcode in self.postcode_updates.items():
+            by_postcode.setdefault(postcode, []).append(village)
+        village_table = frappe.qb.DocType("TZ Village")
+        for postcode, villages in by_postcode.items():
+            (
+                frappe.qb.update(village_table)
+                .set(village_table.postcode, postcode)
+                .set(village_table.modified, now_datetime())
+                .where(village_table.name.isin(villages))
+            ).run()
 
-def create_village(village_name, ward_name, postcode):
-    """
-    Create TZ Village record
-    Note: Villages are not tracked for duplicates as they can have same names in different wards
-    """
-    try:
-        # Check if village with same name and ward already exists
-        existing = frappe.db.get_value(
-            "TZ Village", {"village": village_name, "ward": ward_name}, "name"
+        print(
+            f"Inserted {len(self.new_regions)} regions, {len(self.new_districts)} districts, "
+            f"{len(self.new_wards)} wards, {len(self.new_villages)} villages; "
+            f"updated {len(self.postcode_updates)} postcodes"
         )
 
-        if existing:
-            # Update postcode if provided and different
-            if postcode:
-                existing_doc = frappe.get_doc("TZ Village", existing)
-                if existing_doc.postcode != postcode:
-                    existing_doc.postcode = postcode
-                    existing_doc.save(ignore_permissions=True)
-            return frappe.get_doc("TZ Village", existing)
-
-        # Create new village
-        village_doc = frappe.get_doc(
-            {
-                "doctype": "TZ Village",
-                "village": village_name,
-                "ward": ward_name,
-                "postcode": postcode or "",
-            }
-        )
-        village_doc.insert(ignore_permissions=True)
 
-        return village_doc
+def reserve_names(doctype, count):
+    """Reserve `count` consecutive names from the doctype's series in one update"""
+    if not count:
+        return []
+
+    prefix, digits = NAMING[doctype]
+    series = frappe.qb.DocType("Series")
+    current = (
+        frappe.qb.from_(series)
+        .select(series.current)
+        .where(series.name == "")
+        .for_update()
+    ).run()
+
+    if current and current[0][0] is not None:
+        start = current[0][0]
+        (
+            frappe.qb.update(series)
+            .set(series.current, start + count)
+            .where(series.name == "")
+        ).run()
+    else:
+        start = 0
+        frappe.qb.into(series).insert("", count).run()
+
+    return [f"{prefix}{number:0{digits}d}" for number in range(start + 1, start + count + 1)]
+
+
+def insert_rows(doctype, rows):
+    if not rows:
+        return
 
-    except Exception as e:
-        error_msg = (
-            f"Error creating village '{village_name}' in ward '{ward_name}': {str(e)}"
-        )
-        frappe.log_error("Village Creation Error", error_msg)
-        return None
+    timestamp = now_datetime()
+    fields = sorted({key for row in rows for key in row})
+    meta_fields = ["creation", "modified", "owner", "modified_by", "docstatus"]
+    frappe.db.bulk_insert(
+        doctype,
+        fields + meta_fields,
+        [
+            [row.get(field) for field in fields]
+            + [timestamp, timestamp, "Administrator", "Administrator", 0]
+            for row in rows
+        ],
+        ignore_duplicates=True,
+    )
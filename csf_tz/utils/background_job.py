@@ -0,0 +1,229 @@
+import json
+import math
+
+import frappe
+from frappe.query_builder.functions import IfNull
+from frappe.utils import add_to_date, create_batch, now_datetime
+
+JOB_DOCTYPE = "CSF Background Job"
+ACTIVE_STATUSES = ("Queued", "Running")
+# chunked jobs running at once on each queue, the others wait as Queued
+MAX_RUNNING_JOBS = {"short": 1, "default": 1, "long": 2}
+# the first retry of a failed chunk waits this long, each next retry twice as long
+RETRY_BACKOFF_SECONDS = 60
+
+
+def start_chunked_job(
+    method,
+    items,
+    job_key,
+    queue="long",
+    chunk_size=100,
+    timeout=3600,
+    max_attempts=3,
+    once=False,
+    **kwargs,
+):
+    """
+    Run `method(chunk, **kwargs)` in the background over `items`, `chunk_size` at a time
+
+    Progress is kept on a CSF Background Job. Each chunk is committed on its own and
+    the job's cursor moves past it, so a job that stops half way resumes at the
+    chunk it stopped at. A chunk that raises is rolled back and retried with
+    exponential backoff; after `max_attempts` the job is marked Failed and can be
+    resumed from the form. `method` may return the items of its chunk it could not
+    process, they are counted as failed without retrying the chunk.
+
+    Args:
+        method (str): Dotted path of the chunk handler
+        items (list): JSON serialisable items, e.g. document names
+        job_key (str): Idempotency key, a queued or running job with the same key
+            is returned instead of starting another one
+        queue (str): RQ queue, at most `MAX_RUNNING_JOBS[queue]` chunked jobs run
+            on it at once
+        timeout (int): RQ timeout of a run, chunks that take longer are retried
+        once (bool): Also return a finished job with the same key, for jobs that
+            run once per key, e.g. once a day
+        kwargs: JSON serialisable arguments passed to every chunk
+
+    Returns:
+        str: Name of the CSF Background Job
+    """
+    filters = {"job_key": job_key}
+    if not once:
+        filters["status"] = ["in", ACTIVE_STATUSES]
+    existing = frappe.db.get_value(
+        JOB_DOCTYPE, filters, "name", order_by="creation desc"
+    )
+    if existing:
+        return existing
+
+    items = list(items)
+    job = frappe.get_doc(
+        {
+            "doctype": JOB_DOCTYPE,
+            "job_key": job_key,
+            "method": method,
+            "queue": queue,
+            "status": "Queued" if items else "Completed",
+            "total_items": len(items),
+            "total_chunks": math.ceil(len(items) / chunk_size),
+            "chunk_size": chunk_size,
+            "max_attempts": max_attempts,
+            "timeout": timeout,
+            "items": frappe.as_json(items, indent=None),
+            "kwargs": frappe.as_json(kwargs, indent=None),
+        }
+    ).insert(ignore_permissions=True)
+
+    if items:
+        enqueue_queued_jobs(queue)
+    return job.name
+
+
+def resume_chunked_job(job):
+    """Queue a failed or waiting job again, it starts at its cursor without waiting for the backoff"""
+    frappe.db.set_value(
+        JOB_DOCTYPE,
+        job,
+        {"status": "Queued", "attempts": 0, "next_retry": None, "finished_on": None},
+    )
+    enqueue_queued_jobs(frappe.db.get_value(JOB_DOCTYPE, job, "queue"))
+
+
+def enqueue_queued_jobs(queue):
+    """Enqueue the queued jobs of `queue` that are due, up to its free slots"""
+    table = frappe.qb.DocType(JOB_DOCTYPE)
+    running = frappe.db.count(JOB_DOCTYPE, {"queue": queue, "status": "Running"})
+    slots = MAX_RUNNING_JOBS.get(queue, 1) - running
+    if slots <= 0:
+        return
+
+    jobs = (
+        frappe.qb.from_(table)
+        .select(table.name, table.timeout)
+        .where(table.queue == queue)
+        .where(table.status == "Queued")
+        .where(IfNull(table.next_retry, "2000-01-01") <= now_datetime())
+        .orderby(table.creation)
+        .limit(slots)
+    ).run(as_dict=True)
+    for job in jobs:
+        frappe.enqueue(
+            "csf_tz.utils.background_job.run_chunked_job",
+            queue=queue,
+            timeout=job.timeout,
+            job_id=f"csf_background_job::{job.name}",
+            deduplicate=True,
+            enqueue_after_commit=True,
+            job=job.name,
+        )
+
+
+def process_queued_jobs():
+    """
+    Called by the scheduler, requeues running jobs whose worker went away and
+    enqueues the queued jobs that are due on every queue
+    """
+    table = frappe.qb.DocType(JOB_DOCTYPE)
+    # a running job is saved after every chunk, one that was not saved for a whole
+    # run timeout is no longer running
+    for job in (
+        frappe.qb.from_(table)
+        .select(table.name, table.timeout, table.modified)
+        .where(table.status == "Running")
+    ).run(as_dict=True):
+        if add_to_date(job.modified, seconds=job.timeout or 3600) < now_datetime():
+            frappe.db.set_value(JOB_DOCTYPE, job.name, "status", "Queued")
+
+    # queues without a cap in MAX_RUNNING_JOBS run one job at a time
+    queued = frappe.get_all(
+        JOB_DOCTYPE, filters={"status": "Queued"}, pluck="queue", distinct=True
+    )
+    for queue in set(MAX_RUNNING_JOBS) | set(queued):
+        enqueue_queued_jobs(queue)
+
+
+def claim_job(job):
+    """Mark the job Running if it is queued and its queue has a free slot"""
+    table = frappe.qb.DocType(JOB_DOCTYPE)
+    queue = frappe.db.get_value(JOB_DOCTYPE, job, "queue")
+    # lock the active jobs of the queue so two workers cannot both take the last slot
+    active = (
+        frappe.qb.from_(table)
+        .select(table.name, table.status)
+        .where(table.queue == queue)
+        .where(table.status.isin(ACTIVE_STATUSES))
+        .for_update()
+    ).run(as_dict=True)
+    statuses = {row.name: row.status for row in active}
+    running = sum(1 for status in statuses.values() if status == "Running")
+    if statuses.get(job) != "Queued" or running >= MAX_RUNNING_JOBS.get(queue, 1):
+        frappe.db.rollback()
+        return False
+
+    frappe.db.set_value(
+        JOB_DOCTYPE, job, {"status": "Running", "started_on": now_datetime()}
+    )
+    frappe.db.commit()
+    return True
+
+
+def run_chunked_job(job):
+    """Run the chunks of a CSF Background Job from its cursor, enqueued by `enqueue_queued_jobs`"""
+    if not claim_job(job):
+        return
+
+    job = frappe.get_doc(JOB_DOCTYPE, job)
+    try:
+        method = frappe.get_attr(job.method)
+        chunks = list(create_batch(json.loads(job.items or "[]"), job.chunk_size or 1))
+        kwargs = json.loads(job.kwargs or "{}")
+    except Exception:
+        frappe.db.rollback()
+        job.db_set({"status": "Failed", "error": frappe.get_traceback()}, commit=True)
+        return
+
+    while job.cursor < len(chunks):
+        chunk = chunks[job.cursor]
+        try:
+            failed = method(chunk, **kwargs) or []
+            frappe.db.commit()
+        except Exception:
+            frappe.db.rollback()
+            attempts = job.attempts + 1
+            values = {"attempts": attempts, "error": frappe.get_traceback()}
+            if attempts < (job.max_attempts or 1):
+                values["status"] = "Queued"
+                values["next_retry"] = add_to_date(
+                    now_datetime(), seconds=RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)
+                )
+            else:
+                values["status"] = "Failed"
+                frappe.log_error(
+                    title=f"Background job {job.job_key} failed at chunk {job.cursor + 1}",
+                    message=values["error"],
+                )
+            job.db_set(values, commit=True)
+            enqueue_queued_jobs(job.queue)
+            return
+
+        job.db_set(
+            {
+                "cursor": job.cursor + 1,
+                "processed_items": job.processed_items + len(chunk) - len(failed),
+                "failed_items": job.failed_items + len(failed),
+                "attempts": 0,
+                "next_retry": None,
+            },
+            commit=True,
+        )
+
+    job.db_set(
+        {
+            "status": "Completed with Errors" if job.failed_items else "Completed",
+            "finished_on": now_datetime(),
+        },
+        commit=True,
+    )
+    enqueue_queued_jobs(job.queue)
@@ -4,19 +4,20 @@ import os
 import frappe
 from frappe.custom.doctype.custom_field.custom_field import create_custom_fields
 
+from csf_tz.utils.fixture_registry import apply_fixture_folder
+
 folder = "../patches/custom_fields/custom_fields_json"
 
 
 def load_json(file):
     CURR_DIR = os.path.abspath(os.path.dirname(__file__))
     json_file_path = os.path.join(CURR_DIR, folder, file)
-    # TODO do not load the file if already applied
     with open(json_file_path, "r") as file:
         data = json.load(file)
     return data
 
 
-def create_fields_from_json(custom_fields_obj):
+def create_fields_from_json(custom_fields_obj, existing_doctypes=None):
     disallowed_fields = [
         "name",
         "owner",
@@ -28,14 +29,16 @@ def create_fields_from_json(custom_fields_obj):
         "is_system_generated",
         "__last_sync_on",
     ]
+    all_fields = frappe.get_meta("Custom Field").get_valid_columns()
+    field_list = set(all_fields).difference(disallowed_fields)
+    if existing_doctypes is None:
+        existing_doctypes = set(frappe.get_all("DocType", pluck="name"))
     doctype_custom_fields_dict = {}
 
     for custom_field in custom_fields_obj:
         doctype = custom_field["dt"]
-        if not frappe.db.exists("DocType", doctype):
+        if doctype not in existing_doctypes:
             continue
-        all_fields = frappe.get_meta("Custom Field").get_valid_columns()
-        field_list = set(all_fields).difference(disallowed_fields)
         custom_field_dict = {}
         for field_name in field_list:
             custom_field_dict[field_name] = custom_field.get(field_name)
@@ -49,19 +52,16 @@ def create_fields_from_json(custom_fields_obj):
     create_custom_fields(doctype_custom_fields_dict, update=False)
 
 
-def execute():
-    # read names of only json files in this folder and put it into files list
-    files = list(
-        filter(
-            lambda x: x.endswith(".json"),
-            os.listdir(
-                os.path.join(os.path.abspath(os.path.dirname(__file__)), folder)
-            ),
-        )
+def execute(force=False):
+    # apply only the json files in this folder that changed since the last run
+    apply_fixture_folder(
+        os.path.normpath(os.path.join(os.path.abspath(os.path.dirname(__file__)), folder)),
+        "dt",
+        create_fields_from_json,
+        "Custom Field",
+        lambda record: record.get("name") or f"{record['dt']}-{record['fieldname']}",
+        force=force,
     )
-    for file in files:
-        data = load_json(file)
-        create_fields_from_json(data)
 
 
 @frappe.whitelist()
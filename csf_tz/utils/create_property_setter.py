@@ -4,6 +4,8 @@ import os
 import frappe
 from frappe.custom.doctype.property_setter.property_setter import make_property_setter
 
+from csf_tz.utils.fixture_registry import apply_fixture_folder
+
 folder = "../patches/property_setter/property_setter_json"
 
 
@@ -15,7 +17,7 @@ def load_json(file):
     return data
 
 
-def create_property_setter_from_json(property_setters_obj):
+def create_property_setter_from_json(property_setters_obj, existing_doctypes=None):
     disallowed_fields = [
         "name",
         "owner",
@@ -28,13 +30,23 @@ def create_property_setter_from_json(property_setters_obj):
         "__last_sync_on",
     ]
 
-    existing_setters = {d.name for d in frappe.db.get_all("Property Setter", fields=["name"],page_length=10000)}
+    names = [d.get("name") for d in property_setters_obj if d.get("name")]
+    existing_setters = set(
+        frappe.get_all("Property Setter", filters={"name": ["in", names]}, pluck="name")
+        if names
+        else []
+    )
+    if existing_doctypes is None:
+        existing_doctypes = set(frappe.get_all("DocType", pluck="name"))
+
+    all_fields = frappe.get_meta("Property Setter").get_valid_columns()
+    field_list = set(all_fields).difference(disallowed_fields)
 
     for property_setter in property_setters_obj:
         if property_setter.get('name') in existing_setters:
             continue
 
-        if not frappe.db.exists("DocType", property_setter.get("doc_type")):
+        if property_setter.get("doc_type") not in existing_doctypes:
             continue
 
         if property_setter.get('doctype_or_field') == "DocType":
@@ -42,9 +54,6 @@ def create_property_setter_from_json(property_setters_obj):
         else:
             for_doctype = False
 
-        all_fields = frappe.get_meta("Property Setter").get_valid_columns()
-        field_list = set(all_fields).difference(disallowed_fields)
-        
         property_setter_dict = {field: property_setter.get(field) for field in field_list if field in property_setter}
         
         make_property_setter(
@@ -56,16 +65,22 @@ def create_property_setter_from_json(property_setters_obj):
             for_doctype=for_doctype
         )
 
-def execute():
-    # read names of only json files in this folder and put it into files list
-    files = list(
-        filter(
-            lambda x: x.endswith(".json"),
-            os.listdir(
-                os.path.join(os.path.abspath(os.path.dirname(__file__)), folder)
-            ),
-        )
+def execute(force=False):
+    # apply only the json files in this folder that changed since the last run
+    apply_fixture_folder(
+        os.path.normpath(os.path.join(os.path.abspath(os.path.dirname(__file__)), folder)),
+        "doc_type",
+        create_property_setter_from_json,
+        "Property Setter",
+        get_property_setter_name,
+        force=force,
+    )
+
+
+def get_property_setter_name(property_setter):
+    """Name of the Property Setter on the site, named like `PropertySetter.autoname` when unset"""
+    return property_setter.get("name") or "{0}-{1}-{2}".format(
+        property_setter.get("doc_type"),
+        property_setter.get("field_name") or property_setter.get("row_name") or "main",
+        property_setter.get("property"),
     )
-    for file in files:
-        data = load_json(file)
-        create_property_setter_from_json(data)
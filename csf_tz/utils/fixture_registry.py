@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import time
+
+import frappe
+
+REGISTRY_KEY = "csf_tz_fixture_hash:{0}"
+
+
+def apply_fixture_folder(
+    folder, doctype_field, apply, record_doctype, get_record_name, force=False
+):
+    """Apply every JSON fixture file in `folder` whose content changed since it was last applied.
+
+    The registry hash covers the file content and the doctypes it targets that exist
+    on the site, so a file is applied again once an app providing a skipped doctype
+    is installed. An unchanged file is also applied again when one of its records
+    was deleted on the site.
+
+    :param folder: absolute path of the folder holding the JSON files
+    :param doctype_field: key holding the target doctype in each record, e.g. `dt`
+    :param apply: callable(records, existing_doctypes) applying one file
+    :param record_doctype: doctype of the records, e.g. `Custom Field`
+    :param get_record_name: callable(record) returning the name of the record on the site
+    :param force: apply all files even if unchanged
+
+    Per-file timings go to the csf_tz log, the total is printed in the migrate output.
+    """
+    logger = frappe.logger("csf_tz")
+    started = time.monotonic()
+    files = sorted(file for file in os.listdir(folder) if file.endswith(".json"))
+    applied = 0
+
+    for file in files:
+        file_started = time.monotonic()
+        with open(os.path.join(folder, file), "rb") as f:
+            content = f.read()
+        records = json.loads(content)
+
+        doctypes = {record.get(doctype_field) for record in records} - {None}
+        existing_doctypes = set(
+            frappe.get_all(
+                "DocType", filters={"name": ["in", list(doctypes)]}, pluck="name"
+            )
+            if doctypes
+            else []
+        )
+
+        registry_key = REGISTRY_KEY.format(os.path.join(os.path.basename(folder), file))
+        file_hash = hashlib.sha256(
+            content + json.dumps(sorted(existing_doctypes)).encode()
+        ).hexdigest()
+        if (
+            not force
+            and frappe.db.get_default(registry_key) == file_hash
+            and not has_missing_records(
+                records,
+                doctype_field,
+                existing_doctypes,
+                record_doctype,
+                get_record_name,
+            )
+        ):
+            logger.info(
+                f"{record_doctype} fixtures {file}: unchanged, checked in "
+                f"{time.monotonic() - file_started:.2f}s"
+            )
+            continue
+
+        apply(records, existing_doctypes)
+        frappe.db.set_default(registry_key, file_hash)
+        applied += 1
+        logger.info(
+            f"{record_doctype} fixtures {file}: applied in "
+            f"{time.monotonic() - file_started:.2f}s"
+        )
+
+    print(
+        f"{record_doctype} fixtures: applied {applied} of {len(files)} files "
+        f"in {time.monotonic() - started:.2f}s"
+    )
+
+
+def has_missing_records(
+    records, doctype_field, existing_doctypes, record_doctype, get_record_name
+):
+    """Whether a record of an existing doctype is not on the site, e.g. deleted by hand"""
+    names = {
+        get_record_name(record)
+        for record in records
+        if record.get(doctype_field) in existing_doctypes
+    }
+    if not names:
+        return False
+    found = frappe.get_all(
+        record_doctype, filters={"name": ["in", list(names)]}, pluck="name"
+    )
+    return len(set(found)) < len(names)
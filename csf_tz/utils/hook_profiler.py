@@ -0,0 +1,199 @@
+"""
+Sampled latency profiling of the csf_tz doc_events handlers
+
+While Hook Profiling is enabled in CSF TZ Settings, the `frappe.get_doc_hooks`
+patch in csf_tz.monkey_patches.doc_events_profiling points each csf_tz handler
+to an attribute of this module named after it, e.g.
+
+    csf_tz.custom_api.validate_grand_total
+    -> csf_tz.utils.hook_profiler.profiled__csf_tz__dot__custom_api__dot__validate_grand_total
+
+The module `__getattr__` resolves such a name to a wrapper calling the handler,
+which measures a sample of its calls. With profiling disabled the handlers are
+called directly, hooks.py always lists the real handlers.
+"""
+
+import json
+import math
+import random
+from time import perf_counter
+
+import frappe
+from frappe.utils import flt
+
+from csf_tz.utils.settings import get_csf_tz_settings
+
+WRAPPER_PREFIX = "profiled__"
+DOT = "__dot__"
+PROFILE_KEYS = "csf_tz_hook_profile_keys"
+PROFILE_SAMPLES = "csf_tz_hook_profile::{0}"
+# samples kept per (doctype, event, handler), the oldest are dropped
+MAX_SAMPLES = 1000
+DEFAULT_SAMPLE_RATE = 1
+PERCENTILES = (50, 95, 99)
+
+
+def instrument_doc_events(doc_events):
+    """Return `doc_events` with each csf_tz handler replaced by its profiled wrapper"""
+
+    def instrument(handler):
+        if isinstance(handler, str) and handler.startswith("csf_tz."):
+            return f"{__name__}.{WRAPPER_PREFIX}{handler.replace('.', DOT)}"
+        return handler
+
+    return {
+        doctype: {
+            event: [instrument(handler) for handler in handlers]
+            if isinstance(handlers, list)
+            else instrument(handlers)
+            for event, handlers in events.items()
+        }
+        for doctype, events in doc_events.items()
+    }
+
+
+def __getattr__(name):
+    """Resolve the wrapper names set by `instrument_doc_events`, `frappe.get_attr` looks them up here"""
+    if not name.startswith(WRAPPER_PREFIX):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    wrapper = get_profiled_handler(name[len(WRAPPER_PREFIX) :].replace(DOT, "."))
+    globals()[name] = wrapper
+    return wrapper
+
+
+def get_profiled_handler(handler):
+    """
+    Wrap the doc_events `handler` so a sample of its calls is measured
+
+    A measured call records its wall time and, on MariaDB, the queries and rows read
+    of the session while it ran, including those of the documents it saves.
+    """
+
+    def profiled(doc, *args, **kwargs):
+        method = frappe.get_attr(handler)
+        if not is_sampled():
+            return method(doc, *args, **kwargs)
+
+        counters = get_db_counters()
+        start = perf_counter()
+        try:
+            return method(doc, *args, **kwargs)
+        finally:
+            wall_ms = (perf_counter() - start) * 1000
+            event = args[0] if args else kwargs.get("method")
+            record_sample(doc.doctype, event, handler, wall_ms, counters)
+
+    profiled.__name__ = handler.rsplit(".", 1)[-1]
+    profiled.__qualname__ = profiled.__name__
+    return profiled
+
+
+def get_profiling_settings():
+    """CSF TZ Settings if Hook Profiling is enabled, else None"""
+    try:
+        settings = get_csf_tz_settings()
+    except Exception:
+        # e.g. while csf_tz is installed, before CSF TZ Settings exists
+        return None
+    return settings if settings.enable_hook_profiling else None
+
+
+def is_sampled():
+    settings = get_profiling_settings()
+    if not settings:
+        return False
+    rate = settings.hook_profiling_sample_rate
+    # 0 pauses sampling, only an unset rate falls back to the default
+    rate = DEFAULT_SAMPLE_RATE if rate is None else flt(rate)
+    return random.random() * 100 < rate
+
+
+def get_db_counters():
+    """Questions and Rows_read of the database session, None where they are not available"""
+    if frappe.db.db_type != "mariadb":
+        return None
+    return {
+        variable: int(value)
+        for variable, value in frappe.db.sql(
+            "SHOW SESSION STATUS WHERE Variable_name IN ('Questions', 'Rows_read')"
+        )
+    }
+
+
+def record_sample(doctype, event, handler, wall_ms, counters):
+    """Append a sample to the capped Redis list of (doctype, event, handler)"""
+    try:
+        queries = rows_read = None
+        if counters:
+            after = get_db_counters()
+            # the second SHOW SESSION STATUS is counted as a question
+            queries = after["Questions"] - counters["Questions"] - 1
+            rows_read = after["Rows_read"] - counters["Rows_read"]
+
+        member = json.dumps([doctype, event, handler])
+        cache = frappe.cache()
+        key = cache.make_key(PROFILE_SAMPLES.format(member))
+        pipeline = cache.pipeline()
+        pipeline.rpush(key, json.dumps([round(wall_ms, 3), queries, rows_read]))
+        pipeline.ltrim(key, -MAX_SAMPLES, -1)
+        pipeline.sadd(cache.make_key(PROFILE_KEYS), member)
+        pipeline.execute()
+    except Exception:
+        # profiling must never fail the document event
+        pass
+
+
+def get_percentiles(values):
+    """Nearest rank percentiles of `values`, None for an empty list"""
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return {p: None for p in PERCENTILES}
+    return {
+        p: values[max(math.ceil(p / 100 * len(values)) - 1, 0)] for p in PERCENTILES
+    }
+
+
+@frappe.whitelist()
+def get_hook_profile():
+    """
+    Percentiles of the profiled csf_tz doc_events handlers, slowest p95 first
+
+    Returns:
+        list: {doctype, event, handler, samples, wall_ms_p50 ... wall_ms_p99,
+            queries_p50 ... queries_p99, rows_read_p50 ... rows_read_p99}
+    """
+    frappe.only_for("System Manager")
+    cache = frappe.cache()
+    profile = []
+    for member in cache.smembers(PROFILE_KEYS):
+        member = frappe.safe_decode(member)
+        samples = [
+            json.loads(sample)
+            for sample in cache.lrange(PROFILE_SAMPLES.format(member), 0, -1)
+        ]
+        if not samples:
+            continue
+
+        doctype, event, handler = json.loads(member)
+        row = frappe._dict(
+            doctype=doctype, event=event, handler=handler, samples=len(samples)
+        )
+        for index, measure in enumerate(("wall_ms", "queries", "rows_read")):
+            for p, value in get_percentiles(
+                sample[index] for sample in samples
+            ).items():
+                row[f"{measure}_p{p}"] = value
+        profile.append(row)
+
+    profile.sort(key=lambda row: row.wall_ms_p95, reverse=True)
+    return profile
+
+
+@frappe.whitelist()
+def clear_hook_profile():
+    """Drop all recorded samples"""
+    frappe.only_for("System Manager")
+    cache = frappe.cache()
+    for member in cache.smembers(PROFILE_KEYS):
+        cache.delete(cache.make_key(PROFILE_SAMPLES.format(frappe.safe_decode(member))))
+    cache.delete(cache.make_key(PROFILE_KEYS))
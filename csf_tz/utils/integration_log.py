@@ -0,0 +1,196 @@
+import json
+import random
+
+import frappe
+from frappe.model.naming import make_autoname
+from frappe.utils import now_datetime
+
+from csf_tz.utils.settings import get_csf_tz_setting
+
+# The buffer lives in the Redis cache, entries not flushed yet are lost if Redis
+# restarts or evicts the key. Failed requests are flushed right away to keep that
+# window short for the entries that matter most.
+BUFFER_KEY = "csf_integration_log_buffer"
+FLUSH_JOB_ID = "csf_tz_flush_integration_logs"
+# enqueue a flush once this many entries are waiting, the scheduler flushes the rest
+FLUSH_THRESHOLD = 200
+FLUSH_BATCH_SIZE = 1000
+# flushes an entry that cannot be inserted is retried in, it is then dropped to the Error Log
+MAX_FLUSH_ATTEMPTS = 3
+
+
+def log_integration_request(
+    source,
+    request_type,
+    request_url=None,
+    request_data=None,
+    response_data=None,
+    status_code=None,
+    reference=None,
+    success=True,
+):
+    """
+    Buffer a request to an external service for the CSF Integration Log
+
+    Failed requests are always kept, successful ones are sampled at the rate set
+    in CSF TZ Settings.
+    """
+    if success and random.random() * 100 >= get_success_sample_rate():
+        return
+
+    buffer_log(
+        "CSF Integration Log",
+        {
+            "source": source,
+            "request_type": request_type,
+            "request_url": request_url,
+            "request_data": to_text(request_data),
+            "response_data": to_text(response_data),
+            "status_code": str(status_code or ""),
+            "reference": reference,
+            "status": "Success" if success else "Failed",
+            "user_id": frappe.session.user,
+        },
+        flush=not success,
+    )
+
+
+def buffer_log(doctype, values, flush=False):
+    """
+    Queue a log document in Redis, it is inserted by `flush_integration_logs`
+
+    With `flush` the flush job is enqueued at once instead of after the commit, so
+    the entry is written even if the current request is rolled back.
+    """
+    values = dict(values, doctype=doctype, timestamp=now_datetime())
+    cache = frappe.cache()
+    cache.rpush(BUFFER_KEY, frappe.as_json(values, indent=None))
+    if flush or cache.llen(BUFFER_KEY) >= FLUSH_THRESHOLD:
+        frappe.enqueue(
+            "csf_tz.utils.integration_log.flush_integration_logs",
+            queue="short",
+            job_id=FLUSH_JOB_ID,
+            deduplicate=True,
+            enqueue_after_commit=not flush,
+        )
+
+
+def flush_integration_logs():
+    """
+    Insert the buffered log documents in bulk, called by the scheduler and when the buffer fills up
+
+    When the bulk insert of a doctype fails its entries are inserted one by one.
+    Entries that still fail are pushed back to the end of the buffer and the flush
+    stops, the next flush retries them. After `MAX_FLUSH_ATTEMPTS` they are dropped
+    and kept in an Error Log instead.
+    """
+    cache = frappe.cache()
+    key = cache.make_key(BUFFER_KEY)
+    while True:
+        pipeline = cache.pipeline()
+        pipeline.lrange(key, 0, FLUSH_BATCH_SIZE - 1)
+        pipeline.ltrim(key, FLUSH_BATCH_SIZE, -1)
+        entries = pipeline.execute()[0]
+        if not entries:
+            break
+
+        rows_by_doctype = {}
+        for entry in entries:
+            row = json.loads(entry)
+            rows_by_doctype.setdefault(row.pop("doctype"), []).append(row)
+
+        failed = []
+        for doctype, rows in rows_by_doctype.items():
+            try:
+                insert_logs(doctype, [get_log_values(row) for row in rows])
+                frappe.db.commit()
+            except Exception:
+                frappe.db.rollback()
+                failed += insert_logs_one_by_one(doctype, rows)
+
+        if failed:
+            retry = [
+                row for row in failed if row["_flush_attempts"] < MAX_FLUSH_ATTEMPTS
+            ]
+            dropped = [
+                row for row in failed if row["_flush_attempts"] >= MAX_FLUSH_ATTEMPTS
+            ]
+            if retry:
+                for row in retry:
+                    row.pop("_flush_error")
+                cache.pipeline().rpush(
+                    key, *(frappe.as_json(row, indent=None) for row in retry)
+                ).execute()
+            if dropped:
+                frappe.log_error(
+                    title=f"Dropped {len(dropped)} integration log entries after "
+                    f"{MAX_FLUSH_ATTEMPTS} failed flushes",
+                    message="\n\n".join(
+                        dict.fromkeys(row.pop("_flush_error") for row in dropped)
+                    )
+                    + "\n\n"
+                    + frappe.as_json(dropped),
+                )
+                frappe.db.commit()
+            break
+
+        if len(entries) < FLUSH_BATCH_SIZE:
+            break
+
+
+def insert_logs_one_by_one(doctype, rows):
+    """Insert `rows` separately after their bulk insert failed, returns the rows that failed again"""
+    failed = []
+    for row in rows:
+        try:
+            insert_logs(doctype, [get_log_values(row)])
+            frappe.db.commit()
+        except Exception:
+            frappe.db.rollback()
+            row.update(
+                doctype=doctype,
+                _flush_attempts=row.get("_flush_attempts", 0) + 1,
+                _flush_error=frappe.get_traceback(),
+            )
+            failed.append(row)
+    return failed
+
+
+def get_log_values(row):
+    """Field values of a buffered entry, without the flush bookkeeping"""
+    return {
+        field: value
+        for field, value in row.items()
+        if field not in ("_flush_attempts", "_flush_error")
+    }
+
+
+def insert_logs(doctype, rows):
+    fields = sorted({field for row in rows for field in row} - {"owner"})
+    values = []
+    for row in rows:
+        timestamp = row.get("timestamp")
+        owner = row.get("user_id") or "Administrator"
+        values.append(
+            [make_autoname(row.get("naming_series") or "hash", doctype)]
+            + [row.get(field) for field in fields]
+            + [timestamp, timestamp, owner, owner, 0]
+        )
+
+    frappe.db.bulk_insert(
+        doctype,
+        ["name"]
+        + fields
+        + ["creation", "modified", "owner", "modified_by", "docstatus"],
+        values,
+    )
+
+
+def get_success_sample_rate():
+    return get_csf_tz_setting("integration_log_success_sample_rate")
+
+
+def to_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    return frappe.as_json(value)
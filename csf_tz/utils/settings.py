@@ -0,0 +1,38 @@
+import frappe
+from frappe.utils import cint, flt
+
+SETTINGS_DOCTYPE = "CSF TZ Settings"
+INT_FIELDTYPES = ("Check", "Int")
+FLOAT_FIELDTYPES = ("Float", "Currency", "Percent")
+
+
+def get_csf_tz_settings():
+    """
+    CSF TZ Settings of the current request or job
+
+    Read with `frappe.get_cached_doc`: the document comes from the site cache and is
+    kept for the rest of the request or job, saving the settings clears the cache.
+    The document is shared, do not change it.
+    """
+    return frappe.get_cached_doc(SETTINGS_DOCTYPE)
+
+
+def get_csf_tz_setting(fieldname):
+    """A CSF TZ Settings value, see `get_single_setting`"""
+    return get_single_setting(SETTINGS_DOCTYPE, fieldname)
+
+
+def get_single_setting(doctype, fieldname):
+    """
+    A value of the single `doctype` from its cached document
+
+    Check and Int values are returned as int, Float, Currency and Percent values
+    as float, so unset values compare as 0.
+    """
+    value = frappe.get_cached_doc(doctype).get(fieldname)
+    df = frappe.get_meta(doctype).get_field(fieldname)
+    if df and df.fieldtype in INT_FIELDTYPES:
+        return cint(value)
+    if df and df.fieldtype in FLOAT_FIELDTYPES:
+        return flt(value)
+    return value
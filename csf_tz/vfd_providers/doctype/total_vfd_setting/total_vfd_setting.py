@@ -7,6 +7,7 @@ from time import sleep
 import frappe, json, requests
 from frappe import _
 from frappe.utils import nowdate, nowtime, format_datetime, flt
+from csf_tz.utils.integration_log import log_integration_request
 from csf_tz.vfd_providers.utils import get_vat_amount
 
 
@@ -257,9 +258,12 @@ def send_total_vfd_request(
             )
             if res.ok or res.status_code == 409:
                 data = json.loads(res.text) if res.ok else json.loads(res.text)["data"]
-                frappe.log_error(
-                    title="Send Request OK",
-                    message=f"Send Request: {url} - Status Code: {res.status_code}\n{res.text}",
+                log_integration_request(
+                    "TotalVFD",
+                    call_type,
+                    request_url=url,
+                    response_data=res.text,
+                    status_code=res.status_code,
                 )
             else:
                 data = []
@@ -7,6 +7,7 @@ from time import sleep
 import frappe, json, requests
 from frappe import _
 from frappe.utils import nowdate, nowtime, format_datetime, flt
+from csf_tz.utils.integration_log import log_integration_request
 from csf_tz.vfd_providers.utils import get_vat_amount
 
 
@@ -104,9 +105,12 @@ def send_vfdplus_request(
                         _(f"Error returned from VFDPlus: {data.get('msg_code')}")
                     )
                 else:
-                    frappe.log_error(
-                        title="Send Request OK",
-                        message=f"Send Request: {url} - Status Code: {res.status_code}\n{res.text}",
+                    log_integration_request(
+                        "VFDPlus",
+                        call_type,
+                        request_url=url,
+                        response_data=res.text,
+                        status_code=res.status_code,
                     )
             else:
                 data = []